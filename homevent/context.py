@@ -22,23 +22,55 @@
 	See test/context.py for usage examples.
 	"""
 
-import sys,inspect
+import sys,os,inspect
+from homevent import TESTING
 
 class VanishedAttribute: pass
+class _NotFound: pass
+
+# Recording where a context has been created is expensive, so it's
+# only done when debugging.
+debugged = TESTING or ("HOMEVENT_DEBUG_CONTEXT" in os.environ)
+
+def debug_context(doit = None):
+	"""Get/set whether new contexts remember where they were created"""
+	global debugged
+	res = debugged
+	if doit is not None:
+		debugged = doit
+	return res
+
+# Bumped whenever any context's store changes. A lookup cache is only
+# valid while this stays the same, which is a single O(1) comparison
+# no matter how deep the context chain is.
+_generation = 0
+
+def _changed():
+	global _generation
+	_generation += 1
 
 class Context(object):
 	"""A stackable context type of thing."""
+	__slots__ = ("_parent","_store","_created","_cache","_cache_gen","_nparents")
+
 	def __init__(self,parent=None,**k):
 		if parent is not None:
 			self._parent = [parent]
+			self._nparents = parent._nparents+1
 		else:
 			self._parent = []
+			self._nparents = 0
 		self._store = {}
 		self._store.update(**k)
-		f = inspect.currentframe(1)
-		if f.f_code.co_name == "__call__":
-			f = inspect.currentframe(2)
-		self._created = (f.f_code.co_name ,f.f_code.co_filename ,f.f_lineno )
+		self._cache = {}
+		self._cache_gen = None
+		if debugged:
+			f = inspect.currentframe(1)
+			if f.f_code.co_name == "__call__":
+				f = inspect.currentframe(2)
+			self._created = (f.f_code.co_name ,f.f_code.co_filename ,f.f_lineno )
+		else:
+			self._created = None
 
 	def __call__(self,ctx=None,**k):
 		"""Create a clone with an additional parent context"""
@@ -50,7 +82,9 @@ class Context(object):
 			c = Context(self,**k)
 			if ctx not in c._parents():
 				c._parent.append(ctx)
-		if len(list(self._parents())) > 100:
+				c._nparents += ctx._nparents+1
+				_changed()
+		if self._nparents > 100:
 			raise RuntimeError("Too many nested contexts")
 		return c
 
@@ -65,33 +99,49 @@ class Context(object):
 			for pp in p._parents():
 				yield pp
 		
-	def __getattribute__(self,key):
+	def _lookup(self,key):
+		"""\
+			Find a key in this context or its parents.
+			Returns _NotFound if it's not there, VanishedAttribute if
+			it has been deleted.
+			"""
+		r = self._store.get(key,_NotFound)
+		if r is not _NotFound or not self._parent:
+			return r
+
+		cache = self._cache
+		if self._cache_gen != _generation:
+			cache.clear()
+			self._cache_gen = _generation
+		elif key in cache:
+			return cache[key]
+
+		r = _NotFound
+		for p in self._parent:
+			r = p._lookup(key)
+			if r is not _NotFound:
+				break
+		cache[key] = r
+		return r
+
+	def __getattr__(self,key):
 		if key.startswith("_"):
-			return super(Context,self).__getattribute__(key)
-		store = self._store
-		if key in store:
-			r = store[key]
-		else:
-			r = VanishedAttribute
-			for p in self._parents():
-				try:
-					r = p._store[key]
-				except KeyError:
-					pass
-				else:
-					break
-		if r is VanishedAttribute:
+			raise AttributeError(self,key)
+		r = self._lookup(key)
+		if r is _NotFound or r is VanishedAttribute:
 			raise AttributeError(self,key)
 		return r
 
 	def __setattr__(self,key,val):
 		if key.startswith("_"):
 			return super(Context,self).__setattr__(key,val)
+		_changed()
 		self._store[key] = val
 
 	def __delattr__(self,key):
 		if key.startswith("_"):
 			return super(Context,self).__delattr__(key)
+		_changed()
 		self._store[key] = VanishedAttribute
 
 	def __contains__(self,key):
@@ -134,7 +184,10 @@ class Context(object):
 			p._dump_tree(pre+"  ")
 	def _report(self):
 		f = self._created
-		yield "@%x %s %s:%d" % (id(self),f[0],f[1],f[2])
+		if f is None:
+			yield "@%x" % (id(self),)
+		else:
+			yield "@%x %s %s:%d" % (id(self),f[0],f[1],f[2])
 		for a,b in self._store.iteritems():
 			yield "%s: %s" % (unicode(a),repr(b))
 		for p in self._parent:
@@ -17,23 +17,75 @@
 
 """\
 This is the core of database access.
+
+A DbStore reads its whole category when it is created and answers
+get() from memory. Changes are collected and written in one transaction
+a few seconds later, when the store is closed, or on shutdown.
+
+Values are stored as JSON. Tuples, Names and dicts are tagged so that
+they come back as what they were. Values written by older versions
+(as repr()) can still be read.
 """
 
 from homevent import TESTING
-from homevent.base import Name
+from homevent.base import Name,SYS_PRIO
 from homevent.logging import log,TRACE
-from sqlmix import Db,NoData,ManyData
+from homevent.reactor import shutdown_event
+from homevent.run import register_worker
+from homevent.twist import callLater,fix_exception,print_exception
+from homevent.worker import ExcWorker
+from sqlmix import Db
+
+from ast import literal_eval
+import json
+
+stores = set() # open DbStores
+
+class _Deleted: pass # marks a queued delete
+
+def _pack(val):
+	"""Convert a value to something that survives a trip through JSON."""
+	if isinstance(val,Name):
+		return {"Name":[_pack(v) for v in val]}
+	if isinstance(val,tuple):
+		return {"()":[_pack(v) for v in val]}
+	if isinstance(val,list):
+		return [_pack(v) for v in val]
+	if isinstance(val,dict):
+		return {"{}":[[_pack(k),_pack(v)] for k,v in val.iteritems()]}
+	return val
+
+def _unpack_tag(d):
+	if len(d) == 1:
+		k,v = d.items()[0]
+		if k == "()":
+			return tuple(v)
+		if k == "Name":
+			return Name(*v)
+		if k == "{}":
+			return dict(v)
+	raise ValueError("unknown JSON object",d)
+
+def encode(val):
+	return json.dumps(_pack(val), separators=(',',':'))
 
-SafeNames = {
-	"Name":Name,
-}
+def decode(data):
+	try:
+		return json.loads(data, object_hook=_unpack_tag)
+	except ValueError:
+		pass
+	# Old repr() format
+	if data.startswith("Name("):
+		return Name(*literal_eval(data[4:]))
+	return literal_eval(data)
 
 
 #Db = DeferredStore(self.database)
 
 class DbStore(object):
-	"""This object implements a simple Deferred-enabled storage"""
+	"""This object implements a simple cached storage"""
 	running = False
+	flush_delay = 5 # seconds to collect changes for
 
 	def __init__(self,category,name=None):
 		if name is None:
@@ -68,44 +120,111 @@ class DbStore(object):
 			except Exception:
 				pass
 		
+		self._cache = {}
+		self._dirty = {}
+		self._timer = None
+		with self.db() as db:
+			for key,val in db.DoSelect("select name,value from HE_State where category=${cat}", cat=self.category, _empty=1):
+				if isinstance(key,unicode):
+					key = key.encode("utf-8")
+				self._cache[key] = decode(val)
+
 		self.running = True
+		stores.add(self)
 	
 	def close(self):
+		stores.discard(self)
+		self.flush()
 		self.db.close()
 		self.db = None
 
+	def _key(self, key):
+		return " ".join(Name(key)).encode("utf-8")
+
+	def _changed(self, key, data):
+		"""Queue a change; @data is the encoded value, or _Deleted"""
+		self._dirty[key] = data
+		if self._timer is None:
+			self._timer = callLater(True,self.flush_delay, self.flush)
+
+	def flush(self):
+		"""Write all changes, in one transaction."""
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
+		if not self._dirty:
+			return
+		dirty,self._dirty = self._dirty,{}
+		try:
+			with self.db() as db:
+				for key,val in dirty.iteritems():
+					if val is _Deleted:
+						db.Do("delete from HE_State where category=${cat} and name=${name}", cat=self.category,name=key, _empty=1)
+						continue
+					r = db.Do("update HE_State set value=${val} where category=${cat} and name=${name}", cat=self.category,name=key,val=val, _empty=1)
+					if r == 0:
+						db.Do("insert into HE_State (category,name,value) VALUES(${cat},${name},${val})", cat=self.category,name=key,val=val)
+		except Exception:
+			# Try again later, unless there's a newer change
+			for key,val in dirty.iteritems():
+				self._dirty.setdefault(key,val)
+			if self._timer is None and self.db is not None:
+				self._timer = callLater(True,self.flush_delay, self.flush)
+			raise
+
 	def get(self, key):
-		key = " ".join(Name(key)).encode("utf-8")
-		with self.db() as db:
-			try:
-				r, = db.DoFn("select value from HE_State where category=${cat} and name=${name}", cat=self.category, name=key)
-			except NoData:
-				raise KeyError((self.category,key))
-			else:
-				r = eval(r,SafeNames,{})
-		return r
+		key = self._key(key)
+		try:
+			return self._cache[key]
+		except KeyError:
+			raise KeyError((self.category,key))
 
 	def all(self, callback):
-		with self.db() as db:
-			return db.DoSelect("select name,value from HE_State where category=${cat}", cat=self.category, callback=callback)
+		n = 0
+		for key,val in self._cache.items():
+			callback(key,val)
+			n += 1
+		return n
 
 	def delete(self, key):
-		key = " ".join(Name(key)).encode("utf-8")
-		with self.db() as db:
-			try:
-				db.Do("delete from HE_State where category=${cat} and name=${name}", cat=self.category,name=key)
-			except NoData:
-				raise KeyError((self.category,key))
+		key = self._key(key)
+		try:
+			del self._cache[key]
+		except KeyError:
+			raise KeyError((self.category,key))
+		self._changed(key,_Deleted)
 
 	def clear(self):
+		self._cache = {}
+		self._dirty = {}
 		with self.db() as db:
 			return db.Do("delete from HE_State where category=${cat}", cat=self.category, _empty=1)
 
 	def set(self, key, val):
-		key = " ".join(Name(key)).encode("utf-8")
-		with self.db() as db:
-			r = db.Do("update HE_State set value=${val} where category=${cat} and name=${name}", cat=self.category,name=key,val=repr(val), _empty=1)
-			if r == 0:
-				db.Do("insert into HE_State (category,name,value) VALUES(${cat},${name},${val})", cat=self.category,name=key,val=repr(val))
+		data = encode(val) # fails early if it can't be stored
+		key = self._key(key)
+		self._cache[key] = val
+		self._changed(key,data)
 
-	
+
+class Shutdown_DbStores(ExcWorker):
+	"""\
+		This worker writes pending changes to the database.
+		"""
+	prio = SYS_PRIO+3
+
+	def does_event(self,ev):
+		return (ev is shutdown_event)
+	def process(self, **k):
+		super(Shutdown_DbStores,self).process(**k)
+		for s in list(stores):
+			try:
+				s.flush()
+			except Exception as ex:
+				fix_exception(ex)
+				print_exception(ex)
+
+	def report(self,*a,**k):
+		return ()
+
+register_worker(Shutdown_DbStores("flush databases"))
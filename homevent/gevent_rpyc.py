@@ -0,0 +1,2 @@
+def patch_all():
+	pass
@@ -34,9 +34,10 @@ from homevent.twist import fix_exception,print_exception,format_exception,Jobber
 from homevent.collect import Collection,Collected
 
 import gevent
-from gevent.queue import JoinableQueue,Full
+from gevent.event import Event as GEvent, AsyncResult
 from gevent.select import select
 
+from collections import deque
 import sys
 import os
 
@@ -81,22 +82,59 @@ def log_level(cls, level=None):
 		levels[cls] = level
 	return ret
 
+def wants_events(level=TRACE):
+	"""Check whether any logger would report an event at this level."""
+	if levels.get("event",TRACE) > level:
+		return False
+	for l in Loggers.values():
+		if l.ready and level >= l.level:
+			return True
+	return False
+
 logger_nr = 0
 
-class FlushMe(object):
-	"""Marker to flush a logger's file"""
+class LogReport(object):
+	"""\
+		A queued event. Its report is generated by the writer,
+		not by the code which processes the event.
+		"""
+	__slots__ = ("event",)
+	def __init__(self,event):
+		self.event = event
+
+class FlushMe(AsyncResult):
+	"""Marker to flush a logger's file. Triggered when that is done."""
 	pass
 
 class BaseLogger(Collected,Jobber):
 	"""\
 		This class implements one particular way to log things.
+
+		Lines are buffered in a ring of @queue_len entries; if the writer
+		can't keep up, the oldest lines are dropped and counted.
+		The writer processes up to @batch_len lines at a time.
+		Both can be set per logger.
+
+		Flush and stop requests are queued separately, tagged with the
+		number of lines that have to be written (or dropped) before them.
 		"""
 	storage = Loggers.storage
 	q = None
 	ready = False
 	_in_flush = False
-	def __init__(self, level):
+	queue_len = 1000
+	batch_len = 100
+	n_dropped = 0
+	_n_reported = 0 # dropped lines we already complained about
+	_n_in = 0 # lines queued
+	_n_out = 0 # lines written or dropped
+
+	def __init__(self, level, queue_len=None, batch_len=None):
 		self.level = level
+		if queue_len is not None:
+			self.queue_len = queue_len
+		if batch_len is not None:
+			self.batch_len = batch_len
 
 		global logger_nr
 		logger_nr += 1
@@ -111,7 +149,9 @@ class BaseLogger(Collected,Jobber):
 		"""Fork off the writer thread.
 		   Override this to do nothing if you don't have one."""
 
-		self.q = JoinableQueue(100)
+		self.q = deque()
+		self.ctl = deque()
+		self._wake = GEvent()
 		self.start_job("job",self._writer)
 		self.job.link(self.delete)
 		if self.ready is False:
@@ -121,32 +161,69 @@ class BaseLogger(Collected,Jobber):
 
 	def _writer(self):
 		errs = 0
-		for r in self.q:
+		while True:
+			if not self.q and not self.ctl:
+				self._wake.clear()
+				self._wake.wait()
+				continue
+
+			self._start_batch()
 			try:
-				if r is FlushMe:
-					self._flush()
-				else:
-					self._log(*r)
-			except Exception as ex:
-				errs += 1
-				fix_exception(ex)
-				from homevent.run import process_failure
-				process_failure(ex)
-				if errs > 10:
-					reraise(ex)
-			else:
-				if errs:
-					errs -= 1
+				if self.n_dropped > self._n_reported:
+					self._log(WARN,"logger","%d lines dropped" % (self.n_dropped-self._n_reported,))
+					self._n_reported = self.n_dropped
+				n = 0
+				while n < self.batch_len:
+					if self.ctl and self.ctl[0][0] <= self._n_out:
+						r = self.ctl.popleft()[1]
+						if r is StopIteration:
+							return
+						self._end_batch()
+						self._flush()
+						r.set(None)
+						self._start_batch()
+						continue
+					if not self.q:
+						break
+					r = self.q.popleft()
+					self._n_out += 1
+					n += 1
+					try:
+						if len(r) == 2 and isinstance(r[1],LogReport):
+							for l in report_(r[1].event,99):
+								self._log(r[0],l)
+						else:
+							self._log(*r)
+					except Exception as ex:
+						errs += 1
+						fix_exception(ex)
+						from homevent.run import process_failure
+						process_failure(ex)
+						if errs > 10:
+							reraise(ex)
+					else:
+						if errs:
+							errs -= 1
 			finally:
-				self.q.task_done()
-		self.q.task_done() # for the StopIter
+				self._end_batch()
+
+	def _start_batch(self):
+		"""The writer is about to process a number of lines."""
+		pass
+
+	def _end_batch(self):
+		"""The writer has processed a number of lines."""
+		pass
 
 	# Collection stuff
 	def list(self):
 		yield ("Name",self.name)
 		yield ("Type",self.__class__.__name__)
 		yield ("Level",LogNames[self.level])
-		yield ("Queue",self.q.qsize())
+		if self.q is not None:
+			yield ("Queue",len(self.q))
+			yield ("Queue max",self.queue_len)
+		yield ("Dropped",self.n_dropped)
 
 	def info(self):
 		return LogNames[self.level]+": "+self.__class__.__name__
@@ -155,20 +232,26 @@ class BaseLogger(Collected,Jobber):
 		if self.ready:
 			self.ready = None
 			super(BaseLogger,self).delete(ctx)
-		try:
-			self.q.put(StopIteration,block=False)
-		except Full:
-			## panic?
-			pass
-		self.job.join(timeout=1)
+		if self.q is not None:
+			self._mark(StopIteration)
+		if self.job:
+			self.job.join(timeout=1)
 		self.stop_job("job")
 
 	def _wlog(self, *a):
-		try:
-			self.q.put(a, block=False)
-		except Full:
-			## panic?
-			self.delete()
+		q = self.q
+		while q and len(q) >= self.queue_len:
+			q.popleft()
+			self.n_dropped += 1
+			self._n_out += 1
+		q.append(a)
+		self._n_in += 1
+		self._wake.set()
+
+	def _mark(self, r):
+		"""Queue a flush or stop request behind the lines queued so far."""
+		self.ctl.append((self._n_in,r))
+		self._wake.set()
 
 	def _log(self, level, *a):
 		a=" ".join(( x if isinstance(x,basestring) else str(x)  for x in a))
@@ -185,13 +268,10 @@ class BaseLogger(Collected,Jobber):
 			self._wlog(level,*a)
 			if TESTING and not (hasattr(a[0],"startswith") and a[0].startswith("TEST")):
 				self.flush()
-			else:
-				gevent.sleep(0)
 
 	def log_event(self, event, level):
 		if level >= self.level:
-			for r in report_(event,99):
-				self._wlog(level,r)
+			self._wlog(level,LogReport(event))
 			if TESTING:
 				self.flush()
 
@@ -203,11 +283,12 @@ class BaseLogger(Collected,Jobber):
 	
 	def flush(self):
 		if self._in_flush: return
-		if self.q is not None:
+		if self.q is not None and self.job:
 			try:
 				self._in_flush = True
-				self.q.put(FlushMe)
-				self.q.join()
+				r = FlushMe()
+				self._mark(r)
+				r.get()
 			finally:
 				self._in_flush = False
 
@@ -215,18 +296,44 @@ class BaseLogger(Collected,Jobber):
 		self.flush()
 		self.delete()
 
+class _LineBuffer(object):
+	"""Collects what a Logger prints while processing a batch."""
+	softspace = 0
+	def __init__(self):
+		self.data = []
+	def write(self,s):
+		if isinstance(s,unicode):
+			s = s.encode("utf-8")
+		self.data.append(s)
+	def getvalue(self):
+		return "".join(self.data)
+
 class Logger(BaseLogger):
 	"""\
 		This class logs to a file.
+
+		A batch of lines is collected and written with a single call.
 		"""
-	def __init__(self, level, out=sys.stdout):
-		super(Logger,self).__init__(level)
+	_out = None # the real file while processing a batch
+
+	def __init__(self, level, out=sys.stdout, **k):
+		super(Logger,self).__init__(level, **k)
 		self.out = out
 
-	def _log(self, level, *data):
-		if hasattr(self.out,'fileno'):
-			select((),(self.out,))
-		super(Logger,self)._log(level,*data)
+	def _start_batch(self):
+		if self._out is None:
+			self._out,self.out = self.out,_LineBuffer()
+
+	def _end_batch(self):
+		if self._out is None:
+			return
+		out,self._out = self._out,None
+		buf,self.out = self.out,out
+		data = buf.getvalue()
+		if data:
+			if hasattr(out,'fileno'):
+				select((),(out,))
+			out.write(data)
 
 	def _slog(self,level,data):
 		print >>self.out,LogNames[level]+">",data
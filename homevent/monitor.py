@@ -42,6 +42,7 @@ from gevent.queue import Channel,Queue
 import gevent
 
 from time import time
+from collections import deque
 import os,sys
 import datetime as dt
 
@@ -72,6 +73,121 @@ class DupWatcherError(MonitorError):
 class NoWatcherError(MonitorError):
 	text = u"Not waiting for ‹%s›"
 
+class Samples(object):
+	"""\
+		The measurements of one monitor run.
+
+		If ‹window› is set, only that many of the most recent values are
+		kept. Sum, minimum and maximum are updated as values are added
+		(the latter two via monotonic queues), so looking at them doesn't
+		scan the data.
+		"""
+	resum = 1000 # re-add everything after that many discarded values
+
+	def __init__(self, window=None):
+		self.values = deque(maxlen=window)
+		self.window = window
+		self.sum = 0
+		self.n = 0 # sequence number of the next value
+		self.n_drop = 0
+		self._min = deque() # (seq,val), ascending values
+		self._max = deque() # (seq,val), descending values
+
+	def append(self,val):
+		if self.window is not None and len(self.values) == self.window:
+			self.sum -= self.values[0]
+			self.n_drop += 1
+			old = self.n-self.window
+			if self._min[0][0] == old:
+				self._min.popleft()
+			if self._max[0][0] == old:
+				self._max.popleft()
+		self.values.append(val)
+		if self.n_drop >= self.resum:
+			self.sum = sum(self.values)
+			self.n_drop = 0
+		else:
+			self.sum += val
+
+		q = self._min
+		while q and q[-1][1] >= val:
+			q.pop()
+		q.append((self.n,val))
+		q = self._max
+		while q and q[-1][1] <= val:
+			q.pop()
+		q.append((self.n,val))
+		self.n += 1
+
+	def min(self):
+		return self._min[0][1]
+	def max(self):
+		return self._max[0][1]
+	def avg(self):
+		return self.sum/len(self.values)
+
+	def __len__(self):
+		return len(self.values)
+	def __iter__(self):
+		return iter(self.values)
+	def __repr__(self):
+		return repr(list(self.values))
+
+
+def _median(sorted_data):
+	n = len(sorted_data)
+	if n % 2:
+		return sorted_data[n//2]
+	return (sorted_data[n//2-1]+sorted_data[n//2])/2
+
+def trim_outliers(data, points, range):
+	"""\
+		Repeatedly discard the value farthest from the average until the
+		rest is within ‹range›; return their average, or None if that'd
+		leave fewer than ‹points› values.
+
+		The farthest value is always the smallest or the largest one, so
+		this sorts the data once and then works from both ends. Ties go
+		to whichever value was measured first.
+		"""
+	vals = list(data)
+	n = len(vals)
+	order = sorted(xrange(n), key=vals.__getitem__) # stable
+	run = [0]*n # start of the run of equal values
+	for k in xrange(1,n):
+		run[k] = run[k-1] if vals[order[k]] == vals[order[k-1]] else k
+	dropped = bytearray(n)
+
+	lo = 0 # next to go from the bottom
+	end = n # one beyond the largest value
+	hi = run[n-1] # next to go from the top (earliest of the largest)
+	total = sum(vals)
+	left = n
+	while True:
+		vlo = vals[order[lo]]
+		vhi = vals[order[end-1]]
+		if vhi-vlo <= range:
+			return sum(v for v,d in zip(vals,dropped) if not d)/left
+		if left == points:
+			return None
+
+		avg = total/left
+		dlo = abs(avg-vlo)
+		dhi = abs(avg-vhi)
+		if dlo > dhi or (dlo == dhi and order[lo] < order[hi]):
+			k = order[lo]
+			lo += 1
+		else:
+			k = order[hi]
+			hi += 1
+			if hi == end:
+				end = run[end-1]
+				hi = run[end-1]
+		dropped[k] = 1
+		total -= vals[k]
+		left -= 1
+
+
 class Monitor(Collected,Jobber):
 	"""This is the thing that watches."""
 	storage = Monitors.storage
@@ -100,6 +216,8 @@ class Monitor(Collected,Jobber):
 	points = 1 # required for good value
 	maxpoints = None  # max # steps
 	range = None # allowed range of data within a measurement
+	window = None # only look at that many recent values
+	reject = None # discard values further than this*MAD from the median
 	diff = None # required difference for a "value" event
 
 	value = None # last correct measurement
@@ -153,6 +271,10 @@ class Monitor(Collected,Jobber):
 				yield ("state change",self.state_change_at)
 
 		yield ("steps", "%s / %s / %s" % (self.steps,self.points,self.maxpoints))
+		if self.window is not None:
+			yield ("window",self.window)
+		if self.reject is not None:
+			yield ("reject",self.reject)
 		if self.data:
 			yield ("data"," ".join(unicode(x) for x in self.data))
 
@@ -211,40 +333,36 @@ class Monitor(Collected,Jobber):
 		"""Discard outlier values and calculate average"""
 		log("monitor",TRACE,"filter",self.data,"on", self.name)
 
-		if len(self.data) < self.points:
+		data = self.data
+		if len(data) < self.points:
 			return None
-		avg = sum(self.data)/len(self.data)
+		if self.reject is not None:
+			return self._filter_median()
+		avg = data.avg()
 		if not self.range:
 			return avg
+		if data.max()-data.min() <= self.range:
+			return avg
+		if len(data) == self.points:
+			return None
+		return trim_outliers(data, self.points, self.range)
 
-		data = self.data
-		while True:
-			lo = min(data)
-			hi = max(data)
-			if hi-lo <= self.range:
-				return avg
-
-			if len(data) == self.points:
-				break
-
-			new_data = []
-			extr = None # stored outlier
-			nsum = 0 # new sum
-			dif = None # difference for extr
-			for val in data:
-				ndif = abs(avg-val)
-				if dif is None or dif < ndif:
-					dif = ndif
-					if extr is not None:
-						nsum += extr
-						new_data.append(extr)
-					extr = val
-				else:
-					nsum += val
-					new_data.append(val)
-			data = new_data
-			avg = nsum/len(data)
-		return None
+	def _filter_median(self):
+		"""\
+			Discard values which are more than ‹reject› median absolute
+			deviations away from the median, and average the rest.
+			"""
+		vals = sorted(self.data)
+		med = _median(vals)
+		mad = _median(sorted(abs(v-med) for v in vals))
+		lim = mad*self.reject
+
+		good = [v for v in self.data if abs(v-med) <= lim]
+		if len(good) < self.points:
+			return None
+		if self.range and max(good)-min(good) > self.range:
+			return None
+		return sum(good)/len(good)
 
 	def _do_measure(self):
 		log("monitor",TRACE,"Start run",self.name)
@@ -281,7 +399,7 @@ class Monitor(Collected,Jobber):
 	def _monitor(self):
 		"""This implements a monitor sequence."""
 		self.steps = 0
-		self.data = []
+		self.data = Samples(self.window)
 		self.new_value = None
 
 		def delay():
@@ -408,6 +526,10 @@ monitor passive
 		self.values = {}
 
 	def run(self,ctx,**k):
+		window = self.values.get("window",self.monitor.window)
+		points = self.values.get("points",self.monitor.points)
+		if window is not None and points is not None and window < points:
+			raise SyntaxError(u'window: ‹num› must not be smaller than the number of required values')
 		m = self.monitor(self, self.displayname)
 		for p,v in self.values.iteritems():
 			setattr(m,p,v)
@@ -506,6 +628,57 @@ require ‹num› ‹range›
 MonitorHandler.register_statement(MonitorRequire)
 
 
+class MonitorWindow(Statement):
+	name = "window"
+	doc = "Number of measurements to consider"
+	long_doc=u"""\
+window ‹num›
+	Only look at the last ‹num› measurements when checking whether
+	the ‹require› condition is met.
+"""
+	def run(self,ctx,**k):
+		event = self.params(ctx)
+		if len(event) != 1:
+			raise SyntaxError(u'Usage: window ‹num›')
+		if event[0] == "*":
+			self.parent.values["window"] = None
+		else:
+			try:
+				val = int(event[0])
+				if val <= 0:
+					raise ValueError
+				self.parent.values["window"] = val
+			except (ValueError,TypeError):
+				raise SyntaxError(u'Usage: window: ‹num› needs to be a positive integer')
+MonitorHandler.register_statement(MonitorWindow)
+
+
+class MonitorReject(Statement):
+	name = "reject"
+	doc = "Outlier rejection based on the median"
+	long_doc=u"""\
+reject ‹factor›
+	Discard measurements which are further from the median than ‹factor›
+	times the median absolute deviation, instead of repeatedly dropping
+	the most extreme value.
+"""
+	def run(self,ctx,**k):
+		event = self.params(ctx)
+		if len(event) != 1:
+			raise SyntaxError(u'Usage: reject ‹factor›')
+		if event[0] == "*":
+			self.parent.values["reject"] = None
+		else:
+			try:
+				val = float(event[0])
+				if val <= 0:
+					raise ValueError
+				self.parent.values["reject"] = val
+			except (ValueError,TypeError):
+				raise SyntaxError(u'Usage: reject: ‹factor› needs to be a positive number')
+MonitorHandler.register_statement(MonitorReject)
+
+
 class MonitorRetry(Statement):
 	name = "retry"
 	doc = "Number of valid measurements"
@@ -128,6 +128,11 @@ class MsgSender(MsgInfo):
 class MsgReceiver(MsgInfo):
 	"""A receiver, possibly for a broadcast message"""
 
+	# If this is not None, the receiver promises to only accept incoming
+	# messages for which the queue's msg_key() returns the same value,
+	# so it will not be offered any others.
+	recv_key = None
+
 	def recv(self,data):
 		"""A message has been received. Return NOT_MINE|MINE|RECV_AGAIN."""
 		raise NotImplementedError("You need to override MsgReceiver.recv")
@@ -435,11 +440,10 @@ class MsgQueue(Collected,Jobber):
 		self.factory = factory
 		self.senders = [] # to send
 		self.delayed = []
-		self.receivers = []
 		self.connect_timeout = self.initial_connect_timeout
 		for _ in range(N_PRIO):
 			self.senders.append([])
-			self.receivers.append([])
+		self._reset_receivers()
 		self.q = PrioMsgQueue(maxsize=qlen)
 
 		if ondemand is not None:
@@ -524,6 +528,155 @@ class MsgQueue(Collected,Jobber):
 			i += 1
 
 
+	### Receiver bookkeeping.
+	# self.receivers holds every waiting receiver, by priority.
+	# Receivers which declare a recv_key are also indexed by that key;
+	# all others are in self._recv_unkeyed, so that messages with a
+	# key never have to be offered to receivers waiting for other keys.
+	# Each receiver gets a sequence number which mirrors its position in
+	# self.receivers, so that both sets can be merged back in order.
+
+	def _reset_receivers(self):
+		"""Forget all receivers. Returns the old per-priority lists."""
+		recvs = getattr(self,"receivers",[])
+		self.receivers = []
+		self._recv_unkeyed = []
+		for _ in range(N_PRIO):
+			self.receivers.append([])
+			self._recv_unkeyed.append([])
+		self._recv_keyed = {} # key => list of receivers
+		self._recv_where = {} # receiver => (prio,key,seq)
+		self._recv_seq = 0
+		self._recv_blocking = []
+		self.n_open = 0
+		return recvs
+
+	def _add_receiver(self,m):
+		prio = m.prio
+		key = m.recv_key
+		self._recv_seq += 1
+		if m.blocking:
+			seq = -self._recv_seq
+			self.receivers[prio].insert(0,m)
+			self._recv_blocking.append(m)
+		else:
+			seq = self._recv_seq
+			self.receivers[prio].append(m)
+		if key is None:
+			if m.blocking:
+				self._recv_unkeyed[prio].insert(0,m)
+			else:
+				self._recv_unkeyed[prio].append(m)
+		else:
+			try:
+				self._recv_keyed[key].append(m)
+			except KeyError:
+				self._recv_keyed[key] = [m]
+		self._recv_where[m] = (prio,key,seq)
+		if isinstance(m,MsgBase):
+			self.n_open += 1
+
+	def _del_receiver(self,m):
+		try:
+			prio,key,seq = self._recv_where.pop(m)
+		except KeyError:
+			return False
+		self.receivers[prio].remove(m)
+		if key is None:
+			self._recv_unkeyed[prio].remove(m)
+		else:
+			mq = self._recv_keyed[key]
+			mq.remove(m)
+			if not mq:
+				del self._recv_keyed[key]
+		if isinstance(m,MsgBase):
+			self.n_open -= 1
+		return True
+
+	def _rekey_receiver(self,m):
+		"""Update the index if a receiver's key has changed."""
+		try:
+			prio,key,seq = self._recv_where[m]
+		except KeyError:
+			return
+		nkey = m.recv_key
+		if key == nkey:
+			return
+		if key is None:
+			self._recv_unkeyed[prio].remove(m)
+		else:
+			mq = self._recv_keyed[key]
+			mq.remove(m)
+			if not mq:
+				del self._recv_keyed[key]
+		if nkey is None:
+			mq = self._recv_unkeyed[prio]
+			i = len(mq)
+			while i and self._recv_where[mq[i-1]][2] > seq:
+				i -= 1
+			mq.insert(i,m)
+		else:
+			try:
+				self._recv_keyed[nkey].append(m)
+			except KeyError:
+				self._recv_keyed[nkey] = [m]
+		self._recv_where[m] = (prio,nkey,seq)
+
+	def all_receivers(self):
+		"""Iterate over a snapshot of all waiting receivers."""
+		for mq in self.receivers:
+			for m in mq[:]:
+				yield m
+
+	def msg_key(self,msg):
+		"""\
+			Return the correlation key of an incoming message,
+			or None if it needs to be offered to every receiver.
+			Override this if your protocol tags its messages.
+			"""
+		return None
+
+	def _recv_candidates(self,msg):
+		"""The receivers which might be interested in this message, in order."""
+		key = self.msg_key(msg)
+		if key is None:
+			if not self._recv_keyed:
+				return self.all_receivers()
+			res = []
+			for mq in self._recv_unkeyed:
+				res.extend(mq)
+			return res
+
+		where = self._recv_where
+		keyed = sorted(self._recv_keyed.get(key,()), key=lambda m: where[m][2])
+		res = []
+		for prio,mq in enumerate(self._recv_unkeyed):
+			mk = [m for m in keyed if where[m][0] == prio]
+			if not mk:
+				res.extend(mq)
+				continue
+			# merge, keeping the order of self.receivers
+			i = 0
+			for m in mq:
+				seq = where[m][2]
+				while i < len(mk) and where[mk[i]][2] < seq:
+					res.append(mk[i])
+					i += 1
+				res.append(m)
+			res.extend(mk[i:])
+		return res
+
+	@property
+	def blocked_by(self):
+		"""Return a receiver which blocks sending, if any."""
+		mb = self._recv_blocking
+		while mb:
+			m = mb[0]
+			if m.blocking and m in self._recv_where:
+				return m
+			mb.pop(0)
+		return None
+
 	def _incoming(self,msg):
 		"""Process an incoming message."""
 		self.n_rcvd_now += 1
@@ -531,12 +684,11 @@ class MsgQueue(Collected,Jobber):
 		self.last_recv = msg
 		self.last_recv_at = now()
 
-		# i is an optimization for receiver lists that don't change in mid-action
 		handled = False
 		log("msg",TRACE,"recv",self.name,str(msg))
-		for mq in self.receivers:
-		  i = 0
-		  for m in mq:
+		for m in self._recv_candidates(msg):
+			if m not in self._recv_where:
+				continue # removed by some other receiver
 			try:
 				r = m.recv(msg)
 				log("msg",TRACE,"recv=",r,repr(m))
@@ -548,11 +700,7 @@ class MsgQueue(Collected,Jobber):
 					continue
 				elif r is MINE or r is SEND_AGAIN:
 					handled = True
-					if len(mq) > i and mq[i] is m:
-						mq.pop(i)
-					else:
-						mq.remove(m)
-					i -= 1
+					self._del_receiver(m)
 
 					if r is SEND_AGAIN:
 						if m.blocking:
@@ -565,19 +713,14 @@ class MsgQueue(Collected,Jobber):
 					break
 				elif r is RECV_AGAIN:
 					handled = True
-					break
-				elif r is SEND_AGAIN:
-					handled = True
+					self._rekey_receiver(m)
 					break
 				elif isinstance(r,MSG_ERROR):
 					raise r
 				else:
 					raise BadResult(m)
 			except Exception as ex:
-				if len(mq) < i and mq[i] is m:
-					mq.pop(i)
-				elif m in self.receivers:
-					mq.remove(m)
+				self._del_receiver(m)
 				fix_exception(ex)
 				process_failure(ex)
 
@@ -586,7 +729,6 @@ class MsgQueue(Collected,Jobber):
 				simple_event(Context(),"msg","error",str(msg),*self.name)
 				handled = True
 				break
-			i += 1
 		if not handled:
 			simple_event(Context(),"msg","unhandled",str(msg),*self.name)
 
@@ -609,10 +751,9 @@ class MsgQueue(Collected,Jobber):
 
 	def _setup(self):
 		sends,self.senders = self.senders,[]
-		recvs,self.receivers = self.receivers,[]
+		recvs = self._reset_receivers()
 		for mq in recvs:
 			self.senders.append([])
-			self.receivers.append([])
 		for mq in sends+recvs:
 			for msg in mq:
 				try:
@@ -620,7 +761,7 @@ class MsgQueue(Collected,Jobber):
 					if r is SEND_AGAIN:
 						self.senders[msg.prio].append(msg)
 					elif r is RECV_AGAIN:
-						self.receivers[msg.prio].append(msg)
+						self._add_receiver(msg)
 					elif r is not None:
 						raise RuntimeError("Strange retry(): %s %s" % (repr(msg),repr(r)))
 				except Exception as e:
@@ -673,13 +814,8 @@ class MsgQueue(Collected,Jobber):
 
 	@property
 	def is_open(self):
-		"""Count the number of outstanding messages"""
-		res = 0
-		for mq in self.receivers:
-		  for m in mq:
-			if isinstance(m,MsgBase):
-				res += 1
-		return res
+		"""The number of outstanding messages"""
+		return self.n_open
 
 	@property
 	def n_outq(self):
@@ -714,10 +850,7 @@ class MsgQueue(Collected,Jobber):
 			if isinstance(msg,MsgSender):
 				self.senders[msg.prio].append(msg)
 			elif isinstance(msg,MsgReceiver):
-				if msg.blocking:
-					self.receivers[msg.prio].insert(0,msg)
-				else:
-					self.receivers[msg.prio].append(msg)
+				self._add_receiver(msg)
 			elif isinstance(msg,MsgIncoming):
 				self._incoming(msg)
 			elif isinstance(msg,MsgOpenMarker):
@@ -761,13 +894,10 @@ class MsgQueue(Collected,Jobber):
 			log("msg",TRACE,"states at run",self.state,state)
 			done = False # marker for "don't send any more stuff"
 
-			for mq in self.receivers:
-			  if done: break
-			  for m in mq:
-				if m.blocking:
-					log("msg",TRACE,"blocked by",str(m))
-					done = True
-			if done: continue
+			m = self.blocked_by
+			if m is not None:
+				log("msg",TRACE,"blocked by",str(m))
+				continue
 
 			for mq in self.senders:
 				if done: break
@@ -776,7 +906,7 @@ class MsgQueue(Collected,Jobber):
 						break
 					if self.channel is None:
 						break
-					if self.max_open >= self.is_open:
+					if self.max_open is not None and self.is_open >= self.max_open:
 						break
 
 					msg = mq.pop(0)
@@ -792,10 +922,7 @@ class MsgQueue(Collected,Jobber):
 						self.n_sent_now += 1
 					log("msg",TRACE,"send result",r)
 					if r is RECV_AGAIN:
-						if msg.blocking:
-							self.receivers[msg.prio].insert(0,msg)
-						else:
-							self.receivers[msg.prio].append(msg)
+						self._add_receiver(msg)
 					elif r is SEND_AGAIN:
 						if msg.blocking:
 							self.senders[msg.prio].insert(0,msg)
@@ -28,7 +28,7 @@ from homevent.check import Check,register_condition,unregister_condition
 from homevent.context import Context
 from homevent.event import Event
 from homevent.base import Name,SName
-from homevent.run import process_failure
+from homevent.run import process_failure,simple_event
 from homevent.collect import Collected
 from homevent.twist import fix_exception,reraise,Jobber
 
@@ -71,10 +71,17 @@ class NetError(EnvironmentError):
 
 
 class LineReceiver(object):
-	"""A receiver mix-in for the basic line protocol."""
+	"""\
+		A receiver mix-in for the basic line protocol.
+
+		Incoming data is collected in a bytearray which is scanned once.
+		All complete lines of a chunk are passed to linesReceived().
+		"""
 
 	delimiter = "\n"
-	buffer = ""
+	max_length = None # longer lines are discarded; set per connection
+	_buf = None
+	_skip = False # discarding the rest of an overlong line
 
 	def lineReceived(self, line):
 		"""Override this.
@@ -82,24 +89,58 @@ class LineReceiver(object):
 		self.close()
 		raise NotImplementedError("You need to override NetReceiver.lineReceived")
 
+	def linesReceived(self, lines):
+		"""Process a list of lines. Override this to handle them in bulk."""
+		for d in lines:
+			try:
+				self.lineReceived(d)
+			except Exception as e:
+				fix_exception(e)
+				process_failure(e)
+
+	def lineOverflow(self):
+		"""A line longer than max_length has been discarded."""
+		log("net",WARN,"line too long",*self.name)
+		simple_event(Context(),"net","overflow",*self.name)
+
 	def dataReceived(self,val):
-		buffer = self.buffer + val
+		buf = self._buf
+		if buf is None:
+			buf = self._buf = bytearray()
+		delim = self.delimiter
+		dl = len(delim)
+		ml = self.max_length
+		# a delimiter may straddle the old data and the new
+		pos = max(len(buf)-dl+1, 0)
+		buf += val
+		start = 0
 		data = []
+		overflow = False
 
 		while True:
-			i = buffer.find(self.delimiter)
+			i = buf.find(delim,pos)
 			if i < 0:
 				break
-			data.append(buffer[:i])
-			buffer = buffer[i+len(self.delimiter):]
-
-		self.buffer = buffer
-		for d in data:
-			try:
-				self.lineReceived(d)
-			except Exception as e:
-				fix_exception(e)
-				process_failure(e)
+			if self._skip:
+				self._skip = False
+			elif ml is not None and i-start > ml:
+				overflow = True
+			else:
+				data.append(str(buf[start:i]))
+			start = pos = i+dl
+
+		if start:
+			del buf[:start]
+		if ml is not None and len(buf) > ml:
+			del buf[:]
+			if not self._skip:
+				self._skip = True
+				overflow = True
+
+		if data:
+			self.linesReceived(data)
+		if overflow:
+			self.lineOverflow()
 		
 	def write(self,val):
 		super(LineReceiver,self).write(val+self.delimiter)
@@ -120,12 +161,16 @@ class NetCommonConnector(Collected,Jobber):
 	job = None
 	socket = None
 
-	def __init__(self, name, host,port, socket=None):
+	def __init__(self, name, host,port, socket=None, max_length=None):
 		self.socket = socket
+		if max_length is not None:
+			self.max_length = max_length
 		self.host = host
 		self.port = port
 		self.name = name
 		storage2 = getattr(self,"storage2",{})
+		if storage2 is None:
+			storage2 = {}
 		assert (host,port) not in storage2, "already known host/port tuple"
 		super(NetCommonConnector,self).__init__()
 		storage2[(host,port)] = self
@@ -221,6 +266,8 @@ class NetCommonConnector(Collected,Jobber):
 		yield ("type",self.typ)
 		yield ("host",self.host)
 		yield ("port",self.port)
+		if getattr(self,"max_length",None) is not None:
+			yield ("max length",self.max_length)
 
 	def delete(self,ctx=None):
 		storage2 = getattr(self,"storage2",None)
@@ -267,6 +314,7 @@ class NetCommon(AttributedStatement):
 	recv = None
 	host = "localhost"
 	port = None
+	max_length = None # set by the "max length" sub-statement
 	long_doc = u"""\
 You need to override the long_doc description.
 """
@@ -318,7 +366,10 @@ class NetConnect(NetCommon):
 	client = NetActiveConnector
 
 	def start_up(self):
-		return self.client(name=self.dest, host=self.host,port=self.port)
+		k = {}
+		if self.max_length is not None:
+			k["max_length"] = self.max_length
+		return self.client(name=self.dest, host=self.host,port=self.port, **k)
 
 
 ##### passive connections
@@ -328,12 +379,12 @@ class NetPassiveConnector(NetCommonConnector):
 	"""A connection created by accepting a connection via a NetListener."""
 	typ = "???passive"
 
-	def __init__(self,socket,address,name):
+	def __init__(self,socket,address,name, **k):
 		global name_seq
 		name_seq += 1
 
 		name = name+(str(name_seq),)
-		super(NetPassiveConnector,self).__init__(socket=socket, name=name, host=address[0],port=address[1])
+		super(NetPassiveConnector,self).__init__(socket=socket, name=name, host=address[0],port=address[1], **k)
 
 
 class NetListener(Collected):
@@ -341,12 +392,16 @@ class NetListener(Collected):
 	#storage = Nets.storage
 	server = None
 	connector = None
+	max_length = None # passed to each connection
 
 	def __init__(self, name, host,port, *a,**k):
 		super(NetListener,self).__init__(name)
 		self.name = name
 		self.host = host
 		self.port = port
+		max_length = k.get("max_length",None)
+		if max_length is not None:
+			self.max_length = max_length
 
 	def _init2(self, server, connector):
 		"""The server and this object are cross-connected, so this step finishes initialization."""
@@ -359,7 +414,10 @@ class NetListener(Collected):
 			socket.close()
 			return
 
-		job = gevent.spawn(self.connector, socket,address,self.name)
+		k = {}
+		if self.max_length is not None:
+			k["max_length"] = self.max_length
+		job = gevent.spawn(self.connector, socket,address,self.name, **k)
 		def died(e):
 			fix_exception(e)
 			process_failure(e)
@@ -372,6 +430,8 @@ class NetListener(Collected):
 		yield ("host", self.host)
 		yield ("port", self.port)
 		yield ("connector", self.connector.name if self.connector is not None else None)
+		if self.max_length is not None:
+			yield ("max length", self.max_length)
 
 	def delete(self,ctx):
 		self.server.stop()
@@ -392,7 +452,7 @@ You need to override the long_doc description.
 	#server = None # descendant of NetServerFactory
 
 	def start_up(self):
-		r = self.listener(name=self.dest, host=self.host,port=self.port)
+		r = self.listener(name=self.dest, host=self.host,port=self.port, max_length=self.max_length)
 		s = StreamServer((self.host, self.port), r.connected)
 		s.set_spawn(None)
 		r._init2(s, self.connector)
@@ -415,6 +475,29 @@ NetConnect.register_statement(NetName)
 NetListen.register_statement(NetName)
 
 
+class NetMaxLength(Statement):
+	name="max length"
+	dest = None
+	doc="discard incoming lines longer than this"
+
+	long_doc = u"""\
+max length ‹bytes›
+  - Lines longer than this are discarded, and a "net overflow" event
+    is raised instead. The default is not to limit line length.
+"""
+
+	def run(self,ctx,**k):
+		event = self.params(ctx)
+		if len(event) != 1:
+			raise SyntaxError(u"Usage: %s ‹bytes›" % (self.name,))
+		try:
+			self.parent.max_length = int(event[0])
+		except ValueError:
+			raise SyntaxError(u"Usage: %s ‹bytes› (integer value! was '%s')" % (self.name,event[0]))
+NetConnect.register_statement(NetMaxLength)
+NetListen.register_statement(NetMaxLength)
+
+
 class NetRetry(Statement):
 	name= "retry"
 	dest = None
@@ -32,7 +32,7 @@ from homevent.run import process_event,process_failure,simple_event
 from homevent.twist import callLater, fix_exception,print_exception, Jobber
 from homevent.base import Name
 from homevent.net import NetActiveConnector
-from homevent.msg import MsgReceiver,MsgBase,MsgQueue,MsgFactory,\
+from homevent.msg import MsgReceiver,MsgBase,MsgQueue,MsgFactory,MsgIncoming,\
 	PRIO_STANDARD,PRIO_URGENT,PRIO_BACKGROUND,\
 	SEND_AGAIN,RECV_AGAIN,MINE,NOT_MINE
 
@@ -40,6 +40,7 @@ import struct
 import os
 import errno
 import sys
+from time import time
 
 import gevent
 from gevent.event import AsyncResult
@@ -49,6 +50,14 @@ PRIO_STEP = 10 # number of iterations before considering the next queue
 
 MAX_TRIES = 5 # retrying a message until failure
 
+RATE_WINDOW = 10 # seconds over which to measure calls per second
+
+FULL_SCAN = 6 # every Nth bus scan lists all branches again
+
+MUX_MAX_AGE = 20 if TESTING else 600 # seconds until a multiplexer branch is listed again
+
+SIMULTANEOUS = ("temperature",) # attributes which the bus can convert in one go
+
 PERSIST=True # Default
 
 class DisconnectedDeviceError(RuntimeError):
@@ -197,6 +206,24 @@ class OWFSchannel(OWFSassembler, NetActiveConnector):
 			simple_event(Context(),"onewire","error",*self.name)
 
 
+class OWFSlanechannel(OWFSchannel):
+	"""\
+		An additional connection to a server which already has one.
+		It is not registered by host/port and does not emit events;
+		the bus's main connection does that.
+		"""
+	storage2 = None
+
+	def down_event(self, external=False):
+		log("onewire",TRACE,"lane down",*self.name)
+
+	def up_event(self, external=False):
+		log("onewire",TRACE,"lane up",*self.name)
+
+	def not_up_event(self, external=False):
+		log("onewire",TRACE,"lane error",*self.name)
+
+
 class OWFScall(MsgBase):
 	"""An object representing one call to OWFS"""
 	prio = PRIO_STANDARD
@@ -205,6 +232,8 @@ class OWFScall(MsgBase):
 	cached = False
 	timeout = 10
 	d = None
+	bus = None # the OWFSqueue which gets our statistics
+	_sent_at = None
 
 	def __init__(self,prio=None):
 		if prio is not None:
@@ -217,6 +246,7 @@ class OWFScall(MsgBase):
 	def sendMsg(self,conn, typ,data, rlen=0):
 		# messages are not tagged, so process received messages in strict order
 		self.prio = PRIO_STANDARD
+		self._sent_at = time()
 		try:
 			conn.sendMsg(typ,data,rlen)
 		except Exception as ex:
@@ -234,6 +264,8 @@ class OWFScall(MsgBase):
 		r = self.dataReceived(msg.data)
 		if r is None:
 			r = MINE
+		if r is MINE and self.bus is not None and self._sent_at is not None:
+			self.bus.record_call(time()-self._sent_at)
 		return r
 	
 	def retry(self):
@@ -287,6 +319,12 @@ class ATTRgetmsg(OWFScall):
 	def __repr__(self):
 		return "‹"+self.__class__.__name__+" "+self.path[-2]+" "+self.path[-1]+"›"
 		
+	def recv(self, msg):
+		if msg.typ < 0:
+			# owserver reports a failed read as a negative errno.
+			# Like MsgBase.abort(), this passes the error as the result.
+			msg = MsgIncoming(typ=msg.typ, data=IOError(-msg.typ, os.strerror(-msg.typ), self._path(self.path)))
+		return super(ATTRgetmsg,self).recv(msg)
 	
 	# .dataReceived() already does what's expected
 	
@@ -363,6 +401,42 @@ OWbuses = OWbuses()
 OWbuses.does("del")
 register_condition(OWbuses.exists)
 
+class OWlanes(Collection):
+       name = "onewire lane"
+OWlanes = OWlanes()
+register_condition(OWlanes.exists)
+
+
+def _load(q):
+	"""The number of requests a queue has not yet answered."""
+	n = q.n_open + q.n_outq
+	if q.q is not None:
+		n += q.q.qsize()
+	return n
+
+class OWFSlane(MsgQueue):
+	"""\
+		An additional connection to a bus's server.
+
+		The owserver protocol does not tag its replies, so requests on
+		one connection are answered strictly in order. More connections
+		let a slow request (a bus scan, a conversion) proceed while
+		others are answered.
+		"""
+	storage = OWlanes.storage
+	ondemand = True
+
+	def __init__(self, bus, n, host,port, persist=PERSIST, **k):
+		self.bus = bus
+		name = bus.name+(str(n),)
+		super(OWFSlane,self).__init__(name=name, factory=MsgFactory(OWFSlanechannel,name=name,host=host,port=port,persist=persist, **k))
+		self.max_open = bus.max_open
+
+	def list(self):
+		for r in super(OWFSlane,self).list():
+			yield r
+		yield ("bus",self.bus.name)
+
 
 class OWFSqueue(MsgQueue,Jobber):
 	"""\
@@ -370,22 +444,110 @@ class OWFSqueue(MsgQueue,Jobber):
 
 		The only real change is to periodically scan the bus.
 		MsgQueue and the factory handle everything else.
+
+		Requests are spread over @connections connections to the server;
+		each of these has at most @pipeline requests in flight.
 		"""
 	storage = OWbuses.storage
 	ondemand = True
 
-	def __init__(self, name, host,port, persist=PERSIST, *a,**k):
+	n_calls = 0
+	latency_sum = 0.0
+	latency_max = 0.0
+	_rate = None
+	_rate_start = None
+	_rate_calls = 0
+
+	n_scans = 0
+	scan_dirs = 0 # DIR requests during the current scan
+	last_scan = None # (seconds, DIR requests, full?)
+
+	def __init__(self, name, host,port, persist=PERSIST, connections=1, pipeline=None, *a,**k):
 		self.ident = (host,port)
 		self.root = OWFSroot(self)
+		self.lanes = []
+		self.scan_cache = {} # path => directory listing, from the last scan
+		self.scan_times = {} # path => when that listing was read
 		super(OWFSqueue,self).__init__(name=name, factory=MsgFactory(OWFSchannel,name=name,host=host,port=port,persist=persist, **k))
 		if not persist:
+			# the server closes the connection after replying
 			self.max_send = 1
+			self.max_open = 1
+		elif pipeline is not None:
+			self.max_open = pipeline
+		for n in range(2,connections+1):
+			self.lanes.append(OWFSlane(self,n, host=host,port=port,persist=persist, **k))
 		self.nop = None
 
+	def enqueue(self,msg):
+		"""Queue the message on the connection with the least work to do."""
+		if isinstance(msg,OWFScall):
+			msg.bus = self
+		q = self
+		if self.lanes:
+			load = _load(self)
+			for lane in self.lanes:
+				l = _load(lane)
+				if load > l:
+					q,load = lane,l
+		if q is self:
+			super(OWFSqueue,self).enqueue(msg)
+		else:
+			q.enqueue(msg)
+
+	def record_call(self,latency):
+		"""A request has been answered after @latency seconds."""
+		self.n_calls += 1
+		self.latency_sum += latency
+		if self.latency_max < latency:
+			self.latency_max = latency
+		self._rate_calls += 1
+		self.calls_per_sec()
+
+	def calls_per_sec(self):
+		"""The rate of answered requests during the last complete window."""
+		t = time()
+		if self._rate_start is None:
+			self._rate_start = t
+		elif t-self._rate_start >= RATE_WINDOW:
+			self._rate = self._rate_calls/(t-self._rate_start)
+			self._rate_start = t
+			self._rate_calls = 0
+		return self._rate
+
+	def list(self):
+		for r in super(OWFSqueue,self).list():
+			yield r
+		yield ("connections",1+len(self.lanes))
+		for lane in self.lanes:
+			yield ("lane",lane.name)
+		if self.max_open is not None:
+			yield ("pipeline",self.max_open)
+		yield ("calls",self.n_calls)
+		if self.n_calls:
+			yield ("latency avg",self.latency_sum/self.n_calls)
+			yield ("latency max",self.latency_max)
+		rate = self.calls_per_sec()
+		if rate is not None:
+			yield ("calls/sec",rate)
+		yield ("scans",self.n_scans)
+		if self.last_scan is not None:
+			yield ("last scan time",self.last_scan[0])
+			yield ("last scan dirs",self.last_scan[1])
+			yield ("last scan full",self.last_scan[2])
+
+	def delete(self,ctx=None):
+		for lane in self.lanes:
+			lane.delete()
+		self.lanes = []
+		super(OWFSqueue,self).delete(ctx=ctx)
+
 	### Bus scanning support
 
 	def start(self):
 		super(OWFSqueue,self).start()
+		for lane in self.lanes:
+			lane.start()
 		self.watch_q = Queue()
 		self.start_job("watcher",self._watcher)
 		def dead(_):
@@ -394,6 +556,8 @@ class OWFSqueue(MsgQueue,Jobber):
 
 	def stop(self,reason=None):
 		self.stop_job("watcher")
+		for lane in self.lanes:
+			lane.stop(reason=reason)
 		super(OWFSqueue,self).stop(reason=reason)
 
 	def _clean_watched(self):
@@ -406,12 +570,50 @@ class OWFSqueue(MsgQueue,Jobber):
 				q.set_exception(RuntimeError("Stopped"))
 		self.watch_q = None
 
-	def all_devices(self):
+	def all_devices(self, incremental=False):
+		"""\
+			Enumerate the devices on this bus.
+
+			If @incremental is set, a multiplexer's branches are not
+			listed again when the directory which contains the multiplexer
+			has not changed since the last scan, unless they were last
+			listed more than MUX_MAX_AGE seconds ago; the remembered
+			listing is used instead.
+			"""
 		seen_mplex = {}
-		def doit(dev,path=(),key=None):
+		old_cache = self.scan_cache if incremental else {}
+		old_times = self.scan_times
+		new_cache = {}
+		new_times = {}
+		self.scan_cache = new_cache
+		self.scan_times = new_times
+		stale = time()-MUX_MAX_AGE
+
+		def listing(dev,path,key,p, changed):
+			if not changed and p in old_cache and old_times[p] > stale:
+				res = old_cache[p]
+				new_times[p] = old_times[p]
+			else:
+				res = []
+				self.scan_dirs += 1
+				if dev.dir(key=key,proc=res.append,path=path) is None:
+					return res # failed: don't remember
+				res = tuple(res)
+				new_times[p] = time()
+			new_cache[p] = res
+			return res
+
+		def doit(dev,path=(),key=None, changed=True):
+			p = dev.path
+			if dev.bus_id:
+				p += (dev.bus_id,)
+			p += path
+			if key:
+				p += (key,)
+
 			buses = []
 			entries = []
-			def got_entry(name):
+			for name in listing(dev,path,key,p, changed):
 				if key is None and name.startswith("bus."):
 					buses.append(name)
 				elif len(name)>3 and name[2] == ".":
@@ -419,48 +621,62 @@ class OWFSqueue(MsgQueue,Jobber):
 				else:
 					log("onewire",TRACE,"got unrecognized name %s" % (name,))
 
-			dev.dir(key=key,proc=got_entry,path=path)
-
 			if buses:
 				for b in buses:
 					for res in doit(dev,path=path+(b,),key=None):
 						yield res
 				return
 
-			p = dev.path
-			if dev.bus_id:
-				p += (dev.bus_id,)
-			p += path
-			if key:
-				p += (key,)
-
+			changed = (old_cache.get(p) != new_cache.get(p))
 			for b in entries:
 				dn = OWFSdevice(id=b,bus=self,path=p)
 				yield dn
 				if b.lower().startswith("1f.") and b not in seen_mplex:
 					seen_mplex[b] = b
-					for res in doit(dn,key="main"):
+					for res in doit(dn,key="main", changed=changed):
 						yield res
-					for res in doit(dn,key="aux"):
+					for res in doit(dn,key="aux", changed=changed):
 						yield res
 
 		return doit(self.root)
 
-	def update_all(self):
+	def _alarm_news(self):
+		"""Check whether the alarm directory mentions unknown devices."""
+		news = []
+		def got_entry(name):
+			if len(name)>3 and name[2] == "." and name.lower() not in devices:
+				news.append(name)
+
+		self.scan_dirs += 1
+		if self.root.dir(path=("alarm",),proc=got_entry,cached=False) is None:
+			return True
+		if news:
+			log("onewire",DEBUG,"new devices in alarm dir",self.name,*news)
+		return bool(news)
+
+	def update_all(self, full=False):
 		try:
 			process_event(Event(Context(),"onewire","scanning",self.name))
-			self._update_all()
+			self._update_all(full=full)
 		except Exception as e:
+			self.scan_cache = {} # rescan everything next time
 			fix_exception(e)
 			process_failure(e)
 
-	def _update_all(self):
+	def _update_all(self, full=False):
 		log("onewire",TRACE,"start bus update")
+		t1 = time()
+		self.scan_dirs = 0
+		if not self.scan_cache or self.n_scans % FULL_SCAN == 0:
+			full = True
+		elif not full and self._alarm_news():
+			full = True
+
 		old_ids = devices.copy()
 		new_ids = {}
 		seen_ids = {}
 
-		for dev in self.all_devices():
+		for dev in self.all_devices(incremental=not full):
 			if dev.id in seen_ids:
 				continue
 			seen_ids[dev.id] = dev
@@ -483,13 +699,16 @@ class OWFSqueue(MsgQueue,Jobber):
 			if dev.bus is self:
 				n_dev += 1
 		
-		simple_event(Context(),"onewire","scanned",self.name,n_old, len(new_ids), n_dev)
+		self.n_scans += 1
+		self.last_scan = (time()-t1, self.scan_dirs, full)
+		simple_event(Context(scan_time=self.last_scan[0], scan_dirs=self.scan_dirs, scan_full=full),"onewire","scanned",self.name,n_old, len(new_ids), n_dev)
 			
 	def _watcher(self):
 		res = []
 		while True:
 			try:
-				self.update_all()
+				# an explicit request gets a full scan
+				self.update_all(full=bool(res))
 			except Exception as ex:
 				fix_exception(ex)
 				process_failure(ex)
@@ -528,12 +747,15 @@ class OWFSqueue(MsgQueue,Jobber):
 ow_buses = {}
 
 # factory.
-def connect(host="localhost", port=4304, name=None, persist=PERSIST):
+def connect(host="localhost", port=4304, name=None, persist=PERSIST, connections=1, pipeline=None):
 	"""\
 		Set up a queue to a OneWire server.
+
+		@connections: number of connections to open.
+		@pipeline: max number of requests in flight on each of them.
 		"""
 	assert (host,port) not in ow_buses, "already known host/port tuple"
-	f = OWFSqueue(host=host, port=port, name=name, persist=persist)
+	f = OWFSqueue(host=host, port=port, name=name, persist=persist, connections=connections, pipeline=pipeline)
 	ow_buses[(host,port)] = f
 	f.start()
 	return f
@@ -542,6 +764,67 @@ def disconnect(f):
 	assert f==ow_buses.pop(f.ident)
 	f.stop()
 
+def get_many(reqs):
+	"""\
+		Read a number of (device,attribute) pairs concurrently.
+		Returns a list of the values, in the same order. If a read
+		fails, its entry is the exception instead; the other values
+		are still returned.
+
+		Attributes in SIMULTANEOUS are converted once per bus segment
+		before reading them.
+		"""
+	reqs = list(reqs)
+	for dev,key in reqs:
+		if not dev.bus:
+			raise DisconnectedDeviceError(dev.id)
+
+	conv = {}
+	for dev,key in reqs:
+		if key in SIMULTANEOUS:
+			p = dev.path+("simultaneous",key)
+			if (dev.bus,p) not in conv:
+				msg = ATTRsetmsg(p,1)
+				msg.queue(dev.bus)
+				conv[(dev.bus,p)] = msg
+	for msg in conv.itervalues():
+		try:
+			msg.result.get()
+		except Exception as ex:
+			# the reads will do their own conversions
+			fix_exception(ex)
+			log("onewire",DEBUG,"simultaneous failed",msg,ex)
+
+	msgs = []
+	for dev,key in reqs:
+		msg = ATTRgetmsg(dev.path+(dev.bus_id,key))
+		msg.queue(dev.bus)
+		msgs.append(msg)
+
+	res = []
+	for (dev,key),msg in zip(reqs,msgs):
+		try:
+			val = msg.result.get()
+			if isinstance(val,Exception):
+				raise val
+		except Exception as ex:
+			fix_exception(ex)
+			dev.go_down(ex)
+			res.append(ex)
+		else:
+			res.append(_value(val))
+	return res
+
+def _value(res):
+	"""Convert a value read from the bus to a number, if possible."""
+	try:
+		return int(res)
+	except (ValueError,TypeError):
+		try:
+			return float(res)
+		except (ValueError,TypeError):
+			return res
+
 
 
 class devices(Collection):
@@ -651,20 +934,22 @@ class OWFSdevice(Collected):
 
 		try:
 			res = msg.result.get()
+			if isinstance(res,Exception):
+				raise res
 		except Exception as ex:
 			fix_exception(ex)
 			self.go_down(ex)
 			raise
 
-		try:
-			res = int(res)
-		except (ValueError,TypeError):
-			try:
-				res = float(res)
-			except (ValueError,TypeError):
-				pass
+		return _value(res)
 
-		return res
+	def get_many(self,keys):
+		"""\
+			Read several attributes concurrently. Returns a key=>value
+			dict; an attribute which could not be read maps to the error.
+			"""
+		keys = list(keys)
+		return dict(zip(keys, get_many((self,k) for k in keys)))
 
 
 	def set(self,key,val):
@@ -680,7 +965,7 @@ class OWFSdevice(Collected):
 			self.go_down(ex)
 
 
-	def dir(self, proc, path=(), key=None):
+	def dir(self, proc, path=(), key=None, cached=None):
 		if not self.bus:
 			raise DisconnectedDeviceError(self.id)
 
@@ -691,6 +976,8 @@ class OWFSdevice(Collected):
 			p += (key,)
 
 		msg = DIRmsg(p,proc)
+		if cached is not None:
+			msg.cached = cached
 		msg.queue(self.bus)
 
 		try:
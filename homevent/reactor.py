@@ -28,7 +28,7 @@ from homevent.run import register_worker,unregister_worker, SYS_PRIO,MAX_PRIO,\
 from homevent.statement import Statement
 from homevent.io import dropConnections
 from homevent.twist import deferToLater, fix_exception,print_exception,\
-	wait_for_all_threads
+	wait_for_all_threads, timer_queues
 from homevent.collect import Collection,Collected
 
 from twisted.internet import reactor
@@ -49,6 +49,31 @@ class Events(Collection):
     name = "event"
 Events = Events()
 
+class Timers(Collection):
+    name = "timer"
+Timers = Timers()
+
+class TimerInfo(Collected):
+	"""Shows the state of one of the queues behind callLater()."""
+	storage = Timers.storage
+
+	def __init__(self,queue):
+		self.queue = queue
+		super(TimerInfo,self).__init__(queue.name)
+
+	def info(self):
+		return "%d pending, %d late" % (self.queue.pending,self.queue.n_late)
+
+	def list(self):
+		for r in super(TimerInfo,self).list():
+			yield r
+		for r in self.queue.list():
+			yield r
+
+for q in timer_queues:
+	TimerInfo(q)
+del q
+
 class Shutdown_Worker_1(ExcWorker):
 	"""\
 		This worker counts event runs and makes sure that all are
@@ -28,6 +28,94 @@ from homevent.twist import fix_exception
 workers = {}
 work_prios = []
 worker_ids = {}
+worker_seq = {}
+seqnum = 0
+
+class _WorkerNode(object):
+	"""One node of the dispatch trie, see WorkerIndex."""
+	__slots__ = ("words","wild","workers")
+	def __init__(self):
+		self.words = {}
+		self.wild = None
+		self.workers = []
+
+	def __nonzero__(self):
+		return bool(self.words or self.wild or self.workers)
+
+class WorkerIndex(object):
+	"""\
+		A prefix trie keyed on event name words.
+
+		Every worker is stored at the node which its "event_words" tuple
+		leads to; a None word descends into the node's wildcard branch.
+		Workers without event_words sit at the root and see every event.
+
+		find() returns all workers whose prefix matches an event, so
+		collect_event() only needs to call does_event() on those.
+		"""
+	def __init__(self):
+		self.root = _WorkerNode()
+
+	def _key(self,w):
+		words = getattr(w,"event_words",None)
+		if words is None:
+			return ()
+		return tuple((None if x is None else str(x)) for x in words)
+
+	def add(self,w):
+		node = self.root
+		for k in self._key(w):
+			if k is None:
+				if node.wild is None:
+					node.wild = _WorkerNode()
+				node = node.wild
+			else:
+				sub = node.words.get(k,None)
+				if sub is None:
+					node.words[k] = sub = _WorkerNode()
+				node = sub
+		node.workers.append(w)
+
+	def remove(self,w):
+		node = self.root
+		path = []
+		for k in self._key(w):
+			path.append((node,k))
+			if k is None:
+				node = node.wild
+			else:
+				node = node.words[k]
+		node.workers.remove(w)
+
+		# prune empty branches
+		while path and not node:
+			node,k = path.pop()
+			if k is None:
+				node.wild = None
+			else:
+				del node.words[k]
+
+	def find(self,event):
+		"""Return the workers which might be interested in this event."""
+		res = []
+		words = [str(x) for x in event]
+		n = len(words)
+		todo = [(self.root,0)]
+		while todo:
+			node,i = todo.pop()
+			res.extend(node.workers)
+			if i < n:
+				sub = node.words.get(words[i],None)
+				if sub is not None:
+					todo.append((sub,i+1))
+				if node.wild is not None:
+					todo.append((node.wild,i+1))
+		return res
+
+worker_index = WorkerIndex()
+
+def _worker_order(w):
+	return (w.prio,worker_seq[w.id])
 
 def register_worker(w):
 	"""\
@@ -36,6 +124,7 @@ def register_worker(w):
 		event logger.
 		"""
 	global work_prios
+	global seqnum
 
 	if w.prio not in workers:
 		workers[w.prio] = []
@@ -44,6 +133,9 @@ def register_worker(w):
 		raise RuntimeError("More than one system worker (prio:%d) is registered!" % (w.prio,))
 	workers[w.prio].append(w)
 	worker_ids[w.id] = w
+	seqnum += 1
+	worker_seq[w.id] = seqnum
+	worker_index.add(w)
 	
 def unregister_worker(w):
 	"""\
@@ -51,7 +143,9 @@ def unregister_worker(w):
 		"""
 	global work_prios
 	workers[w.prio].remove(w)
+	worker_index.remove(w)
 	del worker_ids[w.id]
+	del worker_seq[w.id]
 	if not workers[w.prio]: # last worker removed
 		del workers[w.prio]
 		work_prios = sorted(workers.keys())
@@ -81,15 +175,15 @@ def collect_event(e):
 		Run an event through the system.
 		Create a list of things to be done for this event.
 		"""
-	from homevent.logging import log_created
+	from homevent.logging import log_created,wants_events,TRACE
 
 	work = ConditionalWorkSequence(e,None)
-	for wp in work_prios:
-		for w in workers[wp]:
-			if w.does_event(e):
-				w.match_count += 1
-				work.append(w)
-	log_created(work)
+	for w in sorted(worker_index.find(e), key=_worker_order):
+		if w.does_event(e):
+			w.match_count += 1
+			work.append(w)
+	if wants_events(TRACE):
+		log_created(work)
 	return work
 
 def collect_failure(e):
@@ -97,7 +191,7 @@ def collect_failure(e):
 		Run a failure through the system.
 		Create a list of things to be done for it.
 		"""
-	from homevent.logging import log_created
+	from homevent.logging import log_created,wants_events,TRACE
 	from homevent.event import Event
 	assert isinstance(e,(Event,BaseException)),"Cannot be used as an event: "+repr(e)
 
@@ -106,7 +200,8 @@ def collect_failure(e):
 		for w in workers[wp]:
 			if isinstance(w,ExcWorker) and w.does_failure(e):
 				work.append(w)
-	log_created(work)
+	if wants_events(TRACE):
+		log_created(work)
 	return work
 
 def process_event(e, drop_errors=False):
@@ -25,6 +25,7 @@ This code does some standard time handling.
 import datetime as dt
 from time import time,mktime
 from calendar import isleap,monthrange
+from collections import OrderedDict
 
 import gevent
 from gevent.queue import Queue
@@ -198,113 +199,129 @@ def time_delta(args, now=None):
 
 class _store(object): pass
 
-def collect_words(n,w):
-	p = _store()
-	p.h = None
-	p.m = None # absolute hour/minute/second
-	p.s = None
-
-	p.yr = None
-	p.mn = None # absolute year/month/day
-	p.dy = None
-
-	p.wk = None
-	p.dow = None # week_of_year, weekday, which weekday?
-	p.nth = None
-
-	if n is None:
-		n = now()
-	p.now = n
-
-	weekdays = {
-		"monday":0, "tuesday":1, "wednesday":2, "thursday":3, "friday":4, "saturday":5,"sunday":6,
-		"mon":0, "tue":1, "wed":2, "thu":3, "fri":4, "sat":5,"sun":6,
-		"mo":0, "tu":1, "we":2, "th":3, "fr":4, "sa":5,"su":6,
-		}
-	f = None
-
-	w = list(w)
-	try:
-		s = float(w[0])
-	except (IndexError,ValueError,TypeError):
-		pass
-	else:
-		if s > 1000000000: # 30 years plus. Forget it, that's a unixtime.
-			p.now = dt.datetime.fromtimestamp(s)
-			w.pop(0)
+weekdays = {
+	"monday":0, "tuesday":1, "wednesday":2, "thursday":3, "friday":4, "saturday":5,"sunday":6,
+	"mon":0, "tue":1, "wed":2, "thu":3, "fri":4, "sat":5,"sun":6,
+	"mo":0, "tu":1, "we":2, "th":3, "fr":4, "sa":5,"su":6,
+	}
+
+# (attribute, datetime field, first value, last value (None: end of month),
+#  fields to clear when changing this one)
+_fields = (
+	("mn","month",1,12,{'second':0,'minute':0,'hour':0,'day':1}),
+	("dy","day",1,None,{'second':0,'minute':0,'hour':0}),
+	("h","hour",0,23,{'second':0,'minute':0}),
+	("m","minute",0,59,{'second':0}),
+	("s","second",0,59,{}),
+	)
+_YEAR,_MONTH,_DAY,_HOUR,_MIN,_SEC = range(-1,5)
+
+class TimeSpec(object):
+	"""\
+		A parsed "wait until"-style time specification.
 
-	while w:
-		if w[0] == "+":
-			w.pop(0)
-			f = 1
-		elif w[0] == "-":
-			w.pop(0)
-			f = -1
-		if isinstance(w[0],basestring) and w[0].lower() in weekdays:
-			assert p.dow is None, "You already specified the day of week"
-			assert f is None, "A sign makes no sense here"
-			p.dow = weekdays[w[0].lower()]
-			p.nth = 0
-			w.pop(0)
-			continue
-		val = int(w.pop(0))
-		if f is not None:
-			val = f * val
-			f = None
-		unit = w.pop(0)
-		if unit in ("s","sec","second","seconds"):
-			assert p.s is None, "You already specified the second"
-			assert -60<val<60, "Seconds need to be between 0 and 59"
-			p.s = val
-		elif unit in ("m","min","minute","minutes"):
-			assert p.m is None, "You already specified the minute"
-			assert -60<val<60, "Minutes need to be between 0 and 59"
-			p.m = val
-		elif unit in ("h","hr","hour","hours"):
-			assert p.h is None, "You already specified the hour"
-			assert -24<val<24, "Hours need to be between 0 and 23"
-			p.h = val
-		elif unit in ("d","dy","day","days"):
-			assert p.dy is None, "You already specified the day"
-			assert val != 0 and abs(val) <= 31, "Months only have 31 days max"
-			p.dy = val
-		elif unit in ("m","mo","month","months"):
-			assert p.mn is None, "You already specified the month"
-			assert val != 0 and abs(val) <= 12, "Years only have 12 months max"
-			p.mn = val
-		elif unit in ("y","yr","year","years"):
-			assert p.yr is None, "You already specified the year"
-			if val > 0 and val < 100:
-				val += now.year
-			else:
-				assert val >= now.year and val < now.year+100, "WHICH year? Sorry, the time machine module is not available."
-			p.yr = val
-		elif unit in ("w","wk","week","weeks"):
-			assert p.wk is None, "You already specified the week-of-year"
-			assert val != 0 and abs(val) <= 53, "Years only have 53 weeks max"
-			p.wk = val
-		elif unit in weekdays:
-			assert p.dow is None, "You already specified the day of week"
-			assert val != 0 and abs(val) <= 4, "Months have max. 5 of each weekday. (use -1 if you mean the last one)"
-			p.dow = weekdays[unit]
-			p.nth = val
-			continue
+		Parsing happens once; next_match() and next_nonmatch() then only
+		do the actual calculation. Use time_spec() to get one, so that
+		specs are shared.
+		"""
+	__slots__ = ("h","m","s", "yr","mn","dy", "wk","dow","nth", "at","args")
+
+	def __init__(self, args):
+		self.args = args
+		self.h = self.m = self.s = None # absolute hour/minute/second
+		self.yr = self.mn = self.dy = None # absolute year/month/day
+		self.wk = self.dow = self.nth = None # week_of_year, weekday, which weekday?
+		self.at = None # fixed "now"
+		f = None
+
+		w = list(args)
+		try:
+			s = float(w[0])
+		except (IndexError,ValueError,TypeError):
+			pass
 		else:
-			raise SyntaxError("unknown unit",unit)
-	return p
+			if s > 1000000000: # 30 years plus. Forget it, that's a unixtime.
+				self.at = dt.datetime.fromtimestamp(s)
+				w.pop(0)
 
-def time_until(args, now=None, invert=False):
-	"""\
-		Find the next time which is in the future and matches the arguments.
-		If "invert" is True, find the next time which does *not*.
-		"""
-	p = collect_words(now,args)
+		while w:
+			if w[0] == "+":
+				w.pop(0)
+				f = 1
+			elif w[0] == "-":
+				w.pop(0)
+				f = -1
+			if isinstance(w[0],basestring) and w[0].lower() in weekdays:
+				assert self.dow is None, "You already specified the day of week"
+				assert f is None, "A sign makes no sense here"
+				self.dow = weekdays[w[0].lower()]
+				self.nth = 0
+				w.pop(0)
+				continue
+			val = int(w.pop(0))
+			if f is not None:
+				val = f * val
+				f = None
+			unit = w.pop(0)
+			if unit in ("s","sec","second","seconds"):
+				assert self.s is None, "You already specified the second"
+				assert -60<val<60, "Seconds need to be between 0 and 59"
+				self.s = val
+			elif unit in ("m","min","minute","minutes"):
+				assert self.m is None, "You already specified the minute"
+				assert -60<val<60, "Minutes need to be between 0 and 59"
+				self.m = val
+			elif unit in ("h","hr","hour","hours"):
+				assert self.h is None, "You already specified the hour"
+				assert -24<val<24, "Hours need to be between 0 and 23"
+				self.h = val
+			elif unit in ("d","dy","day","days"):
+				assert self.dy is None, "You already specified the day"
+				assert val != 0 and abs(val) <= 31, "Months only have 31 days max"
+				self.dy = val
+			elif unit in ("m","mo","month","months"):
+				assert self.mn is None, "You already specified the month"
+				assert val != 0 and abs(val) <= 12, "Years only have 12 months max"
+				self.mn = val
+			elif unit in ("y","yr","year","years"):
+				assert self.yr is None, "You already specified the year"
+				assert val > 0, "WHICH year? Sorry, the time machine module is not available."
+				self.yr = val # two-digit years are resolved when matching
+			elif unit in ("w","wk","week","weeks"):
+				assert self.wk is None, "You already specified the week-of-year"
+				assert val != 0 and abs(val) <= 53, "Years only have 53 weeks max"
+				self.wk = val
+			elif unit in weekdays:
+				assert self.dow is None, "You already specified the day of week"
+				assert val != 0 and abs(val) <= 4, "Months have max. 5 of each weekday. (use -1 if you mean the last one)"
+				self.dow = weekdays[unit]
+				self.nth = val
+				continue
+			else:
+				raise SyntaxError("unknown unit",unit)
+
+	def __repr__(self):
+		return "<TimeSpec %s>" % (" ".join(str(x) for x in self.args),)
+
+	def _start(self, n):
+		p = _store()
+		if self.at is not None:
+			n = self.at
+		elif n is None:
+			n = now()
+		p.now = p.res = n
+
+		p.yr = self.yr
+		if p.yr is not None:
+			if 0 < p.yr < 100:
+				p.yr += n.year
+			else:
+				assert p.yr >= n.year and p.yr < n.year+100, "WHICH year? Sorry, the time machine module is not available."
+		return p
 
-	p.res = p.now
-	
 	# Theory of operation:
 	# For each step, there are four cases:
-    #
+	#
 	# a- can be left alone
 	#    = do nothing
 	# b- needs to be increased
@@ -318,166 +335,188 @@ def time_until(args, now=None, invert=False):
 	# a day/hour/whatever, presumably they mean "as soon as that month
 	# arrives" and not "that month, same day/hour/minute/second as now".
 
-	def lim12(): return 12
-	def lim30(): return monthrange(p.res.year,p.res.month)[1]
-	def lim24(): return 23
-	def lim60(): return 59
-
-	def check_year(force=False):
-		clear_fields={'second':0,'minute':0,'hour':0,'day':1,'month':1}
-		# This is simpler, as there's nothing a year is owerflowing into.
-		# (I do hope that this won't change any time soon …)
-		if p.yr is None:
-			if force:
-				p.res = p.res.replace(year=p.res.year+1, **clear_fields)
-		else:
-			p.res = p.res.replace(year=p.yr, **clear_fields)
-
-	def step(sn,ln, beg,lim, nextfn, clear_fields): # shortname, longname, limit
-		def next_whatever(force=False):
-			goal = getattr(p,sn)
-			real = getattr(p.res,ln)
-			if goal is None:
-				rgoal = real # (a) and (b)
-			elif goal < 0:
-				rgoal = lim()+goal+1
+	def _check(self, p, i, force=False):
+		"""Adjust p.res so that field #i (and, if need be, those above) match."""
+		if i == _YEAR:
+			# This is simpler, as there's nothing a year is owerflowing into.
+			# (I do hope that this won't change any time soon …)
+			if p.yr is None:
+				if force:
+					p.res = p.res.replace(year=p.res.year+1, second=0,minute=0,hour=0,day=1,month=1)
 			else:
-				rgoal = goal
-			if force:
-				rgoal += 1 # (b) and (d)
+				p.res = p.res.replace(year=p.yr, second=0,minute=0,hour=0,day=1,month=1)
+			return
 
-			if real > rgoal or rgoal > lim(): # needs increasing: (b), maybe (c)/(d)
-				h = {ln: beg}
+		sn,ln,beg,lim,clear_fields = _fields[i]
+		goal = getattr(self,sn)
+		real = getattr(p.res,ln)
+		if lim is None:
+			lim = monthrange(p.res.year,p.res.month)[1]
+		if goal is None:
+			rgoal = real # (a) and (b)
+		elif goal < 0:
+			rgoal = lim+goal+1
+		else:
+			rgoal = goal
+		if force:
+			rgoal += 1 # (b) and (d)
+
+		if real > rgoal or rgoal > lim: # needs increasing: (b), maybe (c)/(d)
+			h = {ln: beg}
+			h.update(clear_fields)
+			p.res = p.res.replace(**h)
+			self._check(p, i-1, True)
+			force=False
+			if _fields[i][3] is None:
+				lim = monthrange(p.res.year,p.res.month)[1]
+			if rgoal > lim:
+				rgoal = beg
+		if force or goal is not None:
+			if real != rgoal: # otherwise we clear fields for no reason
+				h = {ln: rgoal}
 				h.update(clear_fields)
 				p.res = p.res.replace(**h)
-				nextfn(True)
-				force=False
-				if rgoal > lim():
-					rgoal = beg
-			if force or goal is not None:
-				if real != rgoal: # otherwise we clear fields for no reason
-					h = {ln: rgoal}
-					h.update(clear_fields)
-					p.res = p.res.replace(**h)
-			# … and if the goal is None, this is either (a),
-			# or 'our' value has been set to the beginning value, above
-		return next_whatever
-
-	check_month = step("mn","month",1,lim12,check_year,{'second':0,'minute':0,'hour':0,'day':1})
-	check_day   = step("dy","day",1,lim30,check_month,{'second':0,'minute':0,'hour':0})
-	check_hour  = step("h","hour",0,lim24,check_day,{'second':0,'minute':0})
-	check_min   = step("m","minute",0,lim60,check_hour,{'second':0})
-	check_sec   = step("s","second",0,lim60,check_min,{})
-		
-
-	# Intermission: figure out how long until the condition is False
-	if invert:
+		# … and if the goal is None, this is either (a),
+		# or 'our' value has been set to the beginning value, above
+
+	def _nth(self, p):
+		if self.nth > 0:
+			return 1 + ((p.res.day-1) // 7)
+		else:
+			return -1 - ((monthrange(p.res.year,p.res.month)[1]-p.res.day) // 7)
+
+	def _upd(self, p, delta):
+		if not delta: return
+		p.res = p.res + dt.timedelta(delta)
+		if p.res > p.now:
+			p.res = p.res.replace(hour=0,minute=0,second=0)
+		if p.res < p.now:
+			p.res = p.now
+
+	def next_match(self, now=None):
+		"""Find the next time which is in the future and matches."""
+		p = self._start(now)
+
+		# first, check absolute values
+		self._check(p,_YEAR)
+		self._check(p,_MONTH)
+		self._check(p,_DAY)
+
+		# Next: the weekday-related stuff. We assume, for convenience, that
+		# any conflicting specifications simply mean "afterwards".
+
+		# self.wk : week of the year (1…53)
+		# self.dow : day of the week (Thursday)
+		# self.nth : which day in the week (i.e. 1st Monday)
+		if self.wk: # week of the year
+			yr,wk,dow = p.res.isocalendar()
+			if self.wk < wk:
+				self._check(p,_YEAR,True)
+				yr,wk,dow = p.res.isocalendar()
+			self._upd(p, 7*(self.wk-wk))
+			if self.mn is None and self.dy is None:
+				# No month/day specified, so assume that we can go back a bit.
+				# (iso day 1 of week 1 of year X may be in December X-1.)
+				# … but not into the past, please!
+				self._upd(p, 1-dow)
+				if p.res < p.now: p.res = p.now
+
+		if self.dow is not None:
+			yr,wk,dow = p.res.isocalendar()
+			dow -= 1 # 1…7 ⇒ 0…6
+			if self.dow < dow:
+				dow -= 7 # next week
+			self._upd(p, self.dow-dow)
+
+		if self.nth: # may be zero
+			if self.nth < self._nth(p):
+				self._upd(p, 7*(4+self.nth-self._nth(p)))
+				# That will take me to the first.
+				if self.nth < self._nth(p): # five weekdays in this month!
+					self._upd(p, 7)
+					# … except when it doesn't.
+			if self.nth > self._nth(p):
+				self._upd(p, 7*(self.nth-self._nth(p)))
+				# Either way, as if by magic, we now get the correct date. 
+
+		self._check(p,_HOUR)
+		self._check(p,_MIN)
+		self._check(p,_SEC)
+
+		return p.res
+
+	def next_nonmatch(self, now=None):
+		"""Find out how long until the condition is False."""
+		p = self._start(now)
 		p.delta = None
-		def get_delta(fn, sn=None,ln=None):
+
+		def get_delta(i, goal, ln):
 			if p.delta is not None and p.delta == p.now: return
-			if getattr(p,sn) is None:
+			if goal is None:
 				return
-			if getattr(p.now,ln) != getattr(p,sn):
+			if getattr(p.now,ln) != goal:
 				p.delta = p.now
 				return
 			p.res = p.now
-			fn(True)
+			self._check(p,i,True)
 			d = p.res
 			if p.delta is None or p.delta > d: p.delta = d
 
-		get_delta(check_year,"yr","year")
-		get_delta(check_month,"mn","month")
-		get_delta(check_day,"dy","day")
+		get_delta(_YEAR,p.yr,"year")
+		get_delta(_MONTH,self.mn,"month")
+		get_delta(_DAY,self.dy,"day")
 		if p.delta is not None and p.delta == p.now: return p.now
 
-		get_delta(check_hour,"h","hour")
-		get_delta(check_min,"m","minute")
-		get_delta(check_sec,"s","second")
+		get_delta(_HOUR,self.h,"hour")
+		get_delta(_MIN,self.m,"minute")
+		get_delta(_SEC,self.s,"second")
 		if p.delta is not None and p.delta == p.now: return p.now
 
-		if p.wk is not None: # week of the year
+		if self.wk is not None: # week of the year
 			yr,wk,dow = p.now.isocalendar()
-			if p.wk != wk: return p.now
+			if self.wk != wk: return p.now
 			p.res = p.now
-			check_day(True)
+			self._check(p,_DAY,True)
 			d = p.res + dt.timedelta(7-dow) # until end-of-week
 			if p.delta is None or p.delta > d: p.delta = d
-		if p.dow is not None:
+		if self.dow is not None:
 			yr,wk,dow = p.now.isocalendar()
 			dow -= 1 # 1…7 ⇒ 0…6
-			if p.dow != dow: return p.now
+			if self.dow != dow: return p.now
 			p.res = p.now
-			check_day(True)
+			self._check(p,_DAY,True)
 			if p.delta is None or p.delta > p.res: p.delta = p.res
-		if p.nth: # may be zero
+		if self.nth: # may be zero
 			p.res = p.now
-			if p.nth != nth():
+			if self.nth != self._nth(p):
 				return p.now
 
 		return p.delta
 
 
-	# Now here's the fun part: figure out how long until the condition is true
-	# first, check absolute values
-	check_year (False)
-	check_month(False)
-	check_day  (False)
-
-	# Next: the weekday-related stuff. We assume, for convenience, that
-	# any conflicting specifications simply mean "afterwards".
-
-	# p.wk : week of the year (1…53)
-	# p.dow : day of the week (Thursday)
-	# p.nth : which day in the week (i.e. 1st Monday)
-	def upd(delta):
-		if not delta: return
-		p.res = p.res + dt.timedelta(delta)
-		if p.res > p.now:
-			p.res = p.res.replace(hour=0,minute=0,second=0)
-		if p.res < p.now:
-			p.res = p.now
-		
-	def nth():
-		if p.nth > 0:
-			return 1 + ((p.res.day-1) // 7)
-		else:
-			return -1 - ((lim30()-p.res.day) // 7)
-
-	if p.wk: # week of the year
-		yr,wk,dow = p.res.isocalendar()
-		if p.wk < wk:
-			check_year(True)
-			yr,wk,dow = p.res.isocalendar()
-		upd(7*(p.wk-wk))
-		if p.mn is None and p.dy is None:
-			# No month/day specified, so assume that we can go back a bit.
-			# (iso day 1 of week 1 of year X may be in December X-1.)
-			# … but not into the past, please!
-			upd(1-dow)
-			if p.res < p.now: p.res = p.now
-
-	if p.dow is not None:
-		yr,wk,dow = p.res.isocalendar()
-		dow -= 1 # 1…7 ⇒ 0…6
-		if p.dow < dow:
-			dow -= 7 # next week
-		upd(p.dow-dow)
-
-	if p.nth: # may be zero
-		if p.nth < nth():
-			upd(7*(4+p.nth-nth()))
-			# That will take me to the first.
-			if p.nth < nth(): # five weekdays in this month!
-				upd(7)
-				# … except when it doesn't.
-		if p.nth > nth():
-			upd(7*(p.nth-nth()))
-			# Either way, as if by magic, we now get the correct date. 
-
-	check_hour (False)
-	check_min  (False)
-	check_sec  (False)
-
-	return p.res
+time_specs = OrderedDict() # LRU cache
+time_specs_max = 500
 
+def time_spec(args):
+	"""Return the (shared) TimeSpec for these arguments."""
+	try:
+		key = tuple(args)
+		spec = time_specs.pop(key)
+	except KeyError:
+		spec = TimeSpec(key)
+		if len(time_specs) >= time_specs_max:
+			time_specs.popitem(last=False)
+	except TypeError: # unhashable
+		return TimeSpec(args)
+	time_specs[key] = spec
+	return spec
 
+def time_until(args, now=None, invert=False):
+	"""\
+		Find the next time which is in the future and matches the arguments.
+		If "invert" is True, find the next time which does *not*.
+		"""
+	spec = time_spec(args)
+	if invert:
+		return spec.next_nonmatch(now)
+	return spec.next_match(now)
@@ -24,10 +24,10 @@ This code contains the framework for timing regular events.
 
 from homevent.statement import AttributedStatement, Statement
 from homevent.event import Event
-from homevent.run import process_event,process_failure
+from homevent.run import process_event,process_failure,simple_event
 from homevent.reactor import shutdown_event
 from homevent.times import time_delta, time_until, unixdelta, now, \
-	humandelta
+	humandelta, simple_time_delta
 from homevent.base import Name
 from homevent.twist import callLater, fix_exception
 from homevent.context import Context
@@ -36,6 +36,7 @@ from homevent.logging import log,TRACE,DEBUG,ERROR
 from homevent.collect import Collection,Collected
 
 from time import time
+from heapq import heappush,heappop
 import os
 import datetime as dt
 
@@ -64,6 +65,88 @@ class AlreadyRunningError(TimeslotError):
     text = u"A The timer ‹%s› is already active"
 
 
+class SlotCall(object):
+	"""A scheduled transition of a Timeslot"""
+	__slots__ = ("time","slot","proc")
+
+	def __init__(self,time,slot,proc):
+		self.time = time
+		self.slot = slot
+		self.proc = proc
+
+	def cancel(self):
+		self.proc = None
+
+class SlotScheduler(object):
+	"""\
+		All timeslots' transitions are kept in a single heap, with one
+		timer for whichever is due first. Transitions which are due at
+		the same time (give or take a tick) run together.
+
+		The scheduler also keeps track of which slots are open, and when
+		their current slot began and will end.
+		"""
+	tick = dt.timedelta(0,0.001)
+
+	def __init__(self):
+		self.heap = []
+		self.seq = 0
+		self.timer = None
+		self.timer_at = None
+		self.open = {} # slot => (begin,end)
+
+	def add(self, slot, tm, proc):
+		"""Call ‹proc› at ‹tm›. Returns something you can cancel()."""
+		c = SlotCall(tm,slot,proc)
+		self.seq += 1
+		heappush(self.heap,(tm,self.seq,c))
+		if self.timer_at is None or tm < self.timer_at:
+			self._arm(tm)
+		return c
+
+	def _arm(self, tm):
+		if self.timer is not None:
+			self.timer.cancel()
+		self.timer_at = tm
+		self.timer = callLater(False,tm, self._run)
+
+	def _run(self):
+		self.timer = None
+		self.timer_at = None
+		heap = self.heap
+		t = now()+self.tick
+		due = []
+		while heap and heap[0][0] <= t:
+			c = heappop(heap)[2]
+			if c.proc is not None:
+				due.append(c)
+		if len(due) > 1:
+			log(TRACE,"timeslot batch",len(due))
+
+		for c in due:
+			proc,c.proc = c.proc,None
+			if proc is None: # cancelled by an earlier one
+				continue
+			try:
+				proc()
+			except Exception as e:
+				fix_exception(e)
+				process_failure(e)
+
+		while heap and heap[0][2].proc is None:
+			heappop(heap)
+		if heap and (self.timer_at is None or heap[0][0] < self.timer_at):
+			self._arm(heap[0][0])
+
+	def open_slots(self, tm=None):
+		"""The timeslots which are open at ‹tm› (default: now)"""
+		if tm is None:
+			return sorted(self.open.iterkeys(), key=lambda s:s.name)
+		return sorted((s for s,(b,e) in self.open.iteritems() if b <= tm < e), key=lambda s:s.name)
+
+scheduler = SlotScheduler()
+
+
 class Timeslot(Collected):
 	"""This is the thing that watches."""
 	storage = Timeslots.storage
@@ -83,6 +166,8 @@ class Timeslot(Collected):
 
 	duration = 1 # length of slot
 	interval = None # time between slots; set externally
+	_step = None # cached length of 'interval', if constant
+	_step_for = None
 
 	def __init__(self,parent,name):
 		self.ctx = parent.ctx
@@ -130,7 +215,8 @@ class Timeslot(Collected):
 			if self.running == "pre":
 				self.running = "during"
 				self.next += dt.timedelta(0,self.duration)
-				self.slotter = callLater(False,self.next, self.do_post)
+				scheduler.open[self] = (self.last,self.next)
+				self.slotter = scheduler.add(self, self.next, self.do_post)
 			elif self.running not in ("off","error"):
 				log(ERROR,"timeslot error pre2",self.running,*self.name)
 			else:
@@ -143,7 +229,8 @@ class Timeslot(Collected):
 		self.down()
 		self.running = "during"
 		self.next = now()+dt.timedelta(0,self.duration/2)
-		self.slotter = callLater(False,self.next, self.do_post)
+		scheduler.open[self] = (now(),self.next)
+		self.slotter = scheduler.add(self, self.next, self.do_post)
 	
 	def do_post(self):
 		self.slotter = None
@@ -156,8 +243,9 @@ class Timeslot(Collected):
 			process_event(Event(self.ctx,"timeslot","end",*self.name))
 			if self.running == "post":
 				self.running = "next"
-				self.next = time_delta(self.interval, now=self.next)-dt.timedelta(0,self.duration)
-				self.waiter = callLater(False, self.next, self.do_pre)
+				scheduler.open.pop(self,None)
+				self.next = self._after(self.next)-dt.timedelta(0,self.duration)
+				self.waiter = scheduler.add(self, self.next, self.do_pre)
 			elif self.running not in("off","error"):
 				log(ERROR,"timeslot error post2",self.running,*self.name)
 		except Exception as e:
@@ -178,6 +266,22 @@ class Timeslot(Collected):
 		return
 
 
+	def _after(self, tm):
+		"""When does the interval starting at ‹tm› end?"""
+		step = self._step
+		if step is None or self._step_for is not self.interval:
+			try:
+				aligned = float(self.interval[0]) > 1000000000 # see time_delta()
+			except (ValueError,TypeError,IndexError):
+				aligned = False
+			if not aligned:
+				step = dt.timedelta(0,simple_time_delta(list(self.interval)))
+			self._step = step
+			self._step_for = self.interval
+		if step is None or tm is None:
+			return time_delta(self.interval, now=tm)
+		return tm+step
+
 	def is_up(self):
 		return self.running not in ("off","error")
 	def is_in(self):
@@ -193,8 +297,8 @@ class Timeslot(Collected):
 			self.do_sync()
 		else:
 			self.running = "next"
-			self.next = time_delta(self.interval, now=self.last)
-			self.waiter = callLater(False, self.next, self.do_pre)
+			self.next = self._after(self.last)
+			self.waiter = scheduler.add(self, self.next, self.do_pre)
 #			self.parent.slot_up()
 		
 	def maybe_up(self, resync = False):
@@ -202,8 +306,8 @@ class Timeslot(Collected):
 			return
 		if self.last is not None:
 			self.running = "next"
-			self.next = time_delta(self.interval, now=self.last)
-			self.waiter = callLater(False, self.next, self.do_pre)
+			self.next = self._after(self.last)
+			self.waiter = scheduler.add(self, self.next, self.do_pre)
 
 	def down(self):
 		if self.waiter:
@@ -213,6 +317,7 @@ class Timeslot(Collected):
 			self.slotter.cancel()
 			self.slotter = None
 #		self.parent.slot_down()
+		scheduler.open.pop(self,None)
 		self.running = "off"
 		self.next = None
 
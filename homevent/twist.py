@@ -31,6 +31,9 @@ from homevent.geventreactor import DelayedCall,deferToGreenlet
 
 import gevent
 from gevent.event import AsyncResult
+from gevent.queue import Queue,Empty
+
+from heapq import heappush,heappop,heapify
 
 from posix import write
 import sys
@@ -150,7 +153,7 @@ def sleepUntil(force,delta):
 	if delta < 0: # we're late
 		delta = 0 # but let's hope not too late
 
-	if "HOMEVENT_TEST" in os.environ:
+	if TESTING:
 		ev = AsyncResult()
 		callLater(force,delta, ev.set,None)
 		ev.get(block=True)
@@ -158,7 +161,212 @@ def sleepUntil(force,delta):
 		gevent.sleep(delta)
 
 
+### Timers
+
+# Every timeout used to be a DelayedCall on the reactor's (sorted-list)
+# call queue, which spawned a new greenlet when it fired. With thousands
+# of PWMs and timeslots that's a lot of churn. Instead, all timers live
+# in a heap which keeps exactly one DelayedCall on the reactor, for the
+# earliest entry. Due timers are handed to a small set of dispatcher
+# greenlets which are re-used; handlers may block, so running them
+# strictly one after the other is not an option.
+
+class Timer(object):
+	"""\
+		A handle for a callLater() timeout.
+		Cancelling it just marks the heap entry as stale.
+		"""
+	__slots__ = ("queue","time","seq","proc","a","k")
+
+	def __init__(self,queue,time,proc,a,k):
+		self.queue = queue
+		self.time = time
+		self.proc = proc
+		self.a = a
+		self.k = k
+		self.seq = None # not in the heap
+
+	def getTime(self):
+		return self.time
+
+	def active(self):
+		return self.proc is not None
+
+	def cancel(self):
+		"""Forget about this timer. Does nothing if it already ran."""
+		if self.proc is None:
+			return
+		self.proc = self.a = self.k = None
+		if self.seq is not None:
+			self.queue._stale()
+
+	def reset(self,delta):
+		"""Run this timer 'delta' seconds from now instead."""
+		if self.proc is None:
+			raise RuntimeError("This timer is no longer active",self)
+		if self.seq is not None:
+			self.queue._stale()
+		self.queue._push(self, self.queue.seconds()+delta)
+
+	def delay(self,delta):
+		"""Run this timer 'delta' seconds later than planned."""
+		if self.proc is None:
+			raise RuntimeError("This timer is no longer active",self)
+		if self.seq is not None:
+			self.queue._stale()
+		self.queue._push(self, self.time+delta)
+
+	def __repr__(self):
+		return "<Timer %s %s>" % (self.time,self.proc)
+
+
+class TimerQueue(object):
+	"""\
+		A heap of timers, plus the dispatchers which run them.
+		"""
+	late_limit = 0.1 # seconds after which a timer counts as late
+	min_compact = 100 # don't bother rebuilding the heap when it's small
+
+	def __init__(self,name,seconds,delayed_call):
+		self.name = name
+		self.seconds = seconds
+		self.delayed_call = delayed_call
+
+		self.heap = []
+		self.seq = 0
+		self.n_stale = 0
+		self.wakeup = None # the DelayedCall on the reactor
+		self.ready = Queue()
+		self.n_idle = 0 # dispatchers waiting for work
+		self.n_dispatchers = 0
+
+		self.n_fired = 0
+		self.n_late = 0
+		self.late_max = 0
+
+	def __repr__(self):
+		return "<TimerQueue %s: %d>" % (self.name,self.pending)
+
+	@property
+	def pending(self):
+		return len(self.heap)-self.n_stale
+
+	def add(self,delta,proc,a,k):
+		t = Timer(self,None,proc,a,k)
+		self._push(t, self.seconds()+delta)
+		return t
+
+	def _push(self,t,time):
+		self.seq += 1
+		t.time = time
+		t.seq = self.seq
+		heappush(self.heap,(time,self.seq,t))
+		if self.wakeup is None or self.wakeup.time > time:
+			self._arm(time)
+
+	def _stale(self):
+		self.n_stale += 1
+		if self.n_stale > self.min_compact and self.n_stale*2 > len(self.heap):
+			self.heap = [e for e in self.heap if e[2].seq == e[1] and e[2].proc is not None]
+			heapify(self.heap)
+			self.n_stale = 0
+
+	def _arm(self,time):
+		w = self.wakeup
+		if w is not None:
+			self.wakeup = None
+			if w.active():
+				w.cancel()
+		self.wakeup = self.delayed_call(reactor,time, self._fire,(),{},seconds=self.seconds)
+		reactor.callLater(self.wakeup)
+
+	def _fire(self):
+		"""Called by the reactor: hand all due timers to the dispatchers."""
+		self.wakeup = None
+		heap = self.heap
+		now = self.seconds()
+		while heap:
+			time,seq,t = heap[0]
+			if time > now:
+				break
+			heappop(heap)
+			if t.seq != seq or t.proc is None:
+				self.n_stale -= 1
+				continue
+			late = now-time
+			if late > self.late_limit:
+				self.n_late += 1
+				if self.late_max < late:
+					self.late_max = late
+			t.seq = None
+			self.ready.put(t)
+
+		n = self.ready.qsize()-self.n_idle
+		while n > 0:
+			n -= 1
+			self.n_dispatchers += 1
+			gevent.spawn(self._dispatch)
+		if heap:
+			self._arm(heap[0][0])
+
+	def _dispatch(self):
+		try:
+			while True:
+				self.n_idle += 1
+				try:
+					t = self.ready.get(timeout=10)
+				except Empty:
+					# Keep one dispatcher around.
+					if self.ready.qsize() or self.n_idle <= 1:
+						continue
+					return
+				finally:
+					self.n_idle -= 1
+
+				proc,a,k = t.proc,t.a,t.k
+				if proc is None or t.seq is not None:
+					continue # cancelled or re-armed while queued
+				t.proc = t.a = t.k = None
+				self.n_fired += 1
+				try:
+					proc(*a,**k)
+				except Exception as e:
+					from homevent.run import process_failure
+					fix_exception(e)
+					process_failure(e)
+		finally:
+			self.n_dispatchers -= 1
+
+	def list(self):
+		yield ("pending",self.pending)
+		yield ("fired",self.n_fired)
+		yield ("late",self.n_late)
+		if self.n_late:
+			yield ("late max",self.late_max)
+		yield ("dispatchers",self.n_dispatchers)
+		yield ("idle",self.n_idle)
+		if self.heap:
+			yield ("next",self.heap[0][0])
+
+if TESTING:
+	from homevent.testreactor import FakeDelayedCall
+	timer_queues = (
+		TimerQueue("real",reactor.realSeconds,DelayedCall),
+		TimerQueue("fake",reactor.seconds,FakeDelayedCall),
+	)
+else:
+	timer_queues = (
+		TimerQueue("real",reactor.seconds,DelayedCall),
+	)
+
 def callLater(force,delta,p,*a,**k):
+	"""\
+		Run p(*a,**k) after 'delta', which may be a number of seconds,
+		a timedelta or a datetime.
+		Returns a Timer, which can be cancelled.
+
+		When testing, timeouts are only real when 'force' is set.
+		"""
 	from homevent.times import unixdelta,now
 
 	if isinstance(delta,dt.datetime):
@@ -167,20 +375,8 @@ def callLater(force,delta,p,*a,**k):
 		delta = unixdelta(delta)
 	if delta < 0: # we're late
 		delta = 0 # but let's hope not too late
-	if "HOMEVENT_TEST" in os.environ:
-		if force:
-			cl = DelayedCall
-			delta += reactor.realSeconds()
-		else:
-			from homevent.testreactor import FakeDelayedCall
-			cl = FakeDelayedCall
-			delta += reactor.seconds()
-	else:
-		cl = DelayedCall
-		delta += reactor.seconds()
-	cl = cl(reactor,delta, gevent.spawn,(p,)+a,k,seconds=reactor.seconds)
-
-	return reactor.callLater(cl)
+	q = timer_queues[0 if force else -1]
+	return q.add(delta,p,a,k)
 
 
 # Allow a Deferred to be called with another Deferred
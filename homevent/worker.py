@@ -198,7 +198,9 @@ class WorkSequence(WorkItem):
 		self.in_worker = None
 		res = None
 
-		from homevent.logging import log_run,log_halted
+		from homevent.logging import log_run,log_halted,wants_events,TRACE
+		# Only build a log_run for steps somebody will see
+		logged = wants_events(TRACE)
 		try:
 			event = self.event
 		except Exception as ex:
@@ -219,7 +221,8 @@ class WorkSequence(WorkItem):
 
 			try:
 				if not excepting or isinstance(w,ExcWorker):
-					log_run(self,w,step)
+					if logged and w.prio >= MIN_PRIO and w.prio < MAX_PRIO:
+						log_run(self,w,step)
 					r = w.process(event=self.event, queue=self)
 			except HaltSequence as ex:
 				fix_exception(ex)
@@ -340,6 +343,13 @@ class Worker(WorkItem):
 		"""
 	prio = (MIN_PRIO+MAX_PRIO)//2
 	match_count = 0
+
+	# The leading words of any event this worker may be interested in,
+	# None being a wildcard. homevent.run uses this to index workers;
+	# does_event() will not be called for events that don't match.
+	# The default (None) means that every event is checked.
+	event_words = None
+
 	def __init__(self, name):
 		"""\
 			Initialize this worker.
@@ -17,7 +17,7 @@
 from __future__ import division,absolute_import
 from rainman.models import Model
 from rainman.models.site import Site
-from rainman.utils import RangeMixin,str_tz
+from rainman.utils import RangeMixin,str_tz,ranges
 from django.db import models as m
 from datetime import timedelta
 
@@ -35,6 +35,7 @@ class Controller(Model,RangeMixin):
 	location = m.CharField(max_length=200, help_text="How to identify the controller (host name?)")
 	max_on = m.IntegerField(default=3, help_text="number of valves that can be on at any one time")
 
+	@ranges
 	def _range(self,start,end, add=0):
 		if not isinstance(add,timedelta):
 			add = timedelta(0,add)
@@ -17,7 +17,7 @@
 from __future__ import division,absolute_import
 from rainman.models import Model
 from django.db import models as m
-from rainman.utils import now, range_union,range_intersection, RangeMixin
+from rainman.utils import now, range_union,range_intersection,ranges, RangeMixin
 from datetime import timedelta
 from homevent.times import time_until
 from django.utils.timezone import get_current_timezone,make_aware,make_naive
@@ -53,6 +53,7 @@ class DayTime(Model,RangeMixin):
 	descr = m.CharField(max_length=200)
 	day = m.ForeignKey(Day,related_name="times")
 
+	@ranges
 	def _range(self,start,end):
 		#
 		#txt = self.descr.split()
@@ -16,7 +16,7 @@
 
 from __future__ import division,absolute_import
 from rainman.models import Model
-from rainman.utils import RangeMixin
+from rainman.utils import RangeMixin,ranges
 from rainman.models.meter import Meter
 from rainman.models.site import Site
 from django.db import models as m
@@ -40,6 +40,7 @@ class Feed(Meter,RangeMixin):
 		self.db_max_flow_wait = val.total_seconds()
 	max_flow_wait = property(_get_max_flow_wait,_set_max_flow_wait)
 
+	@ranges
 	def _range(self,start,end,plusflow,add=0):
 		"""Return a range of times which accept this additional flow"""
 		if not isinstance(add,timedelta):
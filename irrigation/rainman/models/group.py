@@ -19,7 +19,7 @@ from rainman.models import Model
 from rainman.models.site import Site
 from rainman.models.valve import Valve
 from rainman.models.day import DayRange
-from rainman.utils import now,RangeMixin, range_union,range_intersection,range_invert, str_tz
+from rainman.utils import now,RangeMixin, range_union,range_intersection,range_invert,ranges, str_tz
 from django.db import models as m
 from datetime import timedelta
 
@@ -90,6 +90,7 @@ class Group(Model,RangeMixin):
 
 	adj = m.FloatField(blank=True,null=True,help_text="Adjustment for these valves")
 
+	@ranges
 	def _not_blocked_range(self,start,end):
 		for x in self.overrides.filter(start__gte=start-timedelta(1,0),start__lt=end,allowed=False).order_by("start"):
 			if x.end <= start:
@@ -100,6 +101,7 @@ class Group(Model,RangeMixin):
 		if end>start:
 			yield (start,end-start)
 
+	@ranges
 	def _allowed_range(self,start,end):
 		for x in self.overrides.filter(start__gte=start-timedelta(1,0),start__lt=end,allowed=True).order_by("start"):
 			if x.end <= start:
@@ -20,7 +20,7 @@ from rainman.models.controller import Controller
 from rainman.models.feed import Feed
 from rainman.models.env import EnvGroup
 from django.db import models as m
-from rainman.utils import now, range_intersection,range_union,range_invert, RangeMixin
+from rainman.utils import now, range_intersection,range_union,range_invert,ranges, RangeMixin
 from datetime import timedelta
 
 class Valve(Model,RangeMixin):
@@ -140,6 +140,7 @@ class Valve(Model,RangeMixin):
 		r.append(self.feed._range(start,end,self.flow,add=add))
 		return range_intersection(*r)
 	
+	@ranges
 	def _not_blocked_range(self,start,end):
 		for x in self.overrides.filter(start__gte=start-timedelta(1,0),start__lt=end,running=False).order_by("start"):
 			if x.end <= start:
@@ -150,6 +151,7 @@ class Valve(Model,RangeMixin):
 		if end>start:
 			yield (start,end-start)
 				
+	@ranges
 	def _not_scheduled(self,start,end):
 		for x in self.schedules.filter(start__gte=start-timedelta(1,0),start__lt=end).order_by("start"):
 			if x.end <= start:
@@ -160,6 +162,7 @@ class Valve(Model,RangeMixin):
 		if end>start:
 			yield (start,end-start)
 				
+	@ranges
 	def _forced_range(self,start,end):
 		for x in self.overrides.filter(start__gte=start-timedelta(1,0),start__lt=end,running=True).order_by("start"):
 			if x.end <= start:
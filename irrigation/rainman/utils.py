@@ -21,6 +21,9 @@
 
 from datetime import datetime,timedelta
 from django.utils.timezone import utc,get_current_timezone
+from array import array
+from functools import wraps
+from heapq import merge
 #from django.utils.thread_support import currentThread
 from threading import currentThread
 from weakref import WeakValueDictionary
@@ -86,7 +89,6 @@ class RangeMixin(object):
 		end = start+timedelta(days,0)
 		return self._range(start,end,**k)
 
-# Work with date (or whatever) ranges.
 class NotYet: pass
 class StoredIter(object):
 	def __init__(self,it):
@@ -105,134 +107,220 @@ class StoredIter(object):
 		if self.saved is NotYet:
 			self.saved = self.it.next()
 		return self.saved
-		
-def range_coalesce(it):
-	"""Returns an iterator which returns the union of overlapping (start,lengt) pairs."""
-	it = iter(it)
-	ra,rl = it.next()
-	while True:
-		try:
-			sa,sl = it.next()
-		except StopIteration:
-			yield ra,rl
-			return
-		assert ra <= sa
-		re = ra+rl
-		se = sa+sl
 
-		if re < sa:
-			yield ra,rl
-			ra,rl=sa,sl
-			continue
-		if re < se:
-			rl = se-ra
+# Work with date (or whatever) ranges.
+_US = 1000000
+_EPOCH = datetime(1970,1,1,tzinfo=utc)
+_NAIVE_EPOCH = datetime(1970,1,1)
 
+def _to_int(x):
+	"""datetime and timedelta to microseconds; numbers stay as they are"""
+	if isinstance(x,datetime):
+		x -= _EPOCH if x.tzinfo is not None else _NAIVE_EPOCH
+	if isinstance(x,timedelta):
+		return (x.days*86400+x.seconds)*_US + x.microseconds
+	return x
 
-def range_union(*a):
+def _array(vals):
+	try:
+		return array("l",vals)
+	except (TypeError,OverflowError):
+		# floats, or epoch microseconds on a 32-bit system;
+		# doubles are exact up to 2**53 (some time in 2255)
+		return array("d",vals)
+
+class Ranges(object):
 	"""\
-		Return an iterator which yields a row of start+length tuples
-		which are the union of all the start+length tuples in a.
+		A set of disjoint (start,length) ranges.
+
+		Starts and ends are kept, sorted, in two arrays of integers
+		(microseconds since the epoch, if you use datetimes), so sets can
+		be combined with a linear merge instead of a chain of generators.
+		A Ranges object can be iterated as often as you like; it yields
+		(start,length) pairs, as datetime/timedelta if it was built from
+		datetimes. These are in the time zone of the first datetime it
+		has seen, or naive if that was naive. (Naive datetimes are taken
+		to be in UTC, so don't mix them with aware ones.)
+
+		Ranges which touch or overlap are merged.
 		"""
-	#print "UNION"
-	res = range_coalesce(_range_union([StoredIter(range_coalesce(ax)) for ax in a]))
-	#res = list(res)
-	#print "UNION = ",res
+	__slots__ = ("starts","ends","dates","tz")
+
+	def __init__(self, pairs=()):
+		self.dates = False
+		self.tz = None
+		r = []
+		for a,l in pairs:
+			# this is the hot loop, so _to_int() is inlined
+			if isinstance(a,datetime):
+				if not self.dates:
+					self.dates = True
+					self.tz = a.tzinfo
+				a -= _EPOCH if a.tzinfo is not None else _NAIVE_EPOCH
+			if isinstance(a,timedelta):
+				e = a+l
+				a = (a.days*86400+a.seconds)*_US + a.microseconds
+				e = (e.days*86400+e.seconds)*_US + e.microseconds
+			else:
+				e = a+_to_int(l)
+			if e > a:
+				r.append((a,e))
+		r.sort()
+		self._set(_coalesce(r))
+
+	def _set(self, r):
+		self.starts = _array([a for a,e in r])
+		self.ends = _array([e for a,e in r])
+
+	@classmethod
+	def _new(cls, r, dates, tz=None):
+		"""Build from sorted, disjoint (start,end) integer pairs."""
+		res = cls.__new__(cls)
+		res.dates = dates
+		res.tz = tz
+		res._set(r)
+		return res
+
+	@classmethod
+	def of(cls, x):
+		"""Convert anything which yields (start,length) pairs."""
+		if isinstance(x,cls):
+			return x
+		return cls(x)
+
+	def _pairs(self):
+		return zip(self.starts,self.ends)
+
+	def __iter__(self):
+		if not self.dates:
+			for a,e in self._pairs():
+				yield a,e-a
+			return
+		tz = self.tz
+		if tz is None:
+			epoch = _NAIVE_EPOCH
+		else:
+			epoch = _EPOCH
+			if tz is epoch.tzinfo:
+				tz = None
+		for a,e in self._pairs():
+			a,l = epoch+timedelta(0,0,a), timedelta(0,0,e-a)
+			if tz is not None:
+				a = a.astimezone(tz)
+			yield a,l
+
+	def __len__(self):
+		return len(self.starts)
+
+	def __nonzero__(self):
+		return len(self.starts) > 0
+
+	def __repr__(self):
+		return "Ranges(%r)" % (list(self),)
+
+	def __or__(self, other):
+		return range_union(self,other)
+
+	def __and__(self, other):
+		return range_intersection(self,other)
+
+	def invert(self, start, end):
+		"""The parts of [start,end) which are not in this set."""
+		a = _to_int(start)
+		return range_invert(start,_to_int(end)-a,self)
+
+def _coalesce(r):
+	"""Merge sorted (start,end) pairs which touch or overlap."""
+	res = []
+	for a,e in r:
+		if res and res[-1][1] >= a:
+			if res[-1][1] < e:
+				res[-1] = (res[-1][0],e)
+		else:
+			res.append((a,e))
 	return res
 
-def _range_union(head):
-	while head:
-		r,ra,rl = None,None,None
-		i=0
-		for ax in head:
-			try:
-				sa,sl = ax.stored
-			except StopIteration:
-				del head[i]
-				continue
-			if ra is None or ra > sa:
-				r,ra,rl,ri = ax,sa,sl,i
-			i += 1
-		if r is not None:
-			yield ra,rl
-			try:
-				r.next
-			except StopIteration:
-				del head[ri]
-	
+def _dates(a):
+	"""The dates flag and time zone of the first set of datetimes in a"""
+	for ax in a:
+		if ax.dates:
+			return True,ax.tz
+	return False,None
 
-def range_intersection(*a):
+def ranges(fn):
+	"""Decorator: the generator's (start,length) pairs, as a Ranges object"""
+	@wraps(fn)
+	def wrapper(*a,**k):
+		return Ranges(fn(*a,**k))
+	return wrapper
+
+def range_union(*a):
 	"""\
-		Return an iterator which yields a row of start+length tuples
-		which are the union of all the start+length tuples in a.
+		Return the union of all the sets of start+length tuples in a,
+		as a Ranges object.
 		"""
-	#print "INTERSECT"
-	res = _range_intersection(*a)
-	#res = list(res)
-	#print "INTERSECT = ",res
-	return res
+	a = [Ranges.of(ax) for ax in a]
+	r = _coalesce(merge(*(ax._pairs() for ax in a)))
+	return Ranges._new(r, *_dates(a))
 
-def _range_intersection(*a):
+def range_intersection(*a):
 	"""\
-		Return an iterator which yields a row of start+length tuples
-		which are the intersection of all the start+length tuples in a.
+		Return the intersection of all the sets of start+length tuples
+		in a, as a Ranges object.
 		"""
-	head = [StoredIter(range_coalesce(ax)) for ax in a]
-
-	ra,rl = head[0].stored
-
-	while True:
-		found=True
-		for ax in head:
-			sa,sl = ax.stored
-			while sa+sl <= ra:
-				sa,sl = ax.next
-			if rl is not None and ra+rl <= sa:
-				ra,rl=sa,sl
-				found=False
-				break
-			if ra<sa:
-				if rl is None:
-					rl=sl
-				else:
-					rl-=sa-ra
-				ra=sa
-			elif rl is None:
-				rl=sl-(ra-sa)
-			if ra+rl>sa+sl:
-				rl=sa+sl-ra
-
-			# test for rl<=0, except we don't know this type's zero
-			# so restart at sa/sl
-			if ra+rl<=ra:
-				if sa < ra:
-					rl = sl+sa-ra
-				else:
-					rl = sl
-				ra = sa
-				found=False
-				break
-		if found:
-			yield (ra,rl)
-			ra += rl
-			rl = None
+	a = [Ranges.of(ax) for ax in a]
+	dates,tz = _dates(a)
+	a.sort(key=len) # start with the smallest
+	r = a[0]._pairs()
+	for ax in a[1:]:
+		if not r:
+			break
+		r = _intersect(r,ax._pairs())
+	return Ranges._new(r, dates,tz)
+
+def _intersect(r,s):
+	res = []
+	i = j = 0
+	nr,ns = len(r),len(s)
+	while i < nr and j < ns:
+		ra,re = r[i]
+		sa,se = s[j]
+		a = ra if ra > sa else sa
+		e = re if re < se else se
+		if a < e:
+			res.append((a,e))
+		if re < se:
+			i += 1
+		else:
+			j += 1
+	return res
 
 def range_invert(ra,rl,a):
-	for sa,sl in a:
-		if sa > ra+rl:
-			return
-		if sa+sl <= ra:
+	"""\
+		Return the parts of (ra,rl) which are not covered by any
+		start+length tuple in a, as a Ranges object.
+		"""
+	a = Ranges.of(a)
+	if isinstance(ra,datetime):
+		dates,tz = True,ra.tzinfo
+	else:
+		dates,tz = a.dates,a.tz
+	ra = _to_int(ra)
+	re = ra+_to_int(rl)
+	res = []
+	for sa,se in a._pairs():
+		if se <= ra:
 			continue
-		if sa>ra:
-			yield ra,sa-ra
-			rl -= sa-ra + sl
-			ra = sa+sl
-		else:
-			sl -= ra-sa
-			ra += sl
-			rl -= sl
-		if ra+rl<=ra:
-			return
-	yield ra,rl
+		if sa >= re:
+			break
+		if sa > ra:
+			res.append((ra,sa))
+		ra = se
+		if ra >= re:
+			break
+	if ra < re:
+		res.append((ra,re))
+	return Ranges._new(res, dates,tz)
 
 if __name__ == "__main__":
 	a=((1,100),(220,100),(350,100),(500,100))
@@ -24,6 +24,8 @@ avg NAME...
 	- creates an averaging handler
 set avg VALUE NAME...
 	- sets a value
+feed avg NAME...
+	- sets a batch of values
 var avg X NAME...
 	- gets the current value
 
@@ -37,6 +39,7 @@ from homevent.base import Name,SName
 from homevent.collect import Collection,Collected
 
 from datetime import timedelta
+from math import fsum
 
 class Avgs(Collection):
     name = "avg"
@@ -76,19 +79,35 @@ class Avg(Collected):
 	def __repr__(self):
 		return u"‹%s %s %s›" % (self.__class__.__name__, self.name, self.avg)
 
-	def _calc(self, mod=False):
+	def _calc(self, mod=False, tm=None):
 		raise NotImplementedError("You need to implement the actual calculation in %s" % (self.__class__.__name__,))
 
-	def feed(self, value):
+	def feed(self, value, tm=None):
+		"""Add a sample. ‹tm› is the time it was taken (default: now)."""
 		self.prev_value = self.value
 		if value is None:
 			value = self.value
 			if value is None:
 				return
+		if tm is None:
+			tm = now()
 		self.value = value
-		self.value_tm = now()
+		self.value_tm = tm
 		self.total_samples += 1
-		self.avg = self._calc(True)
+		self.avg = self._calc(True, tm)
+
+	def feed_many(self, samples):
+		"""\
+			Add a batch of (time,value) samples, oldest first.
+			A time of None means "now".
+			"""
+		n = None
+		for tm,value in samples:
+			if tm is None:
+				if n is None:
+					n = now()
+				tm = n
+			self.feed(value, tm)
 		
 	def list(self):
 		yield ("name"," ".join(unicode(x) for x in self.name))
@@ -114,11 +133,12 @@ class TimeAvg(Avg):
 	mode = "time"
 	doc="Time-based equal-weight"
 
-	def weigth(self, mod=False):
+	def weigth(self, mod=False, tm=None):
 		if self.value_tm is None:
 			return None
-		n = now()
-		t = n-self.value_tm
+		if tm is None:
+			tm = now()
+		t = tm-self.value_tm
 		nt = self.total_tm+t
 		nts = unixdelta(nt)
 		if mod:
@@ -128,8 +148,8 @@ class TimeAvg(Avg):
 		else:
 			return unixdelta(t) / nts
 
-	def _calc(self, mod=False):
-		w = self.weigth(mod)
+	def _calc(self, mod=False, tm=None):
+		w = self.weigth(mod, tm)
 		if w is None:
 			return None
 		if w == 0:
@@ -140,7 +160,7 @@ class TimeAvg(Avg):
 			self.avg = r
 		return r
 
-	def feed(self, value):
+	def feed(self, value, tm=None):
 		"""Store the new value but calculate over the previous ones."""
 		self.prev_value = self.value
 		self.total_samples += 1
@@ -148,13 +168,15 @@ class TimeAvg(Avg):
 			value = self.value
 			if value is None:
 				return
+		if tm is None:
+			tm = now()
 		if self.avg is None:
 			self.avg = value
 			self.total_tm = timedelta(0)
 		else:
-			self._calc(True)
+			self._calc(True, tm)
 		self.value = value
-		self.value_tm = now()
+		self.value_tm = tm
 		
 class DecayTimeAvg(TimeAvg):
 	"""Decaying average, time-based weight"""
@@ -168,10 +190,12 @@ class DecayTimeAvg(TimeAvg):
 		self.p = float(weight)
 		self.p_base = float(base)
 
-	def weigth(self, mod=False):
+	def weigth(self, mod=False, tm=None):
 		if self.value_tm is None:
 			return None
-		t = now()-self.value_tm
+		if tm is None:
+			tm = now()
+		t = tm-self.value_tm
 		nt = unixdelta(t)
 		if nt == 0: ## called right after init'ing
 			return 0
@@ -197,7 +221,7 @@ class DecaySamplesAvg(Avg):
 		super(DecaySamplesAvg,self).__init__(parent,name)
 		self.p = float(weight)
 
-	def _calc(self, mod=False):
+	def _calc(self, mod=False, tm=None):
 		if self.avg is None:
 			return self.value
 		if not mod:
@@ -214,7 +238,13 @@ class DecaySamplesAvg(Avg):
 
 
 class MovingSamplesAvg(Avg):
-	"""Moving average, based on the last N values"""
+	"""\
+		Moving average, based on the last N values.
+
+		The values are kept in a ring buffer, together with their sum.
+		That sum is recalculated from scratch whenever the buffer has been
+		cycled through, so that rounding errors don't accumulate.
+		"""
 	mode="moving"
 	doc="Moving average; param: number of samples"
 	params = (1,1)
@@ -222,38 +252,52 @@ class MovingSamplesAvg(Avg):
 	def __init__(self,parent,name, samples):
 		super(MovingSamplesAvg,self).__init__(parent,name)
 		self.n = int(samples)
-		self.values = []
-
-	def _calc(self, mod=False):
+		self.values = [None]*self.n
+		self.pos = 0 # where the next value goes
+		self.count = 0 # number of valid values
+		self.sum = 0
+		self.n_drop = 0 # values discarded since the last re-summation
+
+	def samples(self):
+		"""The current values, oldest first"""
+		if self.count < self.n:
+			return self.values[:self.count]
+		return self.values[self.pos:]+self.values[:self.pos]
+
+	def _calc(self, mod=False, tm=None):
 		if not mod:
 			return self.avg
 
-		self.values.append(self.value)
-		if len(self.values) > self.n:
-			old_value = self.values.pop(0)
-			q = 1/self.n
-			avg = (self.avg-old_value*q)/(1-q)
+		if self.count == self.n:
+			self.sum -= self.values[self.pos]
+			self.n_drop += 1
 		else:
-			q = 1/len(self.values)
-			avg = self.avg
-
-		if self.avg is None:
-			self.avg = self.value
+			self.count += 1
+		self.values[self.pos] = self.value
+		self.pos += 1
+		if self.pos == self.n:
+			self.pos = 0
+
+		if self.n_drop >= self.n:
+			self.n_drop = 0
+			self.sum = fsum(self.values)
 		else:
-			self.avg = avg*(1-q)+self.value*q
+			self.sum += self.value
+		self.avg = self.sum/self.count
 		return self.avg
 
 	def list(self):
 		for r in super(MovingSamplesAvg,self).list():
 			yield r
-		yield ("samples",len(self.values))
+		values = self.samples()
+		yield ("samples",len(values))
 		yield ("max samples",self.n)
-		if len(self.values) < 7:
-			r = range(len(self.values))
+		if len(values) < 7:
+			r = range(len(values))
 		else:
-			r = range(3)+range(len(self.values)-3,len(self.values))
+			r = range(3)+range(len(values)-3,len(values))
 		for i in r:
-			yield ("sample "+str(i),self.values[i])
+			yield ("sample "+str(i),values[i])
 
 
 modes = {}
@@ -310,6 +354,60 @@ set avg VALUE NAME
 		m = Avgs[Name(*event[1:])]
 		m.feed(float(event[0]))
 
+class AvgFeed(AttributedStatement):
+	name="feed avg"
+	doc="feed a batch of values to an averager"
+	long_doc=u"""\
+feed avg NAME:
+	values ‹value›…
+	interval ‹seconds›
+	Sends all these values to this named averager, in one go.
+	They're assumed to have been measured ‹interval› seconds apart
+	(default: zero), the last one now.
+"""
+	interval = 0
+
+	def __init__(self,*a,**k):
+		super(AvgFeed,self).__init__(*a,**k)
+		self.values = []
+
+	def run(self,ctx,**k):
+		event = self.params(ctx)
+		if not len(event):
+			raise SyntaxError(u"Usage: feed avg ‹name…›")
+		m = Avgs[Name(*event)]
+		n = now()
+		last = len(self.values)-1
+		iv = self.interval
+		m.feed_many((n-timedelta(0,iv*(last-i)), v) for i,v in enumerate(self.values))
+
+@AvgFeed.register_statement
+class AvgFeedValues(Statement):
+	name="values"
+	doc="values to feed"
+	long_doc=u"""\
+values ‹value›… - add these values to the batch
+"""
+	def run(self,ctx,**k):
+		event = self.params(ctx)
+		if not len(event):
+			raise SyntaxError(u"Usage: values ‹value›…")
+		self.parent.values.extend(float(v) for v in event)
+
+@AvgFeed.register_statement
+class AvgFeedInterval(Statement):
+	name="interval"
+	doc="time between values"
+	long_doc=u"""\
+interval ‹seconds› - the time between two values of the batch
+"""
+	def run(self,ctx,**k):
+		event = self.params(ctx)
+		if len(event) != 1:
+			raise SyntaxError(u"Usage: interval ‹seconds›")
+		self.parent.interval = float(event[0])
+
+
 class AvgReset(Statement):
 	name="reset avg"
 	doc="Re-initialize an averager"
@@ -379,6 +477,7 @@ class AvgModule(Module):
 
 		main_words.register_statement(AvgHandler)
 		main_words.register_statement(AvgSet)
+		main_words.register_statement(AvgFeed)
 		main_words.register_statement(AvgReset)
 		main_words.register_statement(VarAvgHandler)
 		register_condition(Avgs.exists)
@@ -386,6 +485,7 @@ class AvgModule(Module):
 	def unload(self):
 		main_words.unregister_statement(AvgHandler)
 		main_words.unregister_statement(AvgSet)
+		main_words.unregister_statement(AvgFeed)
 		main_words.unregister_statement(AvgReset)
 		main_words.unregister_statement(VarAvgHandler)
 		unregister_condition(Avgs.exists)
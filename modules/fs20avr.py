@@ -116,20 +116,19 @@ class AVRcommon(handler):
 	def dataReceived(self, data):
 		self._stop_timer()
 		data = self.dbuf+data
-		while True:
-			xi = len(data)+1
-			try: pi = data.index('\r')
-			except ValueError: pi = xi
-			try: ei = data.index('\n')
-			except ValueError: ei = xi
-			if pi==xi and ei==xi:
-				break
-			if pi < ei:
-				self.lbuf = data[:pi]
-				data = data[pi+1:]
+		# scan once; a position of -1 means there's no more of that one
+		start = 0
+		pi = data.find('\r')
+		ei = data.find('\n')
+		while pi >= 0 or ei >= 0:
+			if pi >= 0 and (ei < 0 or pi < ei):
+				self.lbuf = data[start:pi]
+				start = pi+1
+				pi = data.find('\r',start)
 			else:
-				msg = data[:ei]
-				data = data[ei+1:]
+				msg = data[start:ei]
+				start = ei+1
+				ei = data.find('\n',start)
 				if msg == "" and self.lbuf is not None:
 					msg = self.lbuf
 					self.lbuf = None
@@ -139,7 +138,7 @@ class AVRcommon(handler):
 					fix_exception(e)
 					process_failure(e)
 
-		self.dbuf = data
+		self.dbuf = data[start:]
 		self._start_timer()
 
 
@@ -24,6 +24,8 @@ log WARN
 	- logs warning (and other) messages
 log
 	- reports logging levels
+set debug context on
+	- record where variable contexts are created
 
 """
 
@@ -32,6 +34,7 @@ from homevent.statement import Statement, main_words
 from homevent import logging
 from homevent.logging import log, Logger, LogNames, log_level, Loggers
 from homevent.check import register_condition,unregister_condition
+from homevent.context import debug_context
 
 import sys
 
@@ -125,6 +128,58 @@ log limit event DEBUG
 			print >>out, LogNames[log_level(name)]
 
 
+class LogQueueHandler(Statement):
+	name="log queue"
+	doc="set the size of this channel's log buffer"
+	long_doc=u"""\
+log queue ‹length› [‹batch›]
+	- buffer up to ‹length› lines for this channel's logger, and
+	  write up to ‹batch› of them at a time. If the channel can't keep
+	  up, the oldest lines are dropped.
+"""
+	def run(self,ctx,**k):
+		event = self.params(ctx)
+		if len(event) < 1 or len(event) > 2:
+			raise SyntaxError(u"Usage: log queue ‹length› [‹batch›]")
+		try:
+			logger = self.ctx.out.logger
+		except AttributeError:
+			raise RuntimeError(u"This channel doesn't log anything")
+		logger.queue_len = int(event[0])
+		if len(event) > 1:
+			logger.batch_len = int(event[1])
+
+
+class DebugHandler(Statement):
+	name="set debug"
+	doc="switch internal debugging features"
+	long_doc=u"""\
+set debug ‹flag› [on|off]
+	- switch a debugging feature on (default) or off.
+Known flags:
+	context
+		New variable contexts record where they have been created.
+		This is expensive; it's always on when regression testing.
+"""
+	def run(self,ctx,**k):
+		event = self.params(ctx)
+		if len(event) < 1 or len(event) > 2:
+			raise SyntaxError(u"Usage: set debug ‹flag› [on|off]")
+		if len(event) == 2:
+			if event[1] == "on":
+				doit = True
+			elif event[1] == "off":
+				doit = False
+			else:
+				raise SyntaxError(u"Usage: set debug ‹flag› [on|off]")
+		else:
+			doit = True
+		if event[0] == "context":
+			debug_context(doit)
+		else:
+			raise SyntaxError(u'Flag ‹%s› unknown' % (event[0],))
+
+
 class LoggingModule(Module):
 	"""\
 		This is a module to control logging stuff to the current channel.
@@ -135,11 +190,15 @@ class LoggingModule(Module):
 	def load(self):
 		main_words.register_statement(LogHandler)
 		main_words.register_statement(LogLevelHandler)
+		main_words.register_statement(LogQueueHandler)
+		main_words.register_statement(DebugHandler)
 		register_condition(Loggers.exists)
 	
 	def unload(self):
 		main_words.unregister_statement(LogHandler)
 		main_words.unregister_statement(LogLevelHandler)
+		main_words.unregister_statement(LogQueueHandler)
+		main_words.unregister_statement(DebugHandler)
 		unregister_condition(Loggers.exists)
 	
 init = LoggingModule
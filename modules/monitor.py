@@ -26,7 +26,7 @@ monitor name TYPE args
 """
 
 from homevent.monitor import Monitor,Monitors, MonitorDelayFor,MonitorDelayUntil,\
-	MonitorRequire,MonitorRetry,MonitorAlarm,MonitorHigh,MonitorLow,\
+	MonitorRequire,MonitorWindow,MonitorReject,MonitorRetry,MonitorAlarm,MonitorHigh,MonitorLow,\
 	MonitorLimit, MonitorScale, MonitorDiff, MonitorHandler, NoWatcherError
 from homevent.statement import AttributedStatement, Statement, main_words,\
 	global_words
@@ -95,7 +95,7 @@ This statement updates the parameters of an existing monitor.
 		return d
 
 for cmd in (MonitorDelayFor, MonitorDelayUntil, MonitorRequire, \
-		MonitorRetry, MonitorAlarm, MonitorLimit, MonitorScale, \
+		MonitorWindow, MonitorReject, MonitorRetry, MonitorAlarm, MonitorLimit, MonitorScale, \
 		MonitorHigh, MonitorLow, MonitorDiff):
 	MonitorUpdate.register_statement(cmd)
 
@@ -131,6 +131,7 @@ class OnEventWorker(Collected,iWorker):
 
 		if name is None:
 			name = Name("_on",self._get_id())
+		self._compile(parent.arglist)
 		super(OnEventWorker,self).__init__(*name)
 
 #		self.name = unicode(self.parent.arglist)
@@ -140,33 +141,52 @@ class OnEventWorker(Collected,iWorker):
 		
 		log(TRACE,"NewHandler",self.id)
 
-	def does_event(self,event):
-		ie = iter(event)
-		ia = iter(self.parent.arglist)
-		ctx = {}
+	def _compile(self,arglist):
+		"""\
+			Convert the argument list to a fixed matcher:
+			the number of words, the literal words with their positions,
+			and the positions of the wildcards with their names.
+			"""
+		words = []
+		literals = []
+		slots = []
 		pos = 0
-		while True:
-			try: e = ie.next()
-			except StopIteration: e = StopIteration
-			try: a = ia.next()
-			except StopIteration: a = StopIteration
-			if e is StopIteration and a is StopIteration:
-				return True
-			if e is StopIteration or a is StopIteration:
-				return False
+		for i,a in enumerate(arglist):
 			if hasattr(a,"startswith") and a.startswith('*'):
 				if a == '*':
 					pos += 1
 					a = str(pos)
 				else:
 					a = a[1:]
-				ctx[a] = e
-			elif str(a) != str(e):
+				slots.append((i,a))
+				words.append(None)
+			else:
+				literals.append((i,str(a)))
+				words.append(a)
+		self.event_words = tuple(words)
+		self._nargs = len(arglist)
+		self._literals = tuple(literals)
+		self._slots = tuple(slots)
+
+	def does_event(self,event):
+		name = event.name
+		if len(name) != self._nargs:
+			return False
+		for i,a in self._literals:
+			if str(name[i]) != a:
 				return False
+		return True
 
-	def process(self, **k):
-		super(OnEventWorker,self).process(**k)
-		return self.parent.process(**k)
+	def bindings(self,event):
+		"""Return the values of this event's wildcard words, by name."""
+		name = event.name
+		return dict((a,name[i]) for i,a in self._slots)
+
+	def process(self, event=None, **k):
+		super(OnEventWorker,self).process(event=event,**k)
+		if event is None:
+			return self.parent.process(**k)
+		return self.parent.process(event=event, args=self.bindings(event), **k)
 
 	def report(self, verbose=False):
 		if not verbose:
@@ -236,10 +256,14 @@ Every "*foo" in the event description is mapped to the corresponding
 			elif str(a) != str(e):
 				raise BadArgs(a,e)
 		
-	def process(self, event=None,**k):
+	def process(self, event=None, args=None, **k):
 		if event:
 			ctx = self.ctx(ctx=event.ctx)
-			self.grab_args(event,ctx)
+			if args is None:
+				self.grab_args(event,ctx)
+			else:
+				for a,e in args.iteritems():
+					setattr(ctx,a,e)
 		else:
 			ctx = self.ctx()
 		return super(OnEventHandler,self).run(ctx)
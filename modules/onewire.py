@@ -37,6 +37,8 @@ buses = {}
 class OWFSconnect(NetConnect):
 	name = "connect onewire"
 	doc = "connect to an OWFS server"
+	connections = 1
+	pipeline = None
 	long_doc="""\
 connect onewire NAME [[host] port]
 	: connect (synchronously) to the onewire server at the remote port;
@@ -45,11 +47,55 @@ connect onewire NAME [[host] port]
 """
 
 	def start_up(self):
-		f = connect(name=self.dest, host=self.host, port=self.port)
+		f = connect(name=self.dest, host=self.host, port=self.port, connections=self.connections, pipeline=self.pipeline)
 		buses[self.dest] = f
 		log(TRACE,"New OWFS bus",self.dest,f)
 
 
+@OWFSconnect.register_statement
+class OWFSconnections(Statement):
+	name = "connections"
+	doc = "use more than one connection to the server"
+	long_doc = u"""\
+connections ‹N›
+  - Open ‹N› connections to the server and spread requests across them.
+"""
+
+	def run(self,ctx,**k):
+		event = self.params(ctx)
+		if len(event) != 1:
+			raise SyntaxError(u"Usage: %s ‹N›" % (self.name,))
+		try:
+			n = int(event[0])
+		except ValueError:
+			n = 0
+		if n < 1:
+			raise SyntaxError(u"Usage: %s ‹N› (number of connections, at least 1)" % (self.name,))
+		self.parent.connections = n
+
+
+@OWFSconnect.register_statement
+class OWFSpipeline(Statement):
+	name = "pipeline"
+	doc = "limit the number of requests in flight"
+	long_doc = u"""\
+pipeline ‹N›
+  - Send at most ‹N› requests on a connection before waiting for replies.
+"""
+
+	def run(self,ctx,**k):
+		event = self.params(ctx)
+		if len(event) != 1:
+			raise SyntaxError(u"Usage: %s ‹N›" % (self.name,))
+		try:
+			n = int(event[0])
+		except ValueError:
+			n = 0
+		if n < 1:
+			raise SyntaxError(u"Usage: %s ‹N› (number of requests, at least 1)" % (self.name,))
+		self.parent.pipeline = n
+
+
 class OWFSdisconnect(Statement):
 	name = "disconnect onewire"
 	doc = "disconnect from an OWFS server"
@@ -118,6 +164,36 @@ set onewire VALUE dev attr
 		devices[dev].set(attr, val)
 
 
+class OWFSvar(Statement):
+	name="var onewire"
+	doc="assign a variable to a onewire device's attribute"
+	long_doc=u"""\
+var onewire NAME dev attr [NAME attr]…
+	: Device ‹dev›'s attribute ‹attr› is read from the bus and stored in
+	  the variable ‹NAME›. Further attributes of the same device may be
+	  appended; all of them are read concurrently. If some of them
+	  cannot be read, the others are still set before the error is raised.
+"""
+	def run(self,ctx,**k):
+		event = self.params(ctx)
+		if len(event) < 3 or len(event) % 2 == 0:
+			raise SyntaxError(u"Usage: var onewire ‹variable› ‹dev› ‹attr› [‹variable› ‹attr›]…")
+		dev = devices[event[1].lower()]
+		names = [event[0]] + list(event[3::2])
+		attrs = [event[2]] + list(event[4::2])
+		vals = dev.get_many(attrs)
+		err = None
+		for n,a in zip(names,attrs):
+			val = vals[a]
+			if isinstance(val,Exception):
+				if err is None:
+					err = val
+			else:
+				setattr(self.parent.ctx,n,val)
+		if err is not None:
+			raise err
+
+
 class OWFSdir(AttributedStatement):
 	name="dir onewire"
 	doc="List a directory on the onewire bus"
@@ -458,6 +534,7 @@ class OWFSmodule(Module):
 		main_words.register_statement(OWFSdir)
 		main_words.register_statement(OWFSscan)
 		main_words.register_statement(OWFSset)
+		main_words.register_statement(OWFSvar)
 		main_words.register_statement(OWFSmonitor)
 		register_input(OWFSinput)
 		register_output(OWFSoutput)
@@ -470,6 +547,7 @@ class OWFSmodule(Module):
 		main_words.unregister_statement(OWFSdir)
 		main_words.unregister_statement(OWFSscan)
 		main_words.unregister_statement(OWFSset)
+		main_words.unregister_statement(OWFSvar)
 		main_words.unregister_statement(OWFSmonitor)
 		unregister_input(OWFSinput)
 		unregister_output(OWFSoutput)
@@ -30,24 +30,62 @@ from homevent.base import Name,SName,flatten
 from homevent.collect import Collection,Collected,get_collect,all_collect
 from homevent.check import register_condition,unregister_condition
 from homevent.twist import Jobber,fix_exception,reraise
-from homevent.run import process_failure,simple_event,register_worker,unregister_worker,MIN_PRIO
+from homevent.run import process_failure,simple_event,register_worker,unregister_worker,MIN_PRIO,\
+	WorkerIndex
 from homevent.geventreactor import waitForDeferred
 from homevent.event import TrySomethingElse
 from homevent.worker import Worker
-from homevent.logging import BaseLogger,TRACE
+from homevent.logging import BaseLogger,TRACE,WARN
+from homevent.times import humandelta,now
 
 from datetime import datetime,date,time,timedelta
+from collections import deque,OrderedDict
+from time import time as now_t
 
 from rpyc import Service
 from rpyc.core.protocol import DEFAULT_CONFIG
 from rpyc.utils.server import ThreadedServer
 from rpyc.utils.helpers import async
 
-from gevent.queue import Queue
 from gevent.event import AsyncResult
-from gevent import spawn,spawn_later
+from gevent import spawn,sleep,Timeout
 
 conn_seq = 0
+list_cursor = 0
+
+class _Rows(list):
+	"""Collects the output of flatten()."""
+	put = list.append
+
+def _fix_value(t):
+	if isinstance(t,datetime):
+		if TESTING:
+			if t.year != 2003:
+				t = "%s" % (humandelta(t-now(t.year != 2003)),)
+			else: 
+				t = "%s (%s)" % (humandelta(t-now(t.year != 2003)),t)
+			ti = t.rfind('.')
+			if ti>0 and len(t)-ti > 3 and len(t)-ti<9: # limit to msec
+				t= t[:ti+3]+")"
+		# otherwise transmit the datetime as-is
+	elif not isinstance(t,(date,time,timedelta)):
+		t = unicode(t)
+	return t
+
+def _flat(c):
+	"""List an object, as (path,value) pairs."""
+	rows = _Rows()
+	flatten(rows,(c,))
+	for p,t in rows:
+		yield p,_fix_value(t)
+
+def _plain(v):
+	"""Convert a value to something RPyC sends by value."""
+	if v is None or isinstance(v,(bool,int,long,float,basestring)):
+		return v
+	if isinstance(v,tuple): # including Name
+		return tuple(_plain(x) for x in v)
+	return unicode(v)
 
 class RPCconns(Collection):
 	name = Name("rpc","connection")
@@ -68,21 +106,22 @@ class CallBack(object):
 		self.callback = async(callback)
 
 
-	def run_callback(self,*args,**kwargs):
+	def start_callback(self,*args,**kwargs):
+		"""\
+			Send the call; returns an AsyncResult which will be set to the
+			remote result when it arrives.
+			"""
 		res = AsyncResult()
-		def trigger(res):
-			res.set(RequestTimedOut)
-		timer = spawn_later(10,trigger,res)
-		def done(r):
-			res.set(r)
 		c = self.callback(*args,**kwargs)
-		c.add_callback(done)
-
-		r = res.get()
-		if r is not RequestTimedOut:
-			timer.kill()
+		c.add_callback(res.set)
+		return res
 
-		return r
+	def run_callback(self,*args,**kwargs):
+		res = self.start_callback(*args,**kwargs)
+		try:
+			return res.get(timeout=10)
+		except Timeout:
+			return RequestTimedOut
 		
 		
 	def list(self):
@@ -116,52 +155,129 @@ class CommandProcessor(ImmediateProcessor):
 		return waitForDeferred(res)
 
 
-class EventCallback(Worker,CallBack):
-	args = None
+class Subscription(object):
+	"""All monitors which want the same events."""
+	__slots__ = ("pattern","event_words","callbacks")
+	def __init__(self,pattern):
+		self.pattern = pattern
+		if pattern is None:
+			self.event_words = None
+		else:
+			self.event_words = tuple((None if a == '*' else a) for a in pattern)
+		self.callbacks = []
+
+	def matches(self,n):
+		"""The index found me; check the length of the event."""
+		return self.pattern is None or len(self.pattern) == n
+
+
+class RPCmonitors(Worker):
+	"""\
+		Forward events to all RPC monitors.
+
+		Monitors are grouped by pattern and looked up in a WorkerIndex,
+		so an event is matched against every remote subscriber at once.
+		This worker is registered while there are any monitors.
+		"""
 	prio = MIN_PRIO+1
+	registered = False
+
+	def __init__(self):
+		super(RPCmonitors,self).__init__("rpc monitors")
+		self.index = WorkerIndex()
+		self.subs = {}
+		self._last = (None,())
+
+	def list(self):
+		for r in super(RPCmonitors,self).list():
+			yield r
+		yield ("patterns",len(self.subs))
+		yield ("monitors",sum(len(s.callbacks) for s in self.subs.itervalues()))
+
+	def add(self,cb):
+		s = self.subs.get(cb.args,None)
+		if s is None:
+			self.subs[cb.args] = s = Subscription(cb.args)
+			self.index.add(s)
+		s.callbacks.append(cb)
+		if not self.registered:
+			register_worker(self)
+			self.registered = True
+
+	def remove(self,cb):
+		s = self.subs[cb.args]
+		s.callbacks.remove(cb)
+		if not s.callbacks:
+			self.index.remove(s)
+			del self.subs[cb.args]
+		if not self.subs and self.registered:
+			unregister_worker(self)
+			self.registered = False
+			self._last = (None,())
+
+	def matches(self,event):
+		n = len(event)
+		return [s for s in self.index.find(event) if s.matches(n)]
+
+	def does_event(self,event):
+		m = self.matches(event)
+		self._last = (event,m)
+		return bool(m)
+	
+	def process(self, **k):
+		super(RPCmonitors,self).process(**k)
+		event = k.get("event",None)
+		ev,m = self._last
+		if ev is not event:
+			m = self.matches(event)
+		for s in m:
+			for cb in s.callbacks[:]:
+				# Never wait for the client here.
+				cb.parent.queue_event(cb,k)
+		raise TrySomethingElse
+
+monitors = None
+
+def add_monitor(cb):
+	global monitors
+	if monitors is None:
+		monitors = RPCmonitors()
+	monitors.add(cb)
+
+
+class EventCallback(CallBack):
+	"""\
+		Forward events to a remote client.
+		The events are queued by the connection; see RPCconn.queue_event().
+		"""
+	args = None
+	batched = False # if set, the callback gets a list of events
 
 	def __init__(self,parent,callback,*args):
 		self.parent = parent
 		CallBack.__init__(self,callback)
 		if args:
-			self.args = SName(args)
-			name = SName(parent.name+self.args)
+			self.args = tuple(str(a) for a in args)
 			# use self.args because that won't do a multi-roundtrip iteration
+			self.name = SName(parent.name+self.args)
 		else:
-			name = parent.name
-		super(EventCallback,self).__init__(name)
+			self.name = parent.name
 	
 	def list(self):
-		for r in super(EventCallback,self).list():
-			yield r
+		yield ("name",self.name)
+		yield ("callback",repr(self.callback))
 		if self.args:
-			yield("args",self.args)
-
-	def does_event(self,event):
-		if self.args is None:
-			return True
-		ie = iter(event)
-		ia = iter(self.args)
-		while True:
-			try: e = ie.next()
-			except StopIteration: e = StopIteration
-			try: a = ia.next()
-			except StopIteration: a = StopIteration
-			if e is StopIteration and a is StopIteration:
-				return True
-			if e is StopIteration or a is StopIteration:
-				return False
-			if str(a) == '*':
-				pass
-			elif str(a) != str(e):
-				return False
-	
-	def process(self, **k):
-		super(EventCallback,self).process(**k)
+			yield("args",SName(self.args))
+		if self.batched:
+			yield("batched",True)
 
+	def send(self, events):
+		"""Send a list of events. Returns an AsyncResult per remote call."""
 		# This is an event monitor. Failures will not be tolerated.
 		try:
-			self.run_callback(**k)
+			if self.batched:
+				return [self.start_callback(events)]
+			return [self.start_callback(**k) for k in events]
 		except Exception as ex:
 			fix_exception(ex)
 			process_failure(ex)
@@ -170,7 +286,7 @@ class EventCallback(Worker,CallBack):
 			except Exception as ex:
 				fix_exception(ex)
 				process_failure(ex)
-		raise TrySomethingElse
+			return ()
 
 	def cancel(self):
 		self.parent.drop_worker(self)
@@ -178,23 +294,90 @@ class EventCallback(Worker,CallBack):
 		
 
 class LogCallback(BaseLogger,CallBack):
+	"""\
+		Send log lines to a remote client.
+
+		Lines are filtered by level and subsystem before they're queued.
+		The writer sends a batch of lines without waiting for each to be
+		acknowledged, then waits for the client once per batch. If the
+		client can't keep up, the oldest lines are dropped; the next batch
+		starts with a "‹n› lines dropped" line.
+
+		With @batched set, the callback gets the whole batch as a list of
+		(level, words…) tuples.
+		"""
+	batched = False
+	batch_delay = 0 if TESTING else 0.1 # wait for more lines
+	timeout = 10 # seconds to wait for the client, per batch
+
 	def __init__(self,parent,callback,kind=None,level=TRACE):
 		self.parent=parent
 		self.kind=kind
 		CallBack.__init__(self,callback)
+		self._lines = []
+		self._replies = []
+		self.n_sent = 0
+		self.n_calls = 0
+		self.n_timeouts = 0
 
 		self.name = parent.name
 		super(LogCallback,self).__init__(level)
 
+	def list(self):
+		for r in super(LogCallback,self).list():
+			yield r
+		if self.kind is not None:
+			yield ("Subsystem",self.kind)
+		yield ("Batched",self.batched)
+		yield ("Sent",self.n_sent)
+		yield ("Remote calls",self.n_calls)
+		yield ("Timeouts",self.n_timeouts)
+
+	def log(self, level, *a):
+		if self.kind is not None and a[0] != self.kind:
+			return
+		super(LogCallback,self).log(level,*a)
+
+	def log_event(self, event, level):
+		if self.kind is None:
+			super(LogCallback,self).log_event(event,level)
+
+	def log_failure(self, err, level=WARN):
+		if self.kind is None:
+			super(LogCallback,self).log_failure(err,level)
+
+	def _start_batch(self):
+		if self.batch_delay and len(self.q) < self.batch_len:
+			sleep(self.batch_delay)
+
 	def _log(self, level, *a):
 		if level < self.level:
 			return
 		if TESTING and (a[0].startswith("TEST") or a[-1].endswith("LOGTEST")):
 			return
-		if self.kind is None or a[0] == self.kind:
-			if TESTING:
-				a = a+("LOGTEST",)
-			self.run_callback(level,*a)
+		if TESTING:
+			a = a+("LOGTEST",)
+		self.n_sent += 1
+		if self.batched:
+			self._lines.append((level,)+a)
+		else:
+			self._replies.append(self.start_callback(level,*a))
+			self.n_calls += 1
+
+	def _end_batch(self):
+		if self._lines:
+			lines,self._lines = self._lines,[]
+			self._replies.append(self.start_callback(lines))
+			self.n_calls += 1
+		if not self._replies:
+			return
+		replies,self._replies = self._replies,[]
+		end = now_t()+self.timeout
+		for r in replies:
+			try:
+				r.get(timeout=max(end-now_t(),0))
+			except Timeout:
+				self.n_timeouts += 1
 	
 	def _flush(self):
 		pass
@@ -208,6 +391,13 @@ class RPCconn(Service,Collected):
 	storage = RPCconns
 	dest = ("?unnamed",)
 	workers = None
+	list_chunk = 500 # default rows per cmd_list_chunk() call
+	max_list_chunk = 5000
+	max_list_cursors = 10 # unfinished listings per connection
+
+	max_queue = 1000 # events waiting to be sent to the client
+	overflow = "drop" # drop the oldest event, or "disconnect"
+	timeout = 10 # seconds to wait for the client to acknowledge
 		
 	def on_connect(self):
 		global conn_seq
@@ -216,6 +406,15 @@ class RPCconn(Service,Collected):
 		self.ctx = Context()
 		self.ctx.words = global_words(self.ctx)
 		self.workers = set()
+		self._cursors = OrderedDict()
+		self.out = deque()
+		self._sender = None
+		self.n_events = 0
+		self.n_sent = 0
+		self.n_dropped = 0
+		self.n_calls = 0
+		self.n_errors = 0
+		self.n_timeouts = 0
 		simple_event(self.ctx,"rpc","connect",*self.name)
 		Collected.__init__(self)
 
@@ -229,70 +428,180 @@ class RPCconn(Service,Collected):
 		simple_event(self.ctx,"rpc","disconnect",*self.name)
 		if self.workers is not None:
 			for w in self.workers:
-				unregister_worker(w)
+				monitors.remove(w)
 			self.workers = None
+		self.out.clear()
 		super(RPCconn,self).delete()
 	
 	def drop_worker(self,worker):
-		unregister_worker(worker)
+		monitors.remove(worker)
 		self.workers.remove(worker)
 
-	def exposed_cmd_list(self,*args):
-		# don't call this 'exposed_list'!
-		c = get_collect(args, allow_collection=True)
+	def queue_event(self, worker, k):
+		"""Queue an event for a worker. The sender job does the rest."""
+		if self.workers is None:
+			return
+		self.n_events += 1
+		if len(self.out) >= self.max_queue:
+			if self.overflow == "disconnect":
+				self.n_dropped += len(self.out)+1
+				self.out.clear()
+				if self.workers:
+					for w in list(self.workers):
+						self.drop_worker(w)
+				spawn(self.delete)
+				return
+			self.out.popleft()
+			self.n_dropped += 1
+		self.out.append((worker,k))
+		if self._sender is None:
+			self._sender = spawn(self._send_events)
+
+	def _send_events(self):
+		"""Send whatever is queued, then wait for the replies."""
 		try:
-			if c is None:
-				for m in all_collect(skip=False):
-					yield m.name,
-			elif isinstance(c,Collection):
-				if args[-1] == "*":
-					for n,m in c.iteritems():
-						yield n,m
-					return
-				for n,m in c.iteritems():
+			while self.out:
+				batch = list(self.out)
+				self.out.clear()
+
+				# Keep the order of events, per worker
+				events = {}
+				order = []
+				for w,k in batch:
+					if w not in self.workers:
+						continue
+					if w not in events:
+						events[w] = []
+						order.append(w)
+					events[w].append(k)
+
+				replies = []
+				for w in order:
+					r = w.send(events[w])
+					self.n_sent += len(events[w])
+					self.n_calls += len(r)
+					replies.extend(r)
+
+				end = now_t()+self.timeout
+				for r in replies:
 					try:
-						m = m.info
-					except AttributeError:
-						m = m.name
-					else:
-						if callable(m):
-							m = m()
-						if isinstance(m,basestring):
-							m = m.split("\n")[0].strip()
-
-					if m is not None:
-						yield (n,m)
+						r = r.get(timeout=max(end-now_t(),0))
+					except Timeout:
+						self.n_timeouts += 1
 					else:
-						yield n,
-			else:
-				q = Queue(3)
-				job = spawn(flatten,q,(c,))
-				job.link(lambda _:q.put(None))
-
-				while True:
-					res = q.get()
-					if res is None:
-						return
-					p,t = res
-					if isinstance(t,datetime):
-						if TESTING:
-							if t.year != 2003:
-								t = "%s" % (humandelta(t-now(t.year != 2003)),)
-							else: 
-								t = "%s (%s)" % (humandelta(t-now(t.year != 2003)),t)
-							ti = t.rfind('.')
-							if ti>0 and len(t)-ti > 3 and len(t)-ti<9: # limit to msec
-								t= t[:ti+3]+")"
-						# otherwise transmit the datetime as-is
-					elif not isinstance(t,(date,time,timedelta)):
-						t = unicode(t)
-
-					yield p,t
+						if r.error:
+							self.n_errors += 1
+		except Exception as ex:
+			fix_exception(ex)
+			process_failure(ex)
+		finally:
+			self._sender = None
+
+	def _list_rows(self,c,args, chunked=False):
+		"""\
+			Generate the rows for "list", see exposed_cmd_list().
+			With @chunked, rows only contain plain values (a collection
+			"*" listing includes every entry's details).
+			"""
+		if c is None:
+			for m in all_collect(skip=False):
+				yield _plain(m.name) if chunked else m.name,
+		elif isinstance(c,Collection):
+			# Take a snapshot: a chunked listing may take a while.
+			items = list(c.iteritems())
+			if args[-1] == "*":
+				if not chunked:
+					for n,m in items:
+						yield n,m
+					return
+				for n,m in items:
+					n = _plain(n)
+					for p,t in _flat(m):
+						yield n,p,_plain(t)
+				return
+			for n,m in items:
+				try:
+					m = m.info
+				except AttributeError:
+					m = m.name
+				else:
+					if callable(m):
+						m = m()
+					if isinstance(m,basestring):
+						m = m.split("\n")[0].strip()
+
+				if chunked:
+					n,m = _plain(n),_plain(m)
+				if m is not None:
+					yield (n,m)
+				else:
+					yield n,
+		else:
+			for p,t in _flat(c):
+				yield p,(_plain(t) if chunked else t)
 
+	def exposed_cmd_list(self,*args):
+		# don't call this 'exposed_list'!
+		c = get_collect(args, allow_collection=True)
+		try:
+			for r in self._list_rows(c,args):
+				yield r
 		except Exception as e:
 				fix_exception(e)
 				yield "* ERROR *",repr(e)
 				process_failure(e)
+
+	def exposed_cmd_list_chunk(self,args, cursor=None, size=None):
+		"""\
+			Return (rows,cursor,kind): up to @size rows of "list ‹args›".
+			Call again with the cursor for the next chunk; it's None when
+			there's nothing left. Rows are tuples of strings, numbers and
+			(for names) tuples of strings. @kind says what the rows are:
+			"collections" (name,), "collection" (name[,info]),
+			"entries" (name,path,value) for a "*" listing, or
+			"object" (path,value).
+			"""
+		if size is None:
+			size = self.list_chunk
+		size = max(1,min(int(size),self.max_list_chunk))
+		if cursor is None:
+			args = tuple(args)
+			c = get_collect(args, allow_collection=True)
+			if c is None:
+				kind = "collections"
+			elif not isinstance(c,Collection):
+				kind = "object"
+			elif args[-1] == "*":
+				kind = "entries"
+			else:
+				kind = "collection"
+			rows = self._list_rows(c,args, chunked=True)
+		else:
+			try:
+				kind,rows = self._cursors.pop(cursor)
+			except KeyError:
+				raise KeyError("This list cursor has expired",cursor)
+
+		res = []
+		try:
+			for r in rows:
+				res.append(r)
+				if len(res) == size:
+					break
+			else:
+				return tuple(res),None,kind
+		except Exception as e:
+			fix_exception(e)
+			process_failure(e)
+			res.append(("* ERROR *",repr(e)))
+			return tuple(res),None,kind
+
+		global list_cursor
+		list_cursor += 1
+		self._cursors[list_cursor] = (kind,rows)
+		while len(self._cursors) > self.max_list_cursors:
+			self._cursors.popitem(last=False)
+		return tuple(res),list_cursor,kind
 				
 	def exposed_command(self,*args,**kwargs):
 		try:
@@ -316,10 +625,18 @@ class RPCconn(Service,Collected):
 		return getattr(self.ctx,arg)
 
 	def exposed_monitor(self,callback,*args):
+		return self._monitor(False,callback,*args)
+
+	def exposed_monitor_batch(self,callback,*args):
+		"""Like monitor(), but the callback gets a list of events."""
+		return self._monitor(True,callback,*args)
+
+	def _monitor(self,batched,callback,*args):
 		try:
 			w = EventCallback(self,callback,*args)
+			w.batched = batched
 			self.workers.add(w)
-			register_worker(w)
+			add_monitor(w)
 			return w
 		except Exception as ex:
 			fix_exception(ex)
@@ -329,6 +646,12 @@ class RPCconn(Service,Collected):
 		l = LogCallback(self,callback,*args)
 		return l
 
+	def exposed_logger_batch(self,callback,*args):
+		"""Like logger(), but the callback gets a list of lines."""
+		l = LogCallback(self,callback,*args)
+		l.batched = True
+		return l
+
 	def list(self):
 		for r in super(RPCconn,self).list():
 			yield r
@@ -336,11 +659,24 @@ class RPCconn(Service,Collected):
 		yield ("local port", self._conn._config["endpoints"][0][1])
 		yield ("remote host", self._conn._config["endpoints"][1][0])
 		yield ("remote port", self._conn._config["endpoints"][1][1])
+		yield ("queue size", self.max_queue)
+		yield ("on overflow", self.overflow)
+		yield ("queued", len(self.out))
+		yield ("events", self.n_events)
+		yield ("sent", self.n_sent)
+		yield ("dropped", self.n_dropped)
+		yield ("remote calls", self.n_calls)
+		yield ("errors", self.n_errors)
+		yield ("timeouts", self.n_timeouts)
 	exposed_list = list
 
-def gen_rpcconn(name):
+def gen_rpcconn(name, max_queue=None,overflow=None):
 	class namedRPC(RPCconn):
 		dest = name
+	if max_queue is not None:
+		namedRPC.max_queue = max_queue
+	if overflow is not None:
+		namedRPC.overflow = overflow
 	return namedRPC
 		
 
@@ -352,11 +688,11 @@ RPCservers.does("del")
 class RPCserver(Collected,Jobber):
 	"""A channel server"""
 	storage = RPCservers
-	def __init__(self,name,host,port):
+	def __init__(self,name,host,port, max_queue=None,overflow=None):
 		self.name = name
 		self.host=host
 		self.port=port
-		self.server = ThreadedServer(gen_rpcconn(name), hostname=host,port=port,ipv6=True, protocol_config = {"safe_attrs":set(("list","__unicode__")).union(DEFAULT_CONFIG["safe_attrs"])})
+		self.server = ThreadedServer(gen_rpcconn(name, max_queue,overflow), hostname=host,port=port,ipv6=True, protocol_config = {"safe_attrs":set(("list","__unicode__")).union(DEFAULT_CONFIG["safe_attrs"])})
 		self.server.listener.settimeout(None)
 		self.start_job("job",self._start)
 		super(RPCserver,self).__init__()
@@ -381,6 +717,8 @@ class RPClisten(AttributedStatement):
 	name = "listen rpc"
 	doc = "create an RPC server"
 	dest = None
+	max_queue = None
+	overflow = None
 	long_doc="""\
 Usage: listen rpc ‹name› [‹host›] ‹port›
 This command binds a RPyC server to the given port.
@@ -399,7 +737,7 @@ This command binds a RPyC server to the given port.
 			host = event[-2]
 		else:
 			host = ""
-		RPCserver(dest,host,port)
+		RPCserver(dest,host,port, self.max_queue,self.overflow)
 
 class RPCname(Statement):
 	name="name"
@@ -416,6 +754,33 @@ name ‹name…›
 		self.parent.dest = SName(event)
 RPClisten.register_statement(RPCname)
 
+class RPCqueue(Statement):
+	name="queue"
+	doc="limit the number of events waiting for a client"
+
+	long_doc = u"""\
+queue ‹size› [drop|disconnect]
+- Events are sent to each client in the background. If more than ‹size›
+  (default 1000) are waiting, either drop the oldest (the default) or
+  disconnect the client.
+"""
+
+	def run(self,ctx,**k):
+		event = self.params(ctx)
+		if len(event) not in (1,2):
+			raise SyntaxError(u"Usage: queue ‹size› [drop|disconnect]")
+		try:
+			self.parent.max_queue = int(event[0])
+			if self.parent.max_queue < 1:
+				raise ValueError
+		except ValueError:
+			raise SyntaxError(u"queue: ‹size› needs to be a positive number")
+		if len(event) > 1:
+			if event[1] not in ("drop","disconnect"):
+				raise SyntaxError(u"queue: on overflow, either ‹drop› or ‹disconnect›")
+			self.parent.overflow = event[1]
+RPClisten.register_statement(RPCqueue)
+
 
 
 class RPCmodule(Module):
@@ -434,6 +799,9 @@ class RPCmodule(Module):
 		main_words.unregister_statement(RPClisten)
 		unregister_condition(RPCconns.exists)
 		unregister_condition(RPCservers.exists)
+		if monitors is not None and monitors.registered:
+			unregister_worker(monitors)
+			monitors.registered = False
 	
 init = RPCmodule
 
@@ -18,19 +18,34 @@
 """\
 This code implements logging to RRD.
 
+Values are not written immediately. Each RRD collects them for a second
+(or until there are a hundred of them) and then writes them with one
+rrdtool.update() call, in a separate thread, so that a slow disk doesn't
+hold up everything else. Reading an RRD doesn't write anything; the
+queued values are merged into the cached "rrdtool info" instead.
+
 """
 
 from homevent.check import register_condition,unregister_condition
 from homevent.module import Module
 from homevent.statement import Statement, main_words
 from homevent.times import now
-from homevent.twist import fix_exception
+from homevent.twist import fix_exception,callLater
+from homevent.run import process_failure
 from homevent.base import Name
 from homevent.collect import Collection,Collected
 
+from gevent.threadpool import ThreadPool
+from gevent.lock import Semaphore
+import gevent
+
 import os
 import rrdtool
 
+# One thread is enough to keep disk I/O out of the main loop.
+# rrdtool's error reporting isn't thread safe anyway.
+io_pool = ThreadPool(1)
+
 class RRDs(Collection):
 	name = "rrd"
 RRDs = RRDs()
@@ -38,27 +53,108 @@ RRDs.does("del")
 
 class RRD(Collected):
 	storage = RRDs
+	flush_delay = 1 # collect values for this many seconds
+	max_pending = 100 # … or until there are this many
+	last_error = None
+
 	def __init__(self,path,dataset,name):
 		self.path = path
 		self.upath = path.encode("utf-8")
 		self.dataset = dataset
 		self.udataset = dataset.encode("utf-8")
+		self._pending = []
+		self._writing = ()
+		self._last_ts = None
+		self._timer = None
+		self._info = None
+		self._lock = Semaphore()
 		super(RRD,self).__init__(*name)
 		 
 	def list(self):
 		yield ("name",self.name)
 		yield ("file",self.path)
 		yield ("dataset",self.dataset)
+		if self.last_error is not None:
+			yield ("last error",self.last_error)
+		d = self.get_info()
 		try:
-			for k,v in rrdtool.info(self.upath)["ds"][self.udataset].iteritems():
+			for k,v in d["ds"][self.udataset].iteritems():
 				yield (k,v)
 		except KeyError:
 			s="ds[%s]." % (self.udataset)
-			d=rrdtool.info(self.upath)
 			# mainly for testing
 			for k in sorted(x for x in d.keys() if x.startswith(s)):
 				yield (k[len(s):],d[k])
 
+	def delete(self, ctx=None):
+		self.flush()
+		super(RRD,self).delete(ctx=ctx)
+
+	def add(self, tm, value):
+		"""Queue a value for writing."""
+		ts = int(tm.strftime("%s"))
+		# rrdtool rejects more than one update per second.
+		last = self._last_ts
+		if self._pending:
+			last = self._pending[-1][0]
+		if last is not None and ts <= last:
+			return
+		self._pending.append((ts,value))
+		if len(self._pending) >= self.max_pending:
+			gevent.spawn(self.flush)
+		elif self._timer is None:
+			self._timer = callLater(True,self.flush_delay, self.flush)
+
+	def flush(self):
+		"""Write the queued values. Returns when they're on disk."""
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
+		with self._lock:
+			if not self._pending:
+				return
+			vals,self._pending = self._pending,[]
+			self._writing = vals
+			self._last_ts = vals[-1][0]
+			args = (self.upath, "-t",self.udataset) + tuple("%d:%s" % v for v in vals)
+			try:
+				io_pool.apply(rrdtool.update, args)
+			except Exception as e:
+				fix_exception(e)
+				if "minimum one second step" not in str(e):
+					self.last_error = str(e)
+					process_failure(e)
+			finally:
+				self._writing = ()
+				self._info = None
+
+	def get_info(self):
+		"""Return "rrdtool info" for this file, including queued values."""
+		d = self._info
+		if d is None:
+			d = self._info = io_pool.apply(rrdtool.info, (self.upath,))
+		last = self._pending or self._writing
+		if not last:
+			return d
+		ts,val = last[-1]
+
+		d = d.copy()
+		d["last_update"] = ts
+		if "ds" in d:
+			ds = d["ds"] = d["ds"].copy()
+			ds[self.udataset] = dict(ds.get(self.udataset,()), last_ds=val)
+		else:
+			d["ds[%s].last_ds" % (self.udataset,)] = val
+		return d
+
+	def get(self, item):
+		"""Return the value of ds[dataset].item."""
+		d = self.get_info()
+		try:
+			return d["ds"][self.dataset][item]
+		except KeyError:
+			return d["ds[%s].%s" % (self.dataset,item)]
+
 	def info(self):
 		return "%s %s" % (self.path,self.dataset)
 
@@ -97,10 +193,7 @@ var rrd variable item NAME
 		if len(event) < 3:
 			raise SyntaxError(u'Usage: var rrd ‹variable› ‹item› ‹name…›')
 		s = RRDs[Name(*event[2:])]
-		try:
-			setattr(self.parent.ctx,event[0],rrdtool.info(s.upath)["ds"][s.dataset][event[1]])
-		except KeyError:
-			setattr(self.parent.ctx,event[0],rrdtool.info(s.upath)["ds[%s].%s" % (s.dataset,event[1])])
+		setattr(self.parent.ctx,event[0],s.get(event[1]))
 
 
 class RRDset(Statement):
@@ -120,14 +213,7 @@ set rrd value ‹name…›
 		s = RRDs[Name(*event[1:])]
 		# Using "N:" may run into a RRD bug
 		# if we're really close to the next minute
-		try:
-			rrdtool.update(s.upath, "-t",s.udataset, now().strftime("%s")+":"+unicode(event[0]).encode("utf-8"))
-		except Exception as e:
-			fix_exception(e)
-			if "minimum one second step" in str(e):
-				pass
-			else:
-				raise
+		s.add(now(), unicode(event[0]).encode("utf-8"))
 
 class RRDModule(Module):
 	"""\
@@ -147,5 +233,7 @@ class RRDModule(Module):
 		main_words.unregister_statement(RRDset)
 		main_words.unregister_statement(VarRRDHandler)
 		unregister_condition(RRDs.exists)
+		for rrd in RRDs.values():
+			rrd.flush()
 	
 init = RRDModule
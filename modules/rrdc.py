@@ -135,12 +135,68 @@ class RRDqueue(MsgQueue):
 	ondemand = False
 	max_send = None
 
+	batch_size = None # if set, send updates in BATCHes of up to this many
+	batch_delay = 1 # … or whatever arrived within that many seconds
+
 	def __init__(self, name, host,port, *a,**k):
+		self._batch = []
+		self._batch_timer = None
+		self.n_batches = 0
+		self.n_batched = 0
+		self.n_batch_errors = 0
 		super(RRDqueue,self).__init__(name=name, factory=MsgFactory(RRDchannel,name=name,host=host,port=port, **k))
 
 	def setup(self):
 		self.channel.up_event(False)
 
+	def list(self):
+		for r in super(RRDqueue,self).list():
+			yield r
+		if self.batch_size:
+			yield ("batch size",self.batch_size)
+			yield ("batch delay",self.batch_delay)
+			yield ("batches",self.n_batches)
+			yield ("batched updates",self.n_batched)
+			yield ("batch errors",self.n_batch_errors)
+			yield ("waiting",len(self._batch))
+
+	def update(self, file, val):
+		"""\
+			Send an update to this server.
+			Returns an AsyncResult; in batch mode, you don't need to wait
+			for it, errors will be logged anyway.
+			"""
+		if not self.batch_size:
+			return RRDsendUpdate(file,val).result
+		u = RRDbatchedUpdate(file,val)
+		self._batch.append(u)
+		if len(self._batch) >= self.batch_size:
+			self.flush()
+		elif self._batch_timer is None:
+			self._batch_timer = callLater(True,self.batch_delay, self.flush)
+		return u.result
+
+	def flush(self):
+		"""Send the updates collected so far."""
+		if self._batch_timer is not None:
+			self._batch_timer.cancel()
+			self._batch_timer = None
+		if not self._batch:
+			return
+		batch,self._batch = self._batch,[]
+		self.n_batches += 1
+		self.n_batched += len(batch)
+		self.enqueue(RRDbatchMsg(self,batch))
+
+	def delete(self, ctx=None):
+		if self._batch_timer is not None:
+			self._batch_timer.cancel()
+			self._batch_timer = None
+		batch,self._batch = self._batch,[]
+		for u in batch:
+			u.error("not sent: the connection has been deleted")
+		super(RRDqueue,self).delete(ctx=ctx)
+
 
 class RRDconnect(NetConnect):
 	name = "connect rrd"
@@ -151,6 +207,8 @@ class RRDconnect(NetConnect):
 	max_retry_interval = None
 	timeout_interval = None
 	max_timeout_interval = None
+	batch_size = None
+	batch_delay = None
 
 	long_doc="""\
 connect rrd NAME [[host] port]
@@ -161,6 +219,10 @@ connect rrd NAME [[host] port]
 
 	def start_up(self):
 		q = RRDqueue(name=self.dest, host=self.host,port=self.port)
+		if self.batch_size is not None:
+			q.batch_size = self.batch_size
+		if self.batch_delay is not None:
+			q.batch_delay = self.batch_delay
 		if self.retry_interval is not None:
 			q.initial_connect_timeout = self.retry_interval
 		if self.max_retry_interval is not None:
@@ -172,6 +234,35 @@ connect rrd NAME [[host] port]
 RRDconnect.register_statement(NetRetry)
 
 
+@RRDconnect.register_statement
+class RRDbatch(Statement):
+	name="batch"
+	doc="send updates in batches"
+
+	long_doc = u"""\
+batch ‹size› [‹seconds›]
+  - Collect updates and send them to the server with one BATCH command,
+    as soon as there are ‹size› of them or ‹seconds› (default 1) after
+    the first one arrived, whichever is earlier.
+    "set rrd" doesn't wait for the server in this mode; errors are
+    logged and remembered by the RRD file they belong to.
+"""
+	def run(self,ctx,**k):
+		event = self.params(ctx)
+		if len(event) not in (1,2):
+			raise SyntaxError(u"Usage: batch ‹size› [‹seconds›]")
+		try:
+			self.parent.batch_size = int(event[0])
+			if self.parent.batch_size < 1:
+				raise ValueError
+			if len(event) > 1:
+				self.parent.batch_delay = float(event[1])
+				if self.parent.batch_delay <= 0:
+					raise ValueError
+		except ValueError:
+			raise SyntaxError(u"batch: ‹size› and ‹seconds› need to be positive numbers")
+
+
 class RRDconnected(Check):
 	name="connected rrd"
 	doc="Test if the named rrd server connection is up"
@@ -198,6 +289,7 @@ class RRDfile(Collected):
 	storage = RRDfiles.storage
 	last_sent = None
 	last_sent_at = None
+	last_error = None
 	def __init__(self,server,filename,name):
 		super(RRDfile,self).__init__(name)
 		self.server = server
@@ -211,6 +303,8 @@ class RRDfile(Collected):
 		if self.last_sent is not None:
 			yield ("last_sent",self.last_sent)
 			yield ("last_sent_at",self.last_sent_at)
+		if self.last_error is not None:
+			yield ("last_error",self.last_error)
 
 
 
@@ -283,6 +377,100 @@ class RRDsendUpdate(RRDmsgBase):
 		return "update %s %d:%s" % (self.file.filename,int(unixtime(now())),":".join((str(x) for x in self.val)))
 
 
+class RRDbatchedUpdate(object):
+	"""One update, waiting for its batch to be sent."""
+	def __init__(self,file,val):
+		self.file = file
+		self.result = AsyncResult()
+		# timestamp it now, not when the batch is sent
+		self.msg = "update %s %d:%s" % (file.filename,int(unixtime(now())),":".join((str(x) for x in val)))
+
+	def ok(self,msg):
+		self.result.set(msg)
+
+	def error(self,msg):
+		if "illegal attempt to update using time" in msg:
+			self.result.set(msg)
+			return
+		self.file.last_error = msg
+		log("rrd",WARN,"update",self.file.name,msg)
+		self.result.set(RRDerror(msg))
+
+
+class RRDbatchMsg(RRDmsgBase):
+	"""\
+		Send a number of updates with one BATCH command.
+		The server replies with the number of failed updates, followed by
+		one line for each (line number and error message).
+		"""
+	timeout=10
+	blocking = True # nothing may be sent between BATCH and the end marker
+
+	def __init__(self,queue,updates):
+		super(RRDbatchMsg,self).__init__()
+		self.queue = queue
+		self.updates = updates
+		self.conn = None
+
+	msg = "BATCH"
+
+	def send(self,conn):
+		self.conn = None
+		super(RRDbatchMsg,self).send(conn)
+		self.conn = conn
+		return RECV_AGAIN
+
+	def retry(self):
+		self.conn = None
+		return super(RRDbatchMsg,self).retry()
+
+	def _fail(self, msg):
+		for u in self.updates:
+			u.error(msg)
+		self.result.set(RRDerror(msg))
+
+	def abort(self):
+		if not self.result.ready():
+			self._fail("aborted")
+		super(RRDbatchMsg,self).abort()
+
+	def recv(self,msg):
+		if msg.type is MT_ERROR:
+			self._fail(msg.msg)
+			return MINE
+		if msg.type is not MT_ACK and msg.type is not MT_MULTILINE:
+			return NOT_MINE
+
+		if self.conn is not None: # "go ahead": send the updates
+			conn,self.conn = self.conn,None
+			lines = [u.msg for u in self.updates]
+			lines.append(".")
+			log("rrd",TRACE,"send batch",len(self.updates))
+			conn.write("\n".join(lines))
+			return RECV_AGAIN
+
+		failed = {}
+		if msg.type is MT_MULTILINE:
+			for line in msg.data:
+				n,_,err = line.partition(" ")
+				try:
+					n = int(n)-1
+					if not 0 <= n < len(self.updates):
+						raise ValueError
+				except ValueError:
+					log("rrd",WARN,"batch reply",line)
+				else:
+					failed[n] = err.strip()
+		for i,u in enumerate(self.updates):
+			if i in failed:
+				u.error(failed[i])
+			else:
+				u.ok(msg.msg)
+		self.queue.n_batch_errors += len(failed)
+		self.result.set(msg.msg)
+		return MINE
+
+
 class RRDset(AttributedStatement):
 	name="set rrd"
 	dest = None
@@ -310,8 +498,10 @@ send rrd ‹val…› :to ‹name…›
 		rrdf = RRDfiles[name]
 		rrdf.last_sent = val
 		rrdf.last_sent_at = now()
-		msg = RRDsendUpdate(rrdf,val)
-		res = msg.result.get()
+		res = rrdf.server.update(rrdf,val)
+		if rrdf.server.batch_size:
+			return
+		res = res.get()
 		if isinstance(res,Exception):
 			reraise(res)
 
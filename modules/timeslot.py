@@ -25,7 +25,7 @@ timeslot FOO...
 
 """
 
-from homevent.timeslot import Timeslots, Timeslot, Timeslotted
+from homevent.timeslot import Timeslots, Timeslot, Timeslotted, scheduler
 from homevent.statement import AttributedStatement, Statement, main_words,\
 	global_words
 from homevent.module import Module
@@ -244,6 +244,21 @@ var timeslot NAME name...
 		setattr(self.parent.ctx,var,Timeslots[name].running)
 
 
+class VarOpenTimeslotsHandler(Statement):
+	name="var open timeslots"
+	doc="assign a variable to the list of open timeslots"
+	long_doc=u"""\
+var open timeslots NAME
+	: $NAME contains the names of the timeslots which are open right
+	  now, separated by commas.
+"""
+	def run(self,ctx,**k):
+		event = self.params(ctx)
+		if len(event) != 1:
+			raise SyntaxError(u"Usage: var open timeslots ‹variable›")
+		setattr(self.parent.ctx,event[0],", ".join(" ".join(unicode(x) for x in s.name) for s in scheduler.open_slots()))
+
+
 class TimeslotModule(Module):
 	"""\
 		This module contains the generic handlers for timesloting.
@@ -257,6 +272,7 @@ class TimeslotModule(Module):
 		main_words.register_statement(TimeslotStart)
 		main_words.register_statement(TimeslotStop)
 		main_words.register_statement(VarTimeslotHandler)
+		main_words.register_statement(VarOpenTimeslotsHandler)
 		register_condition(RunningTimeslotCheck)
 		register_condition(DuringTimeslotCheck)
 	
@@ -266,6 +282,7 @@ class TimeslotModule(Module):
 		main_words.unregister_statement(TimeslotStart)
 		main_words.unregister_statement(TimeslotStop)
 		main_words.unregister_statement(VarTimeslotHandler)
+		main_words.unregister_statement(VarOpenTimeslotsHandler)
 		unregister_condition(RunningTimeslotCheck)
 		unregister_condition(DuringTimeslotCheck)
 
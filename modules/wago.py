@@ -31,7 +31,7 @@ from homevent.statement import AttributedStatement, Statement, main_words
 from homevent.check import Check,register_condition,unregister_condition
 from homevent.monitor import Monitor,MonitorHandler, MonitorAgain
 from homevent.net import NetConnect,LineReceiver,NetActiveConnector,NetRetry
-from homevent.twist import reraise,callLater,fix_exception
+from homevent.twist import reraise,callLater
 from homevent.run import simple_event
 from homevent.context import Context
 from homevent.times import humandelta,now,unixdelta,simple_time_delta
@@ -70,15 +70,6 @@ class WAGObadResult(RuntimeError):
 class WAGOerror(RuntimeError):
 	pass
 
-class DroppedMonitor(RuntimeError):
-	"""After reconnecting, a monitor is gone"""
-	def __init__(self,mid):
-		self.mid = mid
-	def __str__(self):
-		return "DroppedMonitor:%d" % (self.mid,)
-	def __repr__(self):
-		return "DroppedMonitor(%d)" % (self.mid,)
-
 class WAGOassembler(LineReceiver):
 	buf = None
 	def lineReceived(self, line):
@@ -231,24 +222,12 @@ class WAGOmonitorsMsg(WAGOmsgBase):
 					continue
 				mon = int(m.group(0))
 				self.data[mon]=x[m.end():]
-				recvs,self.queue.receivers = self.queue.receivers,[]
-				for r in recvs:
-					mid = getattr(r,"msgid",None)
-					if mid is None or mid in self.data:
-						log("wago",TRACE,"found monitor",r)
-						self.queue.receivers.append(r)
-					else:
-						try:
-							raise DroppedMonitor(mid)
-						except DroppedMonitor as ex:
-							fix_exception(ex)
-							res = r.error(ex)
-							if res is SEND_AGAIN:
-								log("wago",TRACE,"retry monitor",r)
-								self.queue.enqueue(r)
-							else:
-								log("wago",TRACE,"drop monitor",r)
-								assert res is None or res is False, "%s.error returned %s"%(repr(r),repr(res))
+
+			# Monitors which the server didn't report are left alone.
+			for r in self.queue.all_receivers():
+				mid = getattr(r,"msgid",None)
+				if mid is not None and mid in self.data:
+					log("wago",TRACE,"found monitor",r)
 
 			return MINE
 		if msg.type is MT_NAK or msg.type is MT_ERROR:
@@ -270,6 +249,10 @@ class WAGOkeepaliveMsg(WAGOmsgBase):
 	last_recv = None
 	msgid = None
 
+	@property
+	def recv_key(self):
+		return self.msgid
+
 	def __init__(self,queue, tm,maxtm):
 		self.queue = queue
 		if maxtm is None:
@@ -348,6 +331,13 @@ class WAGOqueue(MsgQueue):
 	def __init__(self, name, host,port, *a,**k):
 		super(WAGOqueue,self).__init__(name=name, factory=MsgFactory(WAGOchannel,name=name,host=host,port=port, **k))
 
+	def msg_key(self,msg):
+		# "!+num" announces a new ID, so it must go to whoever is waiting
+		# for one; other indications go to the receiver with that ID.
+		if msg.type is MT_IND or msg.type is MT_IND_NAK:
+			return getattr(msg,"msgid",None)
+		return None
+
 	def setup(self):
 		self.enqueue(WAGOinitMsg(self))
 		self.enqueue(WAGOmonitorsMsg(self))
@@ -511,6 +501,10 @@ class WAGOtimedOutputRun(WAGOoutputRun):
 		yield ("timer",self.timer)
 		yield ("id",self.msgid)
 
+	@property
+	def recv_key(self):
+		return self.msgid
+
 	@property
 	def msg(self):
 		delta = unixdelta(self.timer.end-now(True))
@@ -716,6 +710,7 @@ class WAGOmonRun(WAGOioRun):
 	def _set_msgid(self,val):
 		self.monitor.msgid = val
 	msgid = property(_get_msgid,_set_msgid)
+	recv_key = property(_get_msgid)
 
 	def list(self):
 		for r in super(WAGOmonRun,self).list():
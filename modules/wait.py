@@ -36,22 +36,58 @@ from homevent.times import time_delta, time_until, unixtime,unixdelta, now, huma
 from homevent.check import Check,register_condition,unregister_condition
 from homevent.base import Name,SName
 from homevent.collect import Collection,Collected
-from homevent.twist import callLater,fix_exception,Jobber
+from homevent.twist import callLater,fix_exception
 from homevent.logging import log_exc,TRACE
 from homevent.delay import DelayFor,DelayWhile,DelayUntil,DelayNext,\
 	DelayError,DelayDone,DelayCancelled
 
 import gevent
-from gevent.queue import Channel
+from gevent.event import AsyncResult
+
+from bisect import insort,bisect_left
 
 from time import time
 import os
 import datetime as dt
 
 timer_nr = 0
+waiter_nr = 0
 
 class Waiters(Collection):
+	"""\
+		All active waiters.
+		Besides the usual by-name lookup, this keeps the waiters
+		ordered by the time they'll trigger.
+		"""
 	name = "wait"
+
+	def __init__(self):
+		super(Waiters,self).__init__()
+		self.by_end = []
+
+	def index(self,w):
+		insort(self.by_end,(w._key,w))
+
+	def unindex(self,w):
+		k = w._key
+		i = bisect_left(self.by_end,(k,))
+		if i < len(self.by_end) and self.by_end[i][1] is w:
+			del self.by_end[i]
+
+	def next(self):
+		"""Return the waiter which will trigger next, or None."""
+		if not self.by_end:
+			return None
+		return self.by_end[0][1]
+
+	def itervalues(self):
+		"""Iterate over all waiters, the next one to trigger first."""
+		for k,w in self.by_end[:]:
+			yield w
+
+	def iteritems(self):
+		for w in self.itervalues():
+			yield w.name,w
 Waiters = Waiters()
 Waiters.does("del")
 
@@ -65,18 +101,26 @@ else:
 class DupWaiterError(DelayError):
 	text = u"A waiter ‹%s› already exists"
 
-class Waiter(Collected,Jobber):
-	"""This is the thing that waits."""
+class Waiter(Collected):
+	"""\
+		This is the thing that waits.
+
+		It doesn't have a greenlet of its own: the "wait" statement
+		blocks on self.done, which the timer (or a cancel) sets.
+		"""
 	force = False
 	storage = Waiters.storage
 	_plinger = None
-	_running = False
-	q = None
+	done = None
+	end = None
 
 	def __init__(self,parent,name,force):
 		self.ctx = parent.ctx
 		self.start = now()
 		self.force = force
+		global waiter_nr
+		waiter_nr += 1
+		self.nr = waiter_nr
 		try:
 			self.parent = parent.parent
 		except AttributeError:
@@ -120,9 +164,14 @@ class Waiter(Collected,Jobber):
 	def __repr__(self):
 		return u"‹%s %s %s›" % (self.__class__.__name__, self.name,self.value)
 
+	@property
+	def _key(self):
+		return (unixtime(self.end),self.nr)
+
 	def _pling(self):
 		self._plinger = None
-		self._cmd("timeout")
+		if self.active:
+			self._finish(True)
 
 	def _set_pling(self):
 		timeout = unixtime(self.end) - unixtime(now(self.force))
@@ -131,80 +180,55 @@ class Waiter(Collected,Jobber):
 		if self._plinger:
 			self._plinger.cancel()
 		self._plinger = callLater(self.force, timeout, self._pling)
-		
-	def _job(self):
-		try:
-			self._set_pling()
-			self._running = True
-			while True:
-				cmd = self.q.get()
-	
-				q = cmd[0]
-				a = cmd[2] if len(cmd)>2 else None
-				cmd = cmd[1]
-				if cmd == "timeout":
-					assert self._plinger is None
-					q.put(None)
-					return True
-				elif cmd == "cancel":
-					if self._plinger:
-						self._plinger.cancel()
-						self._plinger = None
-					q.put(None)
-					return False
-				elif cmd == "update":
-					q.put(None)
-					self.end = a
-					self._set_pling()
-				elif cmd == "remain":
-					q.put(unixtime(self.end)-unixtime(now(self.force)))
-				else:
-					q.put(RuntimeError('Unknown command: '+cmd))
-		finally:
-			q,self.q = self.q,None
-			super(Waiter,self).delete()
-			if q is not None:
-				while not q.empty():
-					q.get()[0].put(StopIteration())
+
+	def _finish(self,res):
+		"""The wait is over: wake up the 'wait' statement."""
+		if self._plinger:
+			self._plinger.cancel()
+			self._plinger = None
+		Waiters.unindex(self)
+		super(Waiter,self).delete()
+		self.done.set(res)
 
 	def init(self,dest):
-		self.q = Channel()
 		self.end = dest
-		self.start_job("job",self._job)
-
-	def _cmd(self,cmd,*a):
-		if self.q is None:
-			raise DelayDone(self)
+		self.done = AsyncResult()
+		Waiters.index(self)
+		self._set_pling()
 
-		q = Channel()
-		self.q.put((q,cmd)+tuple(a))
-		res = q.get()
-		if isinstance(res,BaseException):
-			raise res
-		return res
+	@property
+	def active(self):
+		return self.done is not None and not self.done.ready()
 
 	@property
 	def value(self):
-		if self.q is None:
+		if not self.active:
 			return 0
-		if not self._running:
-			return "??"
-		res = self._cmd("remain")
+		res = unixtime(self.end)-unixtime(now(self.force))
 		if TESTING:
 			res = "%.1f" % (res,)
 		return res
 
 	def delete(self,ctx=None):
-		self._cmd("cancel")
+		if not self.active:
+			raise DelayDone(self)
+		self._finish(False)
 
 	def cancel(self, err=DelayCancelled):
 		"""Cancel a waiter."""
 		process_event(Event(self.ctx(loglevel=TRACE),"wait","cancel",ixtime(self.end,self.force),*self.name))
-		self._cmd("cancel")
+		if not self.active:
+			raise DelayDone(self)
+		self._finish(False)
 
 	def retime(self, dest):
 		process_event(Event(self.ctx(loglevel=TRACE),"wait","update",dest,*self.name))
-		self._cmd("update",dest)
+		if not self.active:
+			raise DelayDone(self)
+		Waiters.unindex(self)
+		self.end = dest
+		Waiters.index(self)
+		self._set_pling()
 
 	
 class WaitHandler(AttributedStatement):
@@ -240,10 +264,7 @@ wait [NAME…]: for FOO…
 		w.init(self.timespec())
 		process_event(Event(self.ctx(loglevel=TRACE),"wait","start",ixtime(w.end,self.force),*w.name))
 		try:
-			if w.job:
-				r = w.job.get()
-			else:
-				r = True
+			r = w.done.get()
 		except Exception as ex:
 			fix_exception(ex)
 			log_exc(msg=u"Wait %s died:"%(self.name,), err=ex, level=TRACE)
@@ -302,6 +323,15 @@ class ExistsWaiterCheck(Check):
 		name = Name(*args)
 		return name in Waiters
 
+class NextWaiterCheck(Check):
+	name="next wait"
+	doc="check if a waiter is the next one to trigger"
+	def check(self,*args):
+		if not len(args):
+			raise SyntaxError(u"Usage: if next wait ‹name…›")
+		w = Waiters.next()
+		return w is not None and w.name == Name(*args)
+
 class VarWaitHandler(Statement):
 	name="var wait"
 	doc="assign a variable to report when a waiter will time out"
@@ -338,10 +368,12 @@ class WaitModule(Module):
 		main_words.register_statement(WaitHandler)
 		main_words.register_statement(VarWaitHandler)
 		register_condition(Waiters.exists)
+		register_condition(NextWaiterCheck)
 	
 	def unload(self):
 		main_words.unregister_statement(WaitHandler)
 		main_words.unregister_statement(VarWaitHandler)
 		unregister_condition(Waiters.exists)
+		unregister_condition(NextWaiterCheck)
 
 init = WaitModule
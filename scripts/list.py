@@ -27,13 +27,6 @@ This code implements access to collections.
 
 """
 
-from datetime import datetime
-import os
-
-from homevent.base import Name,flatten
-
-from gevent import spawn
-from gevent.queue import Queue
 from optparse import OptionParser
 parser = OptionParser(conflict_handler="resolve")
 parser.add_option("-h","--help","-?", action="help",
@@ -42,59 +35,31 @@ parser.add_option("-s", "--server", dest="host", action="store",
 	default="::1", help="Server to connect to")
 parser.add_option("-p", "--port", dest="port", action="store",
 	type="int",default="50005", help="port to connect to")
+parser.add_option("-n", "--chunk", dest="chunk", action="store",
+	type="int",default="1000", help="lines to fetch per call")
 
 (opts, args) = parser.parse_args()
 
-def getter(q):
-	while True:
-		res = q.get()
-		if res is None:
-			return
-		p,t = res
-		if isinstance(t,datetime):
-			if TESTING and t.year != 2003:
-				t = "%s" % (humandelta(t-now(t.year != 2003)),)
-			else:
-				t = "%s (%s)" % (humandelta(t-now(t.year != 2003)),t)
-			if TESTING:
-				lim = 3
-			else:
-				lim = 4
-			ti = t.rfind('.')
-			if ti>0 and len(t)-ti>lim and len(t)-ti<lim+6: # limit to msec
-				t = t[:ti+lim]+")"
+def name(n):
+	if isinstance(n,tuple):
+		return u" ".join(unicode(x) for x in n)
+	return unicode(n)
 
-		print p+u": "+unicode(t)
+def out_one(kind,r):
+	if kind == "object" or r[0] == "* ERROR *": # path: value
+		print r[0]+u": "+unicode(r[1])
+	elif kind == "entries": # "*": entry path: value
+		print name(r[0])+u" "+r[1]+u": "+unicode(r[2])
+	elif len(r) == 1: # a collection, or an entry without info
+		print name(r[0])
+	else: # entry :: info
+		print name(r[0])+u" :: "+unicode(r[1])
 
-def out_one(p,c):
-	q = Queue(3)
-	try:
-		job = spawn(getter,q)
-		flatten(q,(c,),p)
-	finally:
-#					with log_wait("list "+str(event)):
-		q.put(None)
-		job.join()
-
-	
 c = rpyc.connect(opts.host, opts.port, ipv6=True)
-for x in c.root.cmd_list(*args):
-	if x is None:
-		print "(None?)"
-		continue
-		
-	if len(x) == 2:
-		a,b = x
-		a = str(a)
-		out_one(a,b)
-#		if hasattr(b,"list"):
-#			for bb in b.list():
-#				print a,bb
-#			continue
-#		else:
-#			print a,b
-	else:
-		if len(x) == 1 and isinstance(x[0],Name):
-			x=str(x[0])
-		print x
-
+rows,cursor,kind = c.root.cmd_list_chunk(tuple(args), size=opts.chunk)
+while True:
+	for r in rows:
+		out_one(kind,r)
+	if cursor is None:
+		break
+	rows,cursor,kind = c.root.cmd_list_chunk(tuple(args), cursor, size=opts.chunk)
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##
+##  Copyright © 2007-2012, Matthias Urlichs <matthias@urlichs.de>
+##
+##  This program is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License (included; see the file LICENSE)
+##  for more details.
+##
+
+"""\
+Variable lookup in a 10-deep context chain, compared to walking the
+parents as Context used to. The cache is also measured while some
+unrelated context, or the chain's own root, is written to between
+lookups; any write invalidates all caches, so these lookups should
+cost about as much as walking the parents, but not more.
+
+	PYTHONPATH=. HOMEVENT_TEST=1 python test/bench/context.py
+"""
+
+from homevent.context import Context,VanishedAttribute
+
+from time import time
+
+N = 200000
+
+def walk(ctx,key):
+	r = VanishedAttribute
+	for p in ctx._parents():
+		try:
+			r = p._store[key]
+		except KeyError:
+			pass
+		else:
+			break
+	return r
+
+root = Context(top="value")
+c = root
+for i in range(10):
+	c = c(**{"x%d"%i: i})
+other = Context()(y=1)
+
+t1 = time()
+for i in xrange(N):
+	walk(c,"top")
+t2 = time()
+for i in xrange(N):
+	c.top
+t3 = time()
+for i in xrange(N):
+	c()
+t4 = time()
+for i in xrange(N):
+	other.y = i
+	c.top
+t5 = time()
+for i in xrange(N):
+	other.y = i
+t6 = time()
+for i in xrange(N):
+	root.y = i
+	c.top
+t7 = time()
+
+print "walk parents: %.2f µs/lookup" % ((t2-t1)*1000000/N,)
+print "cached:       %.2f µs/lookup" % ((t3-t2)*1000000/N,)
+print "new context:  %.2f µs/call" % ((t4-t3)*1000000/N,)
+print "other writes: %.2f µs/lookup" % ((t5-t4-(t6-t5))*1000000/N,)
+print "root writes:  %.2f µs/lookup" % ((t7-t6-(t6-t5))*1000000/N,)
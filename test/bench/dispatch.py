@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##
+##  Copyright © 2007-2012, Matthias Urlichs <matthias@urlichs.de>
+##
+##  This program is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License (included; see the file LICENSE)
+##  for more details.
+##
+
+"""\
+Dispatch 100k events against 5k handlers, with and without the
+worker index.
+
+	PYTHONPATH=. HOMEVENT_TEST=1 python test/bench/dispatch.py
+"""
+
+import homevent.run as run
+from homevent.run import register_worker,unregister_worker, \
+	worker_index,_worker_order
+from homevent.worker import Worker
+from homevent.event import Event
+from homevent.context import Context
+from homevent.base import Name
+
+from time import time
+import random
+
+N_HANDLERS = 5000
+N_EVENTS = 100000
+
+class BenchWorker(Worker):
+	"""Matches like an "on" handler does."""
+	def __init__(self, args):
+		self.args = args
+		self.event_words = tuple((None if a.startswith('*') else a) for a in args)
+		super(BenchWorker,self).__init__(Name(*args))
+
+	def does_event(self,event):
+		if len(event) != len(self.args):
+			return False
+		for a,e in zip(self.args,event):
+			if not a.startswith('*') and a != str(e):
+				return False
+		return True
+
+def linear(e):
+	res = []
+	for wp in run.work_prios:
+		for w in run.workers[wp]:
+			if w.does_event(e):
+				res.append(w)
+	return res
+
+def indexed(e):
+	res = []
+	for w in sorted(worker_index.find(e), key=_worker_order):
+		if w.does_event(e):
+			res.append(w)
+	return res
+
+random.seed(42)
+kinds = ("fs20","onewire","wago","timer","switch")
+ws = []
+for i in range(N_HANDLERS):
+	k = kinds[i % len(kinds)]
+	if i % 50 == 0:
+		args = (k,"*","state")
+	else:
+		args = (k,"dev%d" % (i,),"*val")
+	w = BenchWorker(args)
+	ws.append(w)
+	register_worker(w)
+
+ctx = Context()
+events = []
+for i in range(N_EVENTS):
+	k = kinds[i % len(kinds)]
+	events.append(Event(ctx, k,"dev%d" % (random.randrange(N_HANDLERS),),"state"))
+
+for name,fn in (("linear",linear),("indexed",indexed)):
+	n = 0
+	t1 = time()
+	for e in events:
+		n += len(fn(e))
+	t2 = time()
+	print "%-8s %d events, %d handlers, %d matches: %.2f sec, %.1f µs/event" % \
+		(name, N_EVENTS, N_HANDLERS, n, t2-t1, (t2-t1)*1000000/N_EVENTS)
+
+for w in ws:
+	unregister_worker(w)
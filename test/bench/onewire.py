@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##
+##  Copyright © 2007-2012, Matthias Urlichs <matthias@urlichs.de>
+##
+##  This program is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License (included; see the file LICENSE)
+##  for more details.
+##
+
+"""\
+Read the temperature of 20 fake 1wire devices 25 times each, via one
+plain connection and via a pool of pipelined connections.
+
+	PYTHONPATH=. HOMEVENT_TEST=1 python test/bench/onewire.py
+
+This starts test/scripts/owfs_job.py, which takes 10 msec per read.
+"""
+
+from homevent.reactor import mainloop,shut_down
+from homevent.onewire import connect,disconnect, get_many
+from homevent.base import Name
+
+import gevent
+from gevent.pool import Pool
+from time import time
+import subprocess
+import sys
+import os
+
+PORT = 54301
+DELAY = 0.01
+N_DEV = 20
+N_READS = 25
+
+SETUPS = (
+	("plain",1,1),
+	("pool 4x8",4,8),
+)
+
+def bench(name,connections,pipeline, port):
+	bus = connect(host="localhost", port=port, name=Name("bench",name), connections=connections, pipeline=pipeline)
+	try:
+		bus.run_watcher()
+		devs = [d for d in bus.all_devices()]
+		for d in devs:
+			d.get("type") # warm up
+
+		pool = Pool(100)
+		t1 = time()
+		for _ in range(N_READS):
+			for d in devs:
+				pool.spawn(d.get,"temperature")
+		pool.join()
+		t2 = time()
+
+		n = N_READS*len(devs)
+		print "%-10s %d reads: %.2f sec, %.1f reads/sec" % (name, n, t2-t1, n/(t2-t1))
+
+		t1 = time()
+		for _ in range(N_READS):
+			get_many((d,"temperature") for d in devs)
+		t2 = time()
+		print "%-10s %d bulk reads: %.2f sec, %.1f reads/sec" % (name, n, t2-t1, n/(t2-t1))
+		for k,v in bus.list():
+			if k in ("calls","latency avg","latency max"):
+				print "\t%s: %s" % (k,v)
+	finally:
+		disconnect(bus)
+		bus.delete()
+
+def main():
+	try:
+		port = PORT
+		for name,connections,pipeline in SETUPS:
+			bench(name,connections,pipeline, port)
+			port += 1 # every setup gets a fresh server
+	finally:
+		shut_down()
+
+if __name__ == '__main__':
+	here = os.path.dirname(__file__)
+	jobs = []
+	for i in range(len(SETUPS)):
+		jobs.append(subprocess.Popen([sys.executable, os.path.join(here,"..","scripts","owfs_job.py"), str(PORT+i), str(DELAY), str(N_DEV)]))
+	gevent.sleep(1)
+	try:
+		mainloop(main)
+	finally:
+		for j in jobs:
+			j.kill()
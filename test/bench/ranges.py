@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##
+##  Copyright © 2012, Matthias Urlichs <matthias@urlichs.de>
+##
+##  This program is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License (included; see the file LICENSE)
+##  for more details.
+##
+
+"""\
+Calculate the watering windows of 500 fake valves for the next two
+weeks, the way Valve._range does it: group day ranges minus excluded
+days, minus blocked times, schedules, controller and feed limits.
+
+	PYTHONPATH=.:irrigation python test/bench/ranges.py
+
+The data are random (but seeded), so the runs are comparable.
+"""
+
+from rainman.utils import Ranges, range_union,range_intersection,range_invert
+from django.utils.timezone import utc
+
+from datetime import datetime,timedelta
+from time import time
+import random
+
+N_VALVES = 500
+N_GROUPS = 20
+N_CONTROLLERS = 5
+N_FEEDS = 10
+N_DAYS = 14
+
+def day_ranges(start, hours):
+	"""One range per day, from/to hours"""
+	a,b = hours
+	for d in range(N_DAYS):
+		yield start+timedelta(d,a*3600), timedelta(0,(b-a)*3600)
+
+def free_ranges(start, n, length):
+	"""The times between n random blocks of ‹length› seconds"""
+	end = start+timedelta(N_DAYS)
+	t = sorted(start+timedelta(0,random.randrange(N_DAYS*86400)) for _ in range(n))
+	for x in t:
+		if x > start:
+			yield start, x-start
+		start = max(start, x+timedelta(0,length))
+	if end > start:
+		yield start, end-start
+
+def setup(start):
+	random.seed(42)
+	groups = []
+	for g in range(N_GROUPS):
+		days = [Ranges(day_ranges(start,(6,10))), Ranges(day_ranges(start,(18+g%3,22)))]
+		xdays = [Ranges((s,l) for s,l in day_ranges(start,(0,24)) if s.weekday() == g%7)]
+		groups.append((days,xdays,Ranges(free_ranges(start,5,3600))))
+	controllers = [Ranges(free_ranges(start,50,900)) for _ in range(N_CONTROLLERS)]
+	feeds = [Ranges(free_ranges(start,50,900)) for _ in range(N_FEEDS)]
+
+	valves = []
+	for v in range(N_VALVES):
+		valves.append(dict(
+			groups = (groups[v%N_GROUPS], groups[(v*7)%N_GROUPS]),
+			blocked = list(free_ranges(start,3,1800)),
+			scheduled = list(free_ranges(start,20,600)),
+			controller = controllers[v%N_CONTROLLERS],
+			feed = feeds[v%N_FEEDS],
+		))
+	return valves
+
+def valve_range(v, start,end):
+	days = range_union(*(d for g in v["groups"] for d in g[0]))
+	xdays = range_union(*(x for g in v["groups"] for x in g[1]))
+	r = [range_intersection(days, range_invert(start,end-start,xdays))]
+	r.extend(g[2] for g in v["groups"])
+	r.append(Ranges(v["blocked"]))
+	r.append(Ranges(v["scheduled"]))
+	r.append(v["controller"])
+	r.append(v["feed"])
+	return range_intersection(*r)
+
+def main():
+	start = datetime(2012,6,1,tzinfo=utc)
+	end = start+timedelta(N_DAYS)
+	valves = setup(start)
+
+	t1 = time()
+	n = 0
+	for v in valves:
+		n += len(valve_range(v, start,end))
+	t2 = time()
+	print "%d valves, %d days: %.2f sec, %.1f valves/sec, %d ranges" % (N_VALVES, N_DAYS, t2-t1, N_VALVES/(t2-t1), n)
+
+if __name__ == '__main__':
+	main()
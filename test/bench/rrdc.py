@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##
+##  Copyright © 2007-2012, Matthias Urlichs <matthias@urlichs.de>
+##
+##  This program is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License (included; see the file LICENSE)
+##  for more details.
+##
+
+"""\
+Send 20 updates to each of 50 RRD files, one at a time and in batches.
+
+	PYTHONPATH=. HOMEVENT_TEST=1 python test/bench/rrdc.py
+
+This starts test/scripts/rrdcached_job.py, which takes 2 msec per reply.
+One of the files is "missing", so its updates fail; in batch mode, the
+errors need to end up at that file.
+"""
+
+from homevent.reactor import mainloop,shut_down
+from homevent.base import Name
+
+import gevent
+from gevent.pool import Pool
+from time import time
+import subprocess
+import imp
+import sys
+import os
+
+PORT = 52443
+DELAY = 0.002
+N_FILES = 50
+N_UPDATES = 20
+
+SETUPS = (
+	("plain",None),
+	("batch 100",100),
+)
+
+def bench(rrdc, name,batch_size, port):
+	q = rrdc.RRDqueue(name=Name("bench",name), host="localhost", port=port)
+	if batch_size:
+		q.batch_size = batch_size
+		q.batch_delay = 0.1
+	q.start()
+	try:
+		files = []
+		for i in range(N_FILES):
+			fn = "/tmp/%s%d.rrd" % ("missing" if i == 0 else "bench",i)
+			files.append(rrdc.RRDfile(q,fn,Name("bench",name,str(i))))
+		q.update(files[1],(0,)).get() # warm up
+
+		results = []
+		pool = Pool(100)
+		t1 = time()
+		for n in range(N_UPDATES):
+			for f in files:
+				pool.spawn(lambda f,n: results.append(q.update(f,(n,)).get()), f,n)
+		pool.join()
+		t2 = time()
+
+		n = N_UPDATES*len(files)
+		errs = sum(1 for r in results if isinstance(r,Exception))
+		print "%-10s %d updates: %.2f sec, %.1f updates/sec, %d errors" % (name, n, t2-t1, n/(t2-t1), errs)
+		for f in files:
+			if f.last_error is not None:
+				print "\t%s: %s" % (f.filename,f.last_error)
+		for f in files:
+			f.delete()
+	finally:
+		q.delete()
+
+def main():
+	try:
+		rrdc = imp.load_source("rrdc",os.path.join(os.path.dirname(__file__),"..","..","modules","rrdc.py"))
+		port = PORT
+		for name,batch_size in SETUPS:
+			bench(rrdc, name,batch_size, port)
+	finally:
+		shut_down()
+
+if __name__ == '__main__':
+	here = os.path.dirname(__file__)
+	job = subprocess.Popen([sys.executable, os.path.join(here,"..","scripts","rrdcached_job.py"), str(PORT), str(DELAY)])
+	gevent.sleep(1)
+	try:
+		mainloop(main)
+	finally:
+		job.kill()
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##
+##  Copyright © 2007-2012, Matthias Urlichs <matthias@urlichs.de>
+##
+##  This program is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License (included; see the file LICENSE)
+##  for more details.
+##
+
+"""\
+Step through a year in one-minute steps and calculate when a couple of
+"wait until" specs match next (and stop matching), once by parsing the
+spec every time (as time_until used to) and once with the cached
+TimeSpec.
+
+	PYTHONPATH=. python test/bench/times.py
+"""
+
+from homevent.times import TimeSpec, time_until
+
+import datetime as dt
+from time import time
+
+SPECS = (
+	("10","min"),
+	("6","h","30","min"),
+	("sat","8","h"),
+	("2","sun","-","1","h"),
+	("14","wk"),
+)
+START = dt.datetime(2003,1,1)
+STEP = dt.timedelta(0,60)
+N = 365*24*60
+
+def run(name, until):
+	t1 = time()
+	for spec in SPECS:
+		t = START
+		for _ in xrange(N):
+			until(spec, t, False)
+			until(spec, t, True)
+			t += STEP
+	t2 = time()
+	n = 2*N*len(SPECS)
+	print "%-8s %d calls: %.2f sec, %.1f µsec/call" % (name, n, t2-t1, (t2-t1)*1e6/n)
+	return t2-t1
+
+def uncached(args, now, invert):
+	spec = TimeSpec(tuple(args))
+	if invert:
+		return spec.next_nonmatch(now)
+	return spec.next_match(now)
+
+def cached(args, now, invert):
+	return time_until(args, now=now, invert=invert)
+
+def main():
+	a = run("parsed", uncached)
+	b = run("cached", cached)
+	print "speedup: %.2f" % (a/b,)
+
+if __name__ == '__main__':
+	main()
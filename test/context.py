@@ -45,3 +45,29 @@ del c.foo
 assert "foo" not in c
 assert "foo" not in e
 assert "fupps" not in e
+
+# lookups through a chain of contexts are cached; make sure that
+# changing an ancestor is visible anyway
+f = e
+for i in range(10):
+	f = f(**{"x%d"%i: i})
+assert f.x0 == 0
+c.foo = "baz"
+assert f.foo == "baz"
+d.foo = "quux"
+assert f.foo == "quux"
+del d.foo
+assert "foo" not in f
+try:
+	f.foo
+except AttributeError:
+	pass
+else:
+	assert False
+assert f._nparents == len(list(f._parents()))
+
+g = Context(zot=1)
+h = f(ctx=g)
+assert h.zot == 1
+assert h.x9 == 9
+assert h._nparents == len(list(h._parents()))
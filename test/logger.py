@@ -0,0 +1,64 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##
+##  Copyright © 2007-2010, Matthias Urlichs <matthias@urlichs.de>
+##
+##  This program is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License (included; see the file LICENSE)
+##  for more details.
+##
+
+from homevent.logging import BaseLogger,DEBUG,WARN
+
+class ListLogger(BaseLogger):
+	"""Collects what it writes, and how many lines per batch."""
+	def __init__(self,*a,**k):
+		self.lines = []
+		self.batches = []
+		super(ListLogger,self).__init__(*a,**k)
+	def _start_batch(self):
+		self.batches.append(0)
+	def _slog(self,level,txt):
+		self.lines.append((level,txt))
+		self.batches[-1] += 1
+
+l = ListLogger(DEBUG, queue_len=5, batch_len=2)
+assert l.queue_len == 5 and BaseLogger.queue_len == 1000
+
+# "TEST" lines don't flush, so the writer doesn't get to run
+for i in range(8):
+	l.log(DEBUG,"TEST",i)
+assert len(l.q) == 5
+assert l.n_dropped == 3
+l.flush()
+assert l.lines == [(WARN,"logger 3 lines dropped")] + \
+	[(DEBUG,"TEST %d"%i) for i in range(3,8)], l.lines
+assert max(l.batches) <= 3, l.batches # the warning, then two lines
+
+# lines queued after a flush request are written after it
+l.lines = []
+l.log(DEBUG,"TEST",8)
+l.log(DEBUG,"TEST",9)
+l.flush()
+assert l.lines == [(DEBUG,"TEST 8"),(DEBUG,"TEST 9")], l.lines
+assert l.n_dropped == 3
+
+# a smaller ring drops everything beyond its new size
+l.queue_len = 1
+for i in range(4):
+	l.log(DEBUG,"TEST",i)
+assert len(l.q) == 1
+l.flush()
+assert l.lines[2:] == [(WARN,"logger 3 lines dropped"),(DEBUG,"TEST 3")], l.lines
+assert l.n_dropped == 6
+
+l.delete()
+assert not l.job
@@ -118,6 +118,33 @@ block:
 
 del avg test moving
 
+avg test feed :mode time
+feed avg test feed:
+	values 2 4 8
+	interval 1
+list avg test feed
+block:
+	var avg X test feed
+	if equal $X 3:
+		log DEBUG Yes
+	else:
+		log DEBUG No3 $X
+del avg test feed
+
+## the first value gets lost in the sum's rounding,
+## until the ring buffer has been cycled through
+avg test wrap :mode moving 3
+feed avg test wrap:
+	values 1e16 1 1 1 1 1
+list avg test wrap
+block:
+	var avg X test wrap
+	if equal $X 1:
+		log DEBUG Yes
+	else:
+		log DEBUG No4 $X
+del avg test wrap
+
 
 
 
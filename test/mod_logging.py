@@ -25,6 +25,7 @@ input = """\
 log limit parser NONE
 log limit token NONE
 log DEBUG
+log queue 500 50
 log TRACE "This is not logged"
 log DEBUG "This is logged"
 log WARN "This is logged too"
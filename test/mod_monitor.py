@@ -74,6 +74,60 @@ list monitor baz zaz
 del monitor baz zaz
 
 
+on monitor checking win dow:
+	async:
+		set monitor 1 win dow
+		set monitor 100 win dow
+		set monitor 2 win dow
+		set monitor 3 win dow
+monitor passive:
+	name win dow
+	delay for 10
+	require 2 1
+	window 2
+
+on monitor checking re ject:
+	async:
+		set monitor 10 re ject
+		set monitor 11 re ject
+		set monitor 50 re ject
+		set monitor 12 re ject
+monitor passive:
+	name re ject
+	delay for 10
+	require 3 *
+	reject 2
+
+on monitor checking trim med:
+	async:
+		set monitor 10 trim med
+		set monitor 11 trim med
+		set monitor 50 trim med
+		set monitor 12 trim med
+monitor passive:
+	name trim med
+	delay for 10
+	require 3 2
+
+wait: for 0.2
+list monitor win dow
+list monitor re ject
+list monitor trim med
+del monitor win dow
+del monitor re ject
+del monitor trim med
+
+block:
+	try:
+		monitor passive:
+			name bad window
+			require 3 1
+			window 2
+		log DEBUG No3
+	catch:
+		log DEBUG Yes
+list monitor
+
 input monitest fake
 output monitest fake
 set output 1 monitest
@@ -110,6 +164,7 @@ load_module("tests")
 load_module("ifelse")
 load_module("bool")
 load_module("on_event")
+load_module("errors")
 
 run("monitor",input)
 
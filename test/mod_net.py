@@ -75,6 +75,21 @@ block:
 		log DEBUG No2
 	else:
 		log DEBUG Yes
+
+on net overflow ov er *who:
+	log DEBUG Yes overflow
+on net recv ov er *who *line:
+	log DEBUG got $line
+listen net localhost 50346:
+	name ov er
+	max length 20
+connect net ovc localhost 50346
+send net ovc "This line is a lot longer than the limit."
+send net ovc "short"
+wait OVER:
+	for 0.2
+	debug force
+del net connection ovc
 wait END:
 	for 0.2
 shutdown
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##
+##  Copyright © 2007-2012, Matthias Urlichs <matthias@urlichs.de>
+##
+##  This program is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License (included; see the file LICENSE)
+##  for more details.
+##
+
+from homevent.reactor import ShutdownHandler
+from homevent.module import load_module,Load
+from homevent.statement import DoNothingHandler,main_words
+from homevent.check import register_condition
+from test import run
+
+input = """\
+if not exists module bool: load bool
+if not exists module ifelse: load ifelse
+if not exists module logging: load logging
+if not exists module block: load block
+if not exists module wait: load wait
+if not exists module onewire: load onewire
+if not exists module on_event: load on_event
+if not exists module errors: load errors
+#
+
+connect onewire B localhost 54302:
+	connections 3
+	pipeline 2
+wait scanned:
+	for 3
+	debug force
+
+list onewire lane
+
+# Reading device N takes N/10 seconds.
+# Requests go to the connection with the fewest unanswered ones.
+async:
+	var onewire C "10.000000000001" conn
+	log TRACE one $C
+async:
+	var onewire C "10.000000000002" conn
+	log TRACE two $C
+async:
+	var onewire C "10.000000000003" conn
+	log TRACE three $C
+async:
+	var onewire C "10.000000000003" conn
+	log TRACE four $C
+wait:
+	for 1
+	debug force
+
+# One attribute cannot be read; the other one is still set.
+block:
+	try:
+		var onewire T "10.000000000002" temperature X nothing
+	catch:
+		log TRACE caught
+	log TRACE got $T
+
+# A device which appears behind a multiplexer is found by the next
+# periodic scan, even though that scan is incremental.
+set onewire 1 "1F.000000000004" attach
+wait rescan:
+	for 35
+	debug force
+list onewire device
+
+disconnect onewire B
+wait END:
+	for 0.5
+	debug force
+shutdown
+"""
+
+main_words.register_statement(DoNothingHandler)
+main_words.register_statement(ShutdownHandler)
+main_words.register_statement(Load)
+
+load_module("block")
+load_module("file")
+load_module("ifelse")
+load_module("path")
+load_module("data")
+
+run("onewire2",input)
+
@@ -33,6 +33,7 @@ got_something = event.AsyncResult()
 def tester():
 	sleep(0.2)
 	c = rpyc.connect("localhost",56478)
+	rpyc.BgServingThread(c)
 
 	def called(**k):
 		for a,b in k.iteritems():
@@ -68,10 +69,128 @@ def tester():
 	log("TEST",DEBUG,"The value is: "+c.root.var("get_me"))
 	c.root.command("trigger","send","logger")
 	got_something.get()
+	cm.cancel()
+
+	batch_logger(c)
+	list_chunks(c)
+	monitors(c)
+	overflow(c)
+
 	c.root.command("del","wait","shutdown")
 	cb.cancel()
-	cm.cancel()
 	c.close()
+
+def trigger(c,*a):
+	c.root.command("trigger",*a, sub=(("sync",),))
+
+def show_conn(c,name):
+	for x in c.root.cmd_list(*name):
+		if x[0] in ("queued","events","sent","dropped","remote calls","errors","timeouts"):
+			log("TEST",DEBUG, repr(x))
+	log("TEST",DEBUG,".")
+
+def batch_logger(c):
+	"""The callback gets a list of lines, but only those for "hello"."""
+	got_lines = event.AsyncResult()
+	def logged(lines):
+		got_lines.set([tuple(x) for x in lines])
+	cl = c.root.logger_batch(logged,"hello",DEBUG)
+	c.root.command("log","DEBUG","other","This is not for the logger.")
+	c.root.command("trigger","send","logger")
+	for x in got_lines.get():
+		log("TEST", DEBUG, "The batch logger says: <%d> %s" % (x[0],"¦".join((str(y) for y in x[1:]))))
+	cl.cancel()
+
+def list_chunks(c):
+	"""Fetch a listing in chunks; old cursors expire."""
+	rows,cursor,kind = c.root.cmd_list_chunk(("rpc","server","*"),None,4)
+	log("TEST",DEBUG, "kind: "+kind)
+	while True:
+		for x in rows:
+			log("TEST",DEBUG, repr(x))
+		if cursor is None:
+			break
+		log("TEST",DEBUG, "next chunk")
+		rows,cursor,kind = c.root.cmd_list_chunk((),cursor,4)
+	log("TEST",DEBUG,".")
+
+	cursors = []
+	for i in range(11):
+		rows,cursor,kind = c.root.cmd_list_chunk(("rpc","server"),None,1)
+		cursors.append(cursor)
+	rows,cursor,kind = c.root.cmd_list_chunk((),cursors[-1],1)
+	log("TEST",DEBUG, "%s %s" % (kind,repr(rows)))
+	# the first cursor has been pushed out, the last one has been used up
+	for i in (0,1,10):
+		try:
+			c.root.cmd_list_chunk((),cursors[i],1)
+		except KeyError:
+			log("TEST",DEBUG,"cursor %d: expired" % (i,))
+		else:
+			log("TEST",DEBUG,"cursor %d: OK" % (i,))
+	log("TEST",DEBUG,".")
+
+def monitors(c):
+	"""Events arrive in order, one by one or as a list."""
+	single = []
+	batched = []
+	def got_one(**k):
+		single.append(k)
+	def got_many(events):
+		batched.extend(events)
+	m1 = c.root.monitor(got_one,"order","*")
+	m2 = c.root.monitor_batch(got_many,"order","*")
+	for i in range(4):
+		trigger(c,"order",str(i))
+	sleep(0.5)
+	log("TEST",DEBUG, "single: %s" % (" ".join(str(k["event"][1]) for k in single),))
+	log("TEST",DEBUG, "batched: %s" % (" ".join(str(k["event"][1]) for k in batched),))
+	m1.cancel()
+	m2.cancel()
+
+def overflow(c0):
+	"""\
+		A slow client loses events, or its connection.
+		The events are triggered via c0 so that the test doesn't wait
+		for the slow client.
+		"""
+	slow = event.Event()
+	got = []
+	def blocked(events):
+		got.append(events)
+		slow.wait()
+
+	c = rpyc.connect("localhost",56479)
+	bg = rpyc.BgServingThread(c)
+	c.root.monitor_batch(blocked,"drop","*")
+	for i in range(5):
+		trigger(c0,"drop",str(i))
+	show_conn(c0,("rpc","connection","bar","n2"))
+	slow.set()
+	sleep(0.5)
+	for events in got:
+		log("TEST",DEBUG, "got %s" % (" ".join(str(k["event"][1]) for k in events),))
+	show_conn(c0,("rpc","connection","bar","n2"))
+	bg.stop()
+	c.close()
+
+	slow.clear()
+	del got[:]
+	c = rpyc.connect("localhost",56480)
+	rpyc.BgServingThread(c)
+	c.root.monitor_batch(blocked,"disc","*")
+	for i in range(5):
+		trigger(c0,"disc",str(i))
+	slow.set()
+	sleep(0.5)
+	log("TEST",DEBUG, "%d call" % (len(got),))
+	try:
+		c.root.cmd_list("rpc","connection","baz","n3")
+	except EOFError:
+		log("TEST",DEBUG,"YES disconnected")
+	else:
+		log("TEST",DEBUG,"NO still connected")
+
 def gtester():
 	try:
 		tester()
@@ -81,12 +200,16 @@ j = spawn(gtester)
 
 input = """\
 listen rpc foo 56478
+listen rpc bar 56479:
+	queue 2
+listen rpc baz 56480:
+	queue 2 disconnect
 state the tester :value Test123
 on send logger:
 	log DEBUG hello This is a test
 try:
 	wait shutdown:
-		for 5
+		for 20
 		debug force
 wait foo b:
 	for 1
@@ -41,6 +41,7 @@ wait: for 1.1
 set rrd 11 t tt ttt
 wait: for 1.1
 set rrd 12 t tt ttt
+set rrd 13 t tt ttt
 list rrd t tt ttt
 block:
 	var rrd x last_ds t tt ttt
@@ -51,6 +52,10 @@ block:
 		log DEBUG No3
 	else:
 		log DEBUG Yes
+rrd "/tmp/rrdtest.rrd" nothere bad
+set rrd 5 bad
+list rrd bad
+del rrd bad
 
 """
 
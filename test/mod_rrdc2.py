@@ -0,0 +1,67 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##
+##  Copyright © 2007-2012, Matthias Urlichs <matthias@urlichs.de>
+##
+##  This program is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License (included; see the file LICENSE)
+##  for more details.
+##
+
+from homevent.reactor import ShutdownHandler
+from homevent.module import load_module
+from homevent.statement import main_words
+from test import run
+
+
+input = """\
+connect rrd b localhost 52443:
+	batch 3 1
+rrd file "/tmp/rrdtest.rrd" ok :server b
+rrd file "/tmp/missing.rrd" bad :server b
+wait startup:
+	for 0.2
+	debug force
+
+# The first two updates wait for the third, which sends the batch.
+set rrd 10 ok
+set rrd 11 bad
+log DEBUG two waiting
+set rrd 12 ok
+wait:
+	for 0.2
+	debug force
+
+# A single update is sent a second later.
+set rrd 13 ok
+log DEBUG one waiting
+wait:
+	for 1.5
+	debug force
+
+# Deleting the server fails the updates which are still waiting.
+set rrd 14 ok
+del rrd server b
+shutdown
+"""
+
+main_words.register_statement(ShutdownHandler)
+load_module("trigger")
+load_module("ifelse")
+load_module("data")
+load_module("rrdc")
+load_module("logging")
+load_module("block")
+load_module("wait")
+load_module("errors")
+
+run("rrdc2",input)
+
@@ -174,6 +174,51 @@ block:
 	else:
 		log DEBUG Yes
 
+timeslot t three:
+	every 0.1
+	for 2
+	stopped
+timeslot t one:
+	every 0.1
+	for 2
+	stopped
+timeslot t two:
+	every 0.1
+	for 2
+	stopped
+start timeslot t three
+start timeslot t one
+start timeslot t two
+block:
+	var open timeslots X
+	if equal $X "":
+		log DEBUG Yes
+	else:
+		log DEBUG No8 $X
+wait E during: for 0.15
+block:
+	var open timeslots X
+	if equal $X "t one, t three, t two":
+		log DEBUG Yes
+	else:
+		log DEBUG No8a $X
+stop timeslot t two
+block:
+	var open timeslots X
+	if equal $X "t one, t three":
+		log DEBUG Yes
+	else:
+		log DEBUG No8b $X
+del timeslot t one
+del timeslot t two
+del timeslot t three
+block:
+	var open timeslots X
+	if equal $X "":
+		log DEBUG Yes
+	else:
+		log DEBUG No8c $X
+
 shutdown
 """
 
@@ -53,6 +53,24 @@ on whatever:
 	var wait x Foo Baz
 	log TRACE We wait $x
 trigger whatever :sync
+async:
+	wait A Late: for 5
+async:
+	wait B Soon: for 2
+wait: for 0.1
+list wait
+block:
+	if next wait B Soon:
+		log DEBUG Yes
+	else:
+		log DEBUG No4
+del wait B Soon
+block:
+	if next wait A Late:
+		log DEBUG Yes
+	else:
+		log DEBUG No5
+del wait A Late
 wait: for 0.3
 del wait Foo Baz
 block:
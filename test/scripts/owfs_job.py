@@ -0,0 +1,187 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##
+##  Copyright © 2007-2012, Matthias Urlichs <matthias@urlichs.de>
+##
+##  This program is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License (included; see the file LICENSE)
+##  for more details.
+##
+
+"""\
+A fake owserver which speaks enough of the owfs binary protocol
+to be scanned and read from.
+
+	python test/scripts/owfs_job.py [port [delay [devices]]]
+
+Like a real owserver, it answers the requests on one connection
+strictly in order; every read takes ‹delay› seconds (default 0.01),
+to simulate the time spent on the bus.
+
+If ‹devices› is "test", the server offers the fixed set of devices
+which test/mod_onewire2.py expects instead. Reading the Nth of these
+takes N×‹delay› seconds, so that concurrent replies arrive in a
+known order. One of them is a multiplexer; writing anything to its
+"attach" attribute adds another device to its "aux" branch.
+
+Every device also has a "conn" attribute which returns the number of
+the connection it is read from, counting from 1 in the order in which
+they were accepted.
+"""
+
+import sys
+import struct
+
+import gevent
+from gevent.server import StreamServer
+
+OW_NOP = 1
+OW_READ = 2
+OW_WRITE = 3
+OW_DIR = 4
+OW_DIRALL = 7
+
+port = 54301
+delay = 0.01
+n_dev = 20
+
+devices = {}
+delays = {} # device => seconds per read, if not the default
+branches = {} # multiplexer => {"main":[device…], "aux":[device…]}
+spare = [] # devices which "attach" adds to a multiplexer
+n_conn = 0
+
+def _sensor(i):
+	return {
+		"type": "DS18S20",
+		"temperature": "%12.4f" % (20+i/10.,),
+		"temphigh": "30",
+		"templow": "10",
+	}
+
+def setup():
+	for i in range(n_dev):
+		devices["10.%012X" % (i+1,)] = _sensor(i)
+
+def setup_test():
+	for i in range(6):
+		if i == 3:
+			dev = "1F.%012X" % (i+1,)
+			devices[dev] = {"type": "DS2409"}
+			mux = dev
+		else:
+			dev = "10.%012X" % (i+1,)
+			devices[dev] = _sensor(i)
+		delays[dev] = (i+1)*delay
+	branches[mux] = {"main":["10.000000000005"], "aux":[]}
+	spare.append(("10.000000000006",devices.pop("10.000000000006")))
+
+def attach(mux):
+	dev,attrs = spare.pop(0)
+	devices[dev] = attrs
+	branches[mux]["aux"].append(dev)
+
+def lookup(path):
+	"""Split an owfs path into device and attribute."""
+	path = [p for p in path.split("/") if p and p != "uncached"]
+	while len(path) > 2 and path[0] in branches:
+		path = path[2:] # behind a multiplexer
+	dev = path[0] if path else None
+	attr = path[1] if len(path) > 1 else None
+	return dev,attr
+
+def reply(sock, ret, data=""):
+	sock.sendall(struct.pack("!6i", 0, len(data), ret, 0, len(data), 0) + data)
+
+def handle(sock, address):
+	global n_conn
+	n_conn += 1
+	conn = str(n_conn)
+	buf = ""
+	while True:
+		while len(buf) < 24:
+			d = sock.recv(4096)
+			if not d: return
+			buf += d
+		version, payload_len, typ, flags, size, offset = struct.unpack("!6i", buf[:24])
+		while len(buf) < 24+payload_len:
+			d = sock.recv(4096)
+			if not d: return
+			buf += d
+		payload = buf[24:24+payload_len]
+		buf = buf[24+payload_len:]
+
+		path,_,value = payload.partition("\0")
+		dev,attr = lookup(path)
+		if typ == OW_NOP:
+			reply(sock,0)
+		elif typ == OW_DIRALL or typ == OW_DIR:
+			if dev is None:
+				hidden = set()
+				for b in branches.itervalues():
+					for d in b.itervalues():
+						hidden.update(d)
+				entries = ["/"+d for d in sorted(devices) if d not in hidden]
+			elif dev in branches and attr in branches[dev]:
+				entries = ["/%s/%s/%s" % (dev,attr,d) for d in branches[dev][attr]]
+			elif dev == "alarm":
+				entries = []
+			elif dev in devices:
+				entries = ["/%s/%s" % (dev,a) for a in sorted(devices[dev])]
+			else:
+				reply(sock,-2)
+				continue
+			if typ == OW_DIRALL:
+				reply(sock,0,",".join(entries))
+			else:
+				for e in entries:
+					reply(sock,0,e)
+				reply(sock,0)
+		elif typ == OW_READ:
+			try:
+				val = conn if attr == "conn" and dev in devices else devices[dev][attr]
+			except KeyError:
+				reply(sock,-2) # ENOENT, without touching the bus
+			else:
+				gevent.sleep(delays.get(dev,delay))
+				reply(sock,len(val),val)
+		elif typ == OW_WRITE and dev == "simultaneous":
+			gevent.sleep(delay)
+			reply(sock,0)
+		elif typ == OW_WRITE and dev in branches and attr == "attach":
+			attach(dev)
+			reply(sock,0)
+		elif typ == OW_WRITE:
+			gevent.sleep(delay)
+			try:
+				devices[dev][attr] = value
+			except KeyError:
+				reply(sock,-2)
+			else:
+				reply(sock,0)
+		else:
+			reply(sock,-42)
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1:
+		port = int(sys.argv[1])
+	if len(sys.argv) > 2:
+		delay = float(sys.argv[2])
+	if len(sys.argv) > 3 and sys.argv[3] == "test":
+		setup_test()
+	else:
+		if len(sys.argv) > 3:
+			n_dev = int(sys.argv[3])
+		setup()
+
+	s = StreamServer(('localhost', port), handle)
+	s.serve_forever()
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##
+##  Copyright © 2007-2012, Matthias Urlichs <matthias@urlichs.de>
+##
+##  This program is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  This program is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License (included; see the file LICENSE)
+##  for more details.
+##
+
+"""\
+A fake rrdcached which speaks enough of the line protocol to accept
+updates, singly or in a BATCH.
+
+	python test/scripts/rrdcached_job.py [port [delay]]
+
+Updates to files whose name contains "missing" fail. Every reply is
+delayed by ‹delay› seconds (default 0.002), to simulate a round trip.
+
+test/mod_rrdc2.py runs against this server; scripts/rrdc2_init
+starts it.
+"""
+
+import sys
+
+import gevent
+from gevent.server import StreamServer
+
+port = 52443
+delay = 0.002
+
+def update(line):
+	"""Returns None if OK, else an error message."""
+	words = line.split(" ")
+	if len(words) < 3:
+		return "Usage: update <filename> <values> [<values> ...]"
+	if "missing" in words[1]:
+		return "No such file: "+words[1]
+	return None
+
+def reply(f, *lines):
+	gevent.sleep(delay)
+	for l in lines:
+		f.write(l+"\n")
+	f.flush()
+
+def handle(sock, address):
+	f = sock.makefile()
+	while True:
+		line = f.readline()
+		if not line:
+			return
+		line = line.rstrip("\n")
+		cmd = line.split(" ",1)[0].lower()
+		if cmd == "update":
+			err = update(line)
+			if err is None:
+				reply(f,"0 errors, enqueued 1 value(s).")
+			else:
+				reply(f,"-1 "+err)
+		elif cmd == "batch":
+			reply(f,"0 Go ahead.  End with dot '.' on its own line.")
+			errs = []
+			n = 0
+			while True:
+				line = f.readline()
+				if not line:
+					return
+				line = line.rstrip("\n")
+				if line == ".":
+					break
+				n += 1
+				if line.split(" ",1)[0].lower() != "update":
+					errs.append("%d Unknown command" % (n,))
+					continue
+				err = update(line)
+				if err is not None:
+					errs.append("%d %s" % (n,err))
+			reply(f,"%d errors" % (len(errs),), *errs)
+		elif cmd == "quit":
+			return
+		else:
+			reply(f,"-1 Unknown command: "+cmd)
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1:
+		port = int(sys.argv[1])
+	if len(sys.argv) > 2:
+		delay = float(sys.argv[2])
+
+	s = StreamServer(('localhost', port), handle)
+	s.serve_forever()